@@ -0,0 +1,156 @@
+import tensorflow as tf
+
+
+"""ConfusionMatrixMetrics
+
+Description:
+Module for stateful classification metrics computed from a confusion matrix accumulated over a whole epoch. Precision,
+recall, and the Matthews correlation coefficient computed per batch and averaged by Keras are not the epoch values, and
+for mcor the average of per batch values is not even an estimate of it. Here the true negative, false positive, false
+negative, and true positive counts of the positive class are accumulated in a single variable, updated with one op per
+step, and the metrics are computed from the counts when they are reported. Metrics created with a source share the
+counts of the source metric instead of updating their own.
+
+This module imports TensorFlow, so it is only imported once models are compiled.
+"""
+
+
+class ConfusionMatrixMetric(tf.keras.metrics.Metric):
+    """Base class of metrics computed from the accumulated confusion matrix of the positive class. Counts are stored
+    in the order true negatives, false positives, false negatives, true positives.
+    """
+
+    def __init__(self, name, source=None, threshold=0.5, **kwargs):
+
+        """Constructor method.
+
+        :param name: Name of the metric, as reported in training logs
+        :type name: str
+        :param source: Metric whose counts are shared, None to accumulate counts in this metric
+        :type source: ConfusionMatrixMetric
+        :param threshold: Predictions above the threshold are positive
+        :type threshold: float
+        """
+
+        super().__init__(name=name, **kwargs)
+
+        self.source = source
+        self.threshold = threshold
+
+        if source is None:
+            self.counts = self.add_weight(name='counts', shape=(4,), initializer='zeros', dtype='float32')
+
+    def get_counts(self):
+
+        """Gets the accumulated counts, of the source metric if there is one.
+
+        :return: True negative, false positive, false negative, and true positive counts
+        :rtype: tuple(tf.Tensor)
+        """
+
+        counts = self.counts if self.source is None else self.source.counts
+        return tf.unstack(tf.convert_to_tensor(counts))
+
+    def update_state(self, y_true, y_pred, sample_weight=None):
+
+        """Adds the confusion matrix of a batch to the counts. Metrics with a source leave the update to it.
+
+        :param y_true: The actual classification labels, categorical or of the positive class
+        :type y_true: tf.Tensor
+        :param y_pred: The predicted probabilities, categorical or of the positive class
+        :type y_pred: tf.Tensor
+        :param sample_weight: Weight of each example
+        :type sample_weight: tf.Tensor
+        """
+
+        if self.source is not None:
+            return
+
+        # Like NLPSentimentCalculations.check_units, categorical labels are reduced to the positive class
+        if y_pred.shape[-1] != 1:
+            y_true = y_true[:, 1]
+            y_pred = y_pred[:, 1]
+
+        actual = tf.cast(tf.reshape(y_true, [-1]) > 0.5, 'int32')
+        predicted = tf.cast(tf.reshape(y_pred, [-1]) > self.threshold, 'int32')
+
+        # Index of each example in the counts, so the whole matrix is a single weighted bincount
+        cells = tf.one_hot(actual * 2 + predicted, 4, dtype='float32')
+        if sample_weight is not None:
+            cells *= tf.reshape(tf.cast(sample_weight, 'float32'), [-1, 1])
+
+        self.counts.assign_add(tf.reduce_sum(cells, axis=0))
+
+    def reset_state(self):
+
+        if self.source is None:
+            self.counts.assign(tf.zeros_like(self.counts))
+
+    def reset_states(self):
+
+        # Name of reset_state before TensorFlow 2.5
+        self.reset_state()
+
+    def get_config(self):
+
+        return {**super().get_config(), 'threshold': self.threshold}
+
+
+class ConfusionMatrixPrecision(ConfusionMatrixMetric):
+    """Precision of the positive class over the epoch.
+    """
+
+    def __init__(self, name='precision', **kwargs):
+
+        super().__init__(name=name, **kwargs)
+
+    def result(self):
+
+        tn, fp, fn, tp = self.get_counts()
+        return tf.math.divide_no_nan(tp, tp + fp)
+
+
+class ConfusionMatrixRecall(ConfusionMatrixMetric):
+    """Recall of the positive class over the epoch.
+    """
+
+    def __init__(self, name='recall', **kwargs):
+
+        super().__init__(name=name, **kwargs)
+
+    def result(self):
+
+        tn, fp, fn, tp = self.get_counts()
+        return tf.math.divide_no_nan(tp, tp + fn)
+
+
+class MatthewsCorrelation(ConfusionMatrixMetric):
+    """Matthews correlation coefficient over the epoch, between -1 for total disagreement and 1 for perfect
+    prediction. 0 when any row or column of the confusion matrix is empty.
+    """
+
+    def __init__(self, name='mcor', **kwargs):
+
+        super().__init__(name=name, **kwargs)
+
+    def result(self):
+
+        tn, fp, fn, tp = self.get_counts()
+        return tf.math.divide_no_nan(tp * tn - fp * fn, tf.sqrt((tp + fp) * (tp + fn) * (tn + fp) * (tn + fn)))
+
+
+def create_confusion_matrix_metrics(threshold=0.5):
+
+    """Creates precision, recall, and mcor metrics sharing one set of counts, updated by the precision metric.
+
+    :param threshold: Predictions above the threshold are positive
+    :type threshold: float
+
+    :return: List of the precision, recall, and mcor metrics
+    :rtype: list(ConfusionMatrixMetric)
+    """
+
+    precision = ConfusionMatrixPrecision(threshold=threshold)
+
+    return [precision, ConfusionMatrixRecall(source=precision, threshold=threshold),
+            MatthewsCorrelation(source=precision, threshold=threshold)]
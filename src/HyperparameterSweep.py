@@ -0,0 +1,247 @@
+import os
+import math
+import time
+import random
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import ModelBase
+import TwitterSpamModel
+import TwitterSentimentModel
+from TwitterModelInterface import TwitterSpamModelInterface, TwitterSentimentModelInterface
+from utilities import Utils, LazyModule
+
+
+tf = LazyModule('tensorflow')
+
+
+"""HyperparameterSweep
+
+Description:
+Module for training many ModelParameters configurations on the same data. The data is sanitized, tokenized, and
+embedded once into memory-mapped arrays that every configuration reuses, configurations are trained concurrently in a
+process pool with a per-process thread budget, and the scores and wall time of every configuration are written to a
+leaderboard csv.
+"""
+
+
+def get_grid_configurations(grid):
+
+    """Expands a grid of ModelParameters values into every combination.
+
+    :param grid: Dictionary of ModelParameters field to list of values to try
+    :type grid: dict(str-> list)
+
+    :return: List of configurations, each a dictionary of ModelParameters field to value
+    :rtype: list(dict(str-> obj))
+    """
+
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def get_random_configurations(space, count, seed=None):
+
+    """Samples random configurations from a search space. A list of values is sampled uniformly. A (low, high) tuple
+    is sampled uniformly between the bounds for ints, and log-uniformly for floats such as learning rates, so float
+    bounds must be positive.
+
+    :param space: Dictionary of ModelParameters field to list of values or (low, high) tuple
+    :type space: dict(str-> obj)
+    :param count: Number of configurations to sample
+    :type count: int
+    :param seed: Random seed, for repeatable sweeps
+    :type seed: int
+
+    :return: List of configurations, each a dictionary of ModelParameters field to value
+    :rtype: list(dict(str-> obj))
+    """
+
+    rng = random.Random(seed)
+
+    def sample(values):
+
+        if not isinstance(values, tuple):
+            return rng.choice(values)
+
+        low, high = values
+        if isinstance(low, int) and isinstance(high, int):
+            return rng.randint(low, high)
+
+        return math.exp(rng.uniform(math.log(low), math.log(high)))
+
+    return [{key: sample(values) for key, values in space.items()} for _ in range(count)]
+
+
+def get_model_classes(model_type):
+
+    """Gets the settings processing function and the data and learning classes of a model type.
+
+    :param model_type: Either spam or sentiment
+    :type model_type: str
+
+    :return: Tuple of the settings processing function, ModelData class, and ModelLearning class
+    :rtype: tuple(func, type, type)
+    """
+
+    if model_type == 'spam':
+        return TwitterSpamModelInterface.process_spam_model_args, TwitterSpamModel.SpamModelData, \
+            TwitterSpamModel.SpamModelLearning
+
+    if model_type == 'sentiment':
+        return TwitterSentimentModelInterface.process_sentiment_model_args, \
+            TwitterSentimentModel.SentimentModelData, TwitterSentimentModel.SentimentModelLearning
+
+    raise ValueError(f'Unknown model type {model_type}, expected spam or sentiment')
+
+
+def get_model_parameters(model_type, settings, overrides=None):
+
+    """Creates ModelParameters for a model type the same way TwitterModelInterface does when creating a model to train.
+
+    :param model_type: Either spam or sentiment
+    :type model_type: str
+    :param settings: Keyword arguments of TwitterModelInterface.get_settings_dict
+    :type settings: dict(str-> obj)
+    :param overrides: ModelParameters values that take precedence over settings, including the json settings file
+    :type overrides: dict(str-> obj)
+
+    :return: Model parameters
+    :rtype: ModelBase.ModelParameters
+    """
+
+    process_args, _, _ = get_model_classes(model_type)
+    parameters = ModelBase.ModelParameters(**{**process_args(**settings), **(overrides or {})})
+
+    if model_type == 'sentiment':
+        parameters.features_to_train = ['full_text']
+
+    return parameters
+
+
+def init_sweep_worker(threads):
+
+    """Initializes a sweep process, limiting the threads TensorFlow and OpenMP may use so concurrent trainings do not
+    oversubscribe the cores.
+
+    :param threads: Number of threads this process may use
+    :type threads: int
+    """
+
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(threads, 2))
+
+
+def train_configuration(model_type, settings, array_dir, model_dir, index, configuration):
+
+    """Trains and evaluates one configuration in a sweep process. Errors are recorded instead of raised so one bad
+    configuration does not stop the sweep. Each configuration checkpoints its model to its own h5 file in model_dir, so
+    concurrent trainings do not write the same file.
+
+    :param model_type: Either spam or sentiment
+    :type model_type: str
+    :param settings: Keyword arguments of TwitterModelInterface.get_settings_dict shared by every configuration
+    :type settings: dict(str-> obj)
+    :param array_dir: Directory of the preprocessed arrays
+    :type array_dir: str
+    :param model_dir: Directory to save the model of each configuration in
+    :type model_dir: str
+    :param index: Index of the configuration in the sweep, names its model file
+    :type index: int
+    :param configuration: ModelParameters values of this configuration
+    :type configuration: dict(str-> obj)
+
+    :return: Dictionary of the configuration, its model file, test scores, epochs run, and wall time in seconds
+    :rtype: dict(str-> obj)
+    """
+
+    _, data_class, learning_class = get_model_classes(model_type)
+    result = dict(configuration, model_h5=os.path.join(model_dir, f'trial_{index}.h5'))
+
+    start = time.perf_counter()
+    try:
+        parameters = get_model_parameters(model_type, settings,
+                                          dict(configuration, preload_train_data_arrays=array_dir,
+                                               preload_train_data_dill='', save_train_data_dill='',
+                                               model_h5=result['model_h5']))
+
+        ModelBase.ModelLearning.init_distribution_devices(parameters)
+        learning = learning_class(parameters, data_class(parameters))
+        learning.build_model()
+
+        result.update(zip(['loss'] + ModelBase.MetricsKeys, learning.score))
+        result.update(learning.training_report)
+
+    except Exception as e:
+        result['Error'] = repr(e)
+
+    result['Wall Time'] = time.perf_counter() - start
+
+    return result
+
+
+def run_sweep(configurations, model_type='spam', workers=2, threads_per_worker=0,
+              array_dir='../data/Learning Data/sweep_arrays', model_dir='../data/Learning Data/sweep_models',
+              leaderboard_csv='../data/analysis/sweep_leaderboard.csv', **kwargs):
+
+    """Trains every configuration on the same data and writes a leaderboard. The data is loaded and preprocessed once
+    from the settings in kwargs and saved to memory-mapped arrays in array_dir, which every configuration then loads
+    instead of sanitizing and tokenizing again. Configurations are trained concurrently in worker processes, each
+    limited to threads_per_worker threads.
+
+    :param configurations: Configurations from get_grid_configurations or get_random_configurations
+    :type configurations: list(dict(str-> obj))
+    :param model_type: Either spam or sentiment
+    :type model_type: str
+    :param workers: Number of configurations to train at the same time
+    :type workers: int
+    :param threads_per_worker: Threads per training process, 0 divides the cores evenly between workers
+    :type threads_per_worker: int
+    :param array_dir: Directory to save the preprocessed arrays in
+    :type array_dir: str
+    :param model_dir: Directory to save the model of each configuration in, as trial_<index>.h5
+    :type model_dir: str
+    :param leaderboard_csv: Path to write the leaderboard to
+    :type leaderboard_csv: str
+    :param kwargs: Keyword arguments of TwitterModelInterface.get_settings_dict shared by every configuration
+    :type kwargs: str: any
+
+    :return: Leaderboard of every configuration sorted by mcor
+    :rtype: pd.DataFrame
+    """
+
+    settings = dict(kwargs, evaluate_model=True, load_to_predict=False)
+
+    # Preprocess once, every configuration memory-maps the same arrays
+    _, data_class, _ = get_model_classes(model_type)
+    data_class(get_model_parameters(model_type, settings)).save_data_to_arrays(array_dir)
+
+    if not os.path.exists(model_dir):
+        os.makedirs(model_dir)
+
+    threads = threads_per_worker or max((os.cpu_count() or 1) // workers, 1)
+
+    # Spawn so workers do not inherit the TensorFlow runtime started by preprocessing
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_sweep_worker, initargs=(threads,)) as executor:
+        results = list(executor.map(train_configuration, itertools.repeat(model_type), itertools.repeat(settings),
+                                    itertools.repeat(array_dir), itertools.repeat(model_dir),
+                                    range(len(configurations)), configurations))
+
+    leaderboard = pd.DataFrame(results)
+    if 'mcor' in leaderboard.columns:
+        leaderboard = leaderboard.sort_values('mcor', ascending=False)
+
+    Utils.write_dataframe_to_csv(leaderboard, leaderboard_csv, write_index=False)
+    print(leaderboard.to_string(index=False))
+
+    return leaderboard
+
+
+if __name__ == '__main__':
+
+    run_sweep(get_grid_configurations({'learning_rate': [1e-3, 1e-4], 'batch_size': [64, 128],
+                                       'dropout_rate': [0.3, 0.5]}),
+              model_type='spam', workers=2, epochs=20, use_transformers=False)
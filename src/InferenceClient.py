@@ -0,0 +1,138 @@
+import json
+import urllib.request
+import urllib.error
+import pandas as pd
+
+
+"""InferenceClient
+
+Description:
+Module for scoring tweets with the models of a running InferenceServer instead of loading them in process. Only the
+standard library and pandas are imported, so scripts using it start without TensorFlow. RemoteModel can be used in
+place of a loaded model anywhere only its predict methods are called, such as in ModelHandler.
+"""
+
+
+class InferenceClient:
+    """Client of an InferenceServer.
+    """
+
+    def __init__(self, url='http://127.0.0.1:8765', timeout=120):
+
+        """Constructor method.
+
+        :param url: Base url of the inference server
+        :type url: str
+        :param timeout: Seconds to wait for a response
+        :type timeout: float
+        """
+
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, path, body=None):
+
+        """Sends a request to the server, a POST of json if there is a body and a GET otherwise.
+
+        :param path: Path of the endpoint
+        :type path: str
+        :param body: Json serializable request body
+        :type body: obj
+
+        :return: Json response body
+        :rtype: obj
+        """
+
+        data = None if body is None else json.dumps(body, default=str).encode('utf-8')
+        request = urllib.request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f'Inference server error {e.code}: {e.read().decode("utf-8", "replace")}') from e
+
+    def health(self) -> dict:
+
+        """Gets the status, served models, and uptime of the server.
+
+        :return: Dictionary of health information
+        :rtype: dict(str-> obj)
+        """
+
+        return self.request('/health')
+
+    def metrics(self) -> dict:
+
+        """Gets the request, batch, latency, and queue depth metrics of each served model.
+
+        :return: Dictionary of model name to metrics
+        :rtype: dict(str-> dict(str-> obj))
+        """
+
+        return self.request('/metrics')
+
+    def predict_tweets(self, model, tweet_df: pd.DataFrame, labels=False) -> dict:
+
+        """Predicts on a dataframe of tweets with a served model.
+
+        :param model: Name of the served model, such as spam or sentiment
+        :type model: str
+        :param tweet_df: Dataframe of tweets
+        :type tweet_df: pd.DataFrame
+        :param labels: Whether to also get labels and confidences like ModelLearning.predict
+        :type labels: bool
+
+        :return: Dictionary of raw predictions, and labels and confidences if requested
+        :rtype: dict(str-> list)
+        """
+
+        # NaN is not valid json, so missing values are sent as null
+        records = tweet_df.astype(object).where(tweet_df.notna(), None).to_dict(orient='records')
+
+        return self.request(f'/predict/{model}', {'tweets': records, 'labels': labels})
+
+
+class RemoteModel:
+    """Stand-in for a loaded ModelLearning that predicts with a model of an InferenceServer.
+    """
+
+    def __init__(self, client: InferenceClient, model: str):
+
+        """Constructor method.
+
+        :param client: Client of the server
+        :type client: InferenceClient
+        :param model: Name of the served model, such as spam or sentiment
+        :type model: str
+        """
+
+        self.client = client
+        self.model = model
+
+    def raw_predict_tweets(self, tweet_df: pd.DataFrame):
+
+        """See ModelLearning.raw_predict_tweets.
+        """
+
+        return self.client.predict_tweets(self.model, tweet_df)['raw']
+
+    def raw_predict_csv(self, csv: str):
+
+        """See ModelLearning.raw_predict_csv.
+        """
+
+        return self.raw_predict_tweets(pd.read_csv(csv))
+
+    def predict(self, csv: str = '', tweet_df: pd.DataFrame = None):
+
+        """See ModelLearning.predict.
+        """
+
+        if csv:
+            tweet_df = pd.read_csv(csv)
+        elif tweet_df is None or tweet_df.empty:
+            return []
+
+        response = self.client.predict_tweets(self.model, tweet_df, labels=True)
+        return response['labels'], response['confidences']
@@ -0,0 +1,317 @@
+import sys
+import time
+import json
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+from ModelBase import ModelLearning
+
+
+"""InferenceServer
+
+Description:
+Module for a long-lived inference service, so scoring scripts do not pay for importing TensorFlow and loading dill
+parameters and h5 weights every run. Models are loaded once and served over HTTP. Concurrent requests to a model are
+grouped by a micro-batching queue into a single raw_predict_tweets call of up to a maximum number of tweets, waiting at
+most a maximum time for a batch to fill. Health, latency, and queue depth metrics are served as well. See
+InferenceClient for the client.
+
+Endpoints:
+POST /predict/<model> with {"tweets": [tweet records], "labels": bool} returns {"raw": [[probabilities]]} and, if
+labels are requested, {"labels": [...], "confidences": [...]} like ModelLearning.predict
+GET /health returns the status, served models, and uptime
+GET /metrics returns request, batch, latency, and queue depth metrics of each model
+"""
+
+
+class MicroBatcher:
+    """Groups the tweets of concurrent requests to a model into batches, predicted on by a single worker thread.
+    """
+
+    def __init__(self, model, max_batch_size=256, max_wait_ms=10, latency_window=1000):
+
+        """Constructor method, starts the worker thread.
+
+        :param model: Model to predict with, anything with a raw_predict_tweets method
+        :type model: ModelLearning
+        :param max_batch_size: Maximum number of tweets per batch. Larger requests are predicted on alone.
+        :type max_batch_size: int
+        :param max_wait_ms: Maximum time to wait for more requests after the first request of a batch
+        :type max_wait_ms: float
+        :param latency_window: Number of recent requests to compute latency percentiles over
+        :type latency_window: int
+        """
+
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.queued_tweets = 0
+
+        self.latencies = deque(maxlen=latency_window)
+        self.request_count = 0
+        self.tweet_count = 0
+        self.batch_count = 0
+        self.error_count = 0
+        self.predict_time = 0.0
+
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, tweet_df: pd.DataFrame) -> Future:
+
+        """Queues tweets to be predicted on in the next batch.
+
+        :param tweet_df: Dataframe of tweets
+        :type tweet_df: pd.DataFrame
+
+        :return: Future of the raw predictions of the tweets
+        :rtype: Future
+        """
+
+        future = Future()
+        with self.lock:
+            self.queued_tweets += len(tweet_df)
+        self.requests.put((tweet_df, future, time.perf_counter()))
+
+        return future
+
+    def run(self):
+
+        """Collects requests into batches and predicts on them, forever.
+        """
+
+        while True:
+
+            batch = [self.requests.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+
+            while size < self.max_batch_size:
+
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+                size += len(batch[-1][0])
+
+            with self.lock:
+                self.queued_tweets -= size
+
+            self.predict_batch(batch)
+
+    def predict_batch(self, batch):
+
+        """Predicts on a batch of requests with a single raw_predict_tweets call and resolves their futures. If the
+        call fails, each request is predicted on alone, so only the requests that fail by themselves get the error.
+
+        :param batch: List of tuples of the tweets, future, and submit time of each request
+        :type batch: list(tuple(pd.DataFrame, Future, float))
+        """
+
+        start = time.perf_counter()
+        try:
+            raw = np.asarray(self.model.raw_predict_tweets(pd.concat([tweet_df for tweet_df, _, _ in batch],
+                                                                     ignore_index=True)))
+        except Exception as e:
+            if len(batch) > 1:
+                for request in batch:
+                    self.predict_batch([request])
+                return
+
+            self.error_count += 1
+            batch[0][1].set_exception(e)
+            return
+
+        end = time.perf_counter()
+
+        offset = 0
+        for tweet_df, future, submitted in batch:
+            future.set_result(raw[offset:offset + len(tweet_df)])
+            offset += len(tweet_df)
+            self.latencies.append(end - submitted)
+
+        self.request_count += len(batch)
+        self.tweet_count += offset
+        self.batch_count += 1
+        self.predict_time += end - start
+
+    def get_metrics(self) -> dict:
+
+        """Gets the metrics of this model.
+
+        :return: Dictionary of request, batch, latency, and queue depth metrics
+        :rtype: dict(str-> obj)
+        """
+
+        latencies = np.asarray(self.latencies) * 1000 if self.latencies else np.zeros(1)
+
+        return {'requests': self.request_count,
+                'tweets': self.tweet_count,
+                'batches': self.batch_count,
+                'errors': self.error_count,
+                'mean_batch_tweets': self.tweet_count / max(self.batch_count, 1),
+                'predict_tweets_per_sec': self.tweet_count / max(self.predict_time, 1e-9),
+                'latency_ms_p50': float(np.percentile(latencies, 50)),
+                'latency_ms_p90': float(np.percentile(latencies, 90)),
+                'latency_ms_p99': float(np.percentile(latencies, 99)),
+                'queue_requests': self.requests.qsize(),
+                'queue_tweets': self.queued_tweets}
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """Handles the HTTP requests of an InferenceServer.
+    """
+
+    def do_GET(self):
+
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok', 'models': list(self.server.batchers.keys()),
+                                 'uptime_sec': time.time() - self.server.start_time})
+        elif self.path == '/metrics':
+            self.send_json(200, {name: batcher.get_metrics() for name, batcher in self.server.batchers.items()})
+        else:
+            self.send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+
+        name = self.path[len('/predict/'):] if self.path.startswith('/predict/') else None
+        if name not in self.server.batchers:
+            self.send_json(404, {'error': f'Unknown model {name}, serving {list(self.server.batchers.keys())}'})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            tweet_df = pd.DataFrame(request['tweets'])
+        except (ValueError, KeyError) as e:
+            self.send_json(400, {'error': f'Bad request: {e!r}'})
+            return
+
+        if tweet_df.empty:
+            self.send_json(200, {'raw': [], 'labels': [], 'confidences': []})
+            return
+
+        try:
+            raw = self.server.batchers[name].submit(tweet_df).result(timeout=self.server.request_timeout).tolist()
+        except Exception as e:
+            self.send_json(500, {'error': repr(e)})
+            return
+
+        response = {'raw': raw}
+        if request.get('labels'):
+            response['labels'], response['confidences'] = ModelLearning.get_labels_from_raw(raw)
+
+        self.send_json(200, response)
+
+    def send_json(self, status, body):
+
+        """Sends a json response.
+
+        :param status: HTTP status code
+        :type status: int
+        :param body: Json serializable response body
+        :type body: obj
+        """
+
+        data = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Metrics replace per request logging
+
+
+class InferenceServer(ThreadingHTTPServer):
+    """HTTP server that serves loaded models through one MicroBatcher per model.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, models, host='127.0.0.1', port=8765, max_batch_size=256, max_wait_ms=10,
+                 request_timeout=60):
+
+        """Constructor method.
+
+        :param models: Dictionary of model name to loaded model, such as spam and sentiment
+        :type models: dict(str-> ModelLearning)
+        :param host: Host to listen on, local only by default
+        :type host: str
+        :param port: Port to listen on
+        :type port: int
+        :param max_batch_size: Maximum number of tweets per model.predict batch
+        :type max_batch_size: int
+        :param max_wait_ms: Maximum time a request waits for a batch to fill
+        :type max_wait_ms: float
+        :param request_timeout: Seconds a request may wait for its predictions
+        :type request_timeout: float
+        """
+
+        super().__init__((host, port), InferenceRequestHandler)
+
+        self.batchers = {name: MicroBatcher(model, max_batch_size, max_wait_ms) for name, model in models.items()}
+        self.request_timeout = request_timeout
+        self.start_time = time.time()
+
+
+def load_models(spam_dill='', sentiment_dill='', student_dill=''):
+
+    """Loads the models to serve from their saved dill and h5 files.
+
+    :param spam_dill: Path to the dill file of a saved spam model, empty to not serve one
+    :type spam_dill: str
+    :param sentiment_dill: Path to the dill file of a saved sentiment model, empty to not serve one
+    :type sentiment_dill: str
+    :param student_dill: Path to the dill file of a distilled sentiment student, served in place of the sentiment
+    model if there is no sentiment_dill, otherwise attached to it
+    :type student_dill: str
+
+    :return: Dictionary of model name to loaded model
+    :rtype: dict(str-> ModelLearning)
+    """
+
+    from TwitterModelInterface import TwitterSpamModelInterface, TwitterSentimentModelInterface
+
+    models = {}
+    if spam_dill:
+        models['spam'] = TwitterSpamModelInterface.load_spam_model_to_predict(spam_dill)
+
+    if sentiment_dill:
+        models['sentiment'] = TwitterSentimentModelInterface.load_sentiment_model_to_predict(sentiment_dill)
+
+    if student_dill:
+        student = TwitterSentimentModelInterface.load_student_model(student_dill, teacher=models.get('sentiment'))
+        models.setdefault('sentiment', student)
+
+    return models
+
+
+def main(spam_dill='../data/Learning Data/spam.dill', sentiment_dill='', student_dill='', port=8765):
+
+    server = InferenceServer(load_models(spam_dill, sentiment_dill, student_dill), port=port)
+    print(f'Serving {list(server.batchers.keys())} on port {port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+
+    # Usage: python InferenceServer.py [spam_dill] [sentiment_dill] [student_dill] [port]
+    main(*sys.argv[1:4], *[int(arg) for arg in sys.argv[4:5]])
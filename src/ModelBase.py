@@ -1,19 +1,55 @@
 import os
+import json
+import time
+import shutil
+import hashlib
+import contextlib
 from abc import ABC, abstractmethod
 from typing import List, Tuple
 import pickle
+import numpy as np
 import pandas as pd
-import tensorflow as tf
-import tensorflow_addons as tfa
-from NLPSentimentCalculations import NLPSentimentCalculations as nSC
+from NLPSentimentCalculations import NLPSentimentCalculations as nSC, TextSanitizer
+from SanitizedTextCache import SanitizedTextCache
+from StreamingTweetData import StreamingTweetData
 from dataclasses import dataclass
-from utilities import Utils
+from utilities import Utils, LazyModule
 
 
-Metrics = ['acc', nSC.precision, nSC.recall, nSC.mcor,
-           tfa.metrics.FBetaScore(num_classes=2, average='weighted', beta=1.0, name='fbeta')]
+tf = LazyModule('tensorflow')
+tfa = LazyModule('tensorflow_addons')
+
 MetricsKeys = ['acc', 'precision', 'recall', 'mcor', 'fbeta']
-MetricsDict = dict(zip(MetricsKeys, Metrics))
+
+
+def get_metrics() -> list:
+
+    """
+    Builds the list of metrics models are compiled with, in the order of MetricsKeys. Built on demand so importing this
+    module does not import tensorflow. Precision, recall, and mcor are computed from a confusion matrix accumulated
+    over the whole epoch, see ConfusionMatrixMetrics.
+
+    :return: List of metrics
+    :rtype: list
+    """
+
+    from ConfusionMatrixMetrics import create_confusion_matrix_metrics
+
+    return ['acc', *create_confusion_matrix_metrics(),
+            tfa.metrics.FBetaScore(num_classes=2, average='weighted', beta=1.0, name='fbeta')]
+
+
+def get_metrics_dict() -> dict:
+
+    """
+    Builds a dictionary of metric key to metric, see get_metrics. Recall and mcor read the counts that precision
+    updates, so they must be used together with it.
+
+    :return: Dictionary of MetricsKeys to metrics
+    :rtype: dict
+    """
+
+    return dict(zip(MetricsKeys, get_metrics()))
 
 """Idea of this module is to be the parent class for the Twitter models, containing all shared methods and attributes
 such as hyper parameters and model initialization.
@@ -29,11 +65,25 @@ class ModelParameters:
     early_stopping: bool = False
     checkpoint_model: bool = False
     early_stopping_patience: int = 0
+    early_stopping_monitor: str = 'mcor'
+    restore_best_weights: bool = False
+    validation_data: str = ''
+    validation_split: float = 0.1
+    training_checkpoint_dir: str = ''
+    training_checkpoint_interval: int = 1
+    profile_training_file: str = ''
+    profile_trace_dir: str = ''
+    profile_trace_steps: list = None
     batch_size: int = 128
     evaluate_model: bool = True
     debug: bool = False
     use_tpu: bool = False
+    distribution: str = ''
+    distribution_replicas: int = 0
+    scale_with_replicas: bool = False
     use_transformers: bool = True
+    dropout_rate: float = 0.5
+    use_cnn: bool = False
 
     # Data Related Parameters
     custom_tokenizer: object = None
@@ -42,9 +92,36 @@ class ModelParameters:
     test_size: float = 0.1
     preload_train_data_dill: str = ''
     save_train_data_dill: str = ''
+    preload_train_data_arrays: str = ''
+    preprocessed_cache_dir: str = ''
+    preprocessed_cache_max_mb: int = 4096
+    train_data_shards: list = None
+    aug_data_shards: list = None
+    stream_chunk_size: int = 10000
+    update_data_csv: str = ''
+    replay_data_csv: str = ''
+    replay_size: int = 2000
     features_to_train: list = None
     textless_features_to_train: list = None
     custom_text_input_length: int = 50
+    sanitize_workers: int = 0
+    parallel_sanitize_threshold: int = 10000
+    sanitize_cache_db: str = ''
+    sanitize_cache_max_entries: int = 2000000
+    sanitizer_version: str = ''
+    glove_store_dtype: str = 'float32'
+    embedding_cache_dir: str = ''
+    inference_bucket_boundaries: list = None
+    train_bucket_boundaries: list = None
+    use_tf_data: bool = False
+    shuffle_buffer_size: int = 10000
+    encoder_features: str = ''
+    encoder_feature_dir: str = '../data/Learning Data/encoder_features'
+    distill_label_dir: str = '../data/Learning Data/distill_labels'
+    distill_chunk_size: int = 10000
+    distill_student_cnn: bool = False
+    distill_student_h5: str = '../data/Learning Data/sentiment_student.h5'
+    predict_with_student: bool = False
 
     # Performance Related Parameters
     accuracy: float = 0.0
@@ -65,10 +142,30 @@ class ModelData(ABC):
     class should load itself from a pickle.
     """
 
+    # Column of the label to train on, set by each model type
+    label_column = ''
+
+    # Attributes saved by save_data_to_arrays, besides the meta features
+    array_names = ['train_text_input_ids', 'test_text_input_ids', 'train_embedding_mask', 'test_embedding_mask',
+                   'y_train', 'y_test']
+
     def __init__(self, parameters: ModelParameters):
         self.parameters = parameters
 
         self.nsc = nSC()
+        # Models saved before the sanitizer version was recorded were trained on per word POS tagging
+        sanitizer_version = self.parameters.sanitizer_version
+        if not sanitizer_version and self.parameters.custom_tokenizer is not None:
+            sanitizer_version = TextSanitizer.per_word_version
+
+        self.text_sanitizer = nSC.get_text_sanitizer(sanitizer_version)
+
+        self.sanitize_cache = None
+        if self.parameters.sanitize_cache_db:
+            self.sanitize_cache = SanitizedTextCache(self.parameters.sanitize_cache_db,
+                                                     version=self.text_sanitizer.version,
+                                                     max_entries=self.parameters.sanitize_cache_max_entries)
+
         if self.parameters.custom_tokenizer:
             self.nsc.tokenizer = self.parameters.custom_tokenizer
 
@@ -83,6 +180,11 @@ class ModelData(ABC):
         self.test_embedding_mask = None
         self.y_train = None
         self.y_test = None
+        self.label_classes = None
+
+        self.dedup_stats = {}
+        self.padding_stats = {}
+        self.streaming = None
 
     def get_x_val_from_csv(self, csv: str):
         """
@@ -98,10 +200,152 @@ class ModelData(ABC):
         df = Utils.parse_json_tweet_data_from_csv(csv, self.parameters.features_to_train)
         return self.get_x_val_from_dataframe(df)
 
-    @abstractmethod
     def get_x_val_from_dataframe(self, x_val: pd.DataFrame):
+        """
+        Create an x_validation dataset from a dataframe, in a format ready to pass into model.predict
+
+        :param x_val: Dataframe of tweets with self.features_to_train columns present
+        :type x_val: pd.DataFrame
+
+        :return: Data ready to be passed into the model for prediction
+        :rtype: [x_val_text_embeddings, x_val_meta] or [x_val_text_embeddings]
+        """
+
+        val_text_input, val_embedding_mask = self.get_vectorized_text_tokens_from_val_dataframe(x_val)
+        return self.assemble_x_val(x_val, val_text_input, val_embedding_mask)
+
+    def get_bucketed_x_val_from_dataframe(self, x_val: pd.DataFrame) -> List[Tuple[np.ndarray, list]]:
+        """
+        Creates x_validation datasets from a dataframe, grouped into buckets of similar token length for transformer
+        models. Texts are sanitized once and tokenized without padding, sorted by token length, and split at
+        parameters.inference_bucket_boundaries. Each bucket is only padded to its own longest text instead of
+        text_input_length. Token counts are recorded in self.padding_stats.
+
+        :param x_val: Dataframe of tweets with self.features_to_train columns present
+        :type x_val: pd.DataFrame
+
+        :return: List of the row positions in x_val and the data ready to be passed into model.predict of each bucket
+        :rtype: List[Tuple[np.array(int), list]]
+        """
+
+        x_val_text_clean = self.sanitize_texts(x_val['full_text'])
+        encodings = self.nsc.tokenizer(x_val_text_clean, truncation=True, max_length=self.text_input_length)
+
+        lengths = np.array([len(ids) for ids in encodings['input_ids']], dtype=int)
+        order = np.argsort(lengths, kind='stable')
+        bucket_ids = np.digitize(lengths[order], sorted(self.parameters.inference_bucket_boundaries), right=True)
+
+        buckets = []
+        padded_tokens = 0
+        for bucket_id in np.unique(bucket_ids):
+
+            rows = order[bucket_ids == bucket_id]
+            bucket_encodings = {key: [encodings[key][i] for i in rows] for key in ('input_ids', 'attention_mask')}
+            bucket_encodings = self.nsc.tokenizer.pad(bucket_encodings, padding='longest', return_tensors='tf')
+
+            padded_tokens += int(np.prod(bucket_encodings['input_ids'].shape))
+            buckets.append((rows, self.assemble_x_val(x_val.iloc[rows], bucket_encodings['input_ids'],
+                                                      bucket_encodings['attention_mask'])))
+
+        real_tokens = int(lengths.sum())
+        self.padding_stats = {'Rows': len(lengths), 'Buckets': len(buckets), 'Real Tokens': real_tokens,
+                              'Padded Tokens': padded_tokens,
+                              'Padding Efficiency': real_tokens / max(padded_tokens, 1),
+                              'Fixed Length Padding Efficiency': real_tokens / max(len(lengths) *
+                                                                                   self.text_input_length, 1)}
+
+        return buckets
+
+    def get_encoder_features(self, encoder, input_ids, attention_mask, split):
+        """
+        Gets the frozen encoder features of tokenized texts, running the encoder only if these exact token ids have
+        not been encoded with parameters.encoder_features before. Features are stored as memory-mapped arrays in
+        parameters.encoder_feature_dir.
+
+        :param encoder: Model created by NLPSentimentCalculations.create_roberta_feature_extractor
+        :type encoder: tf.keras.Model
+        :param input_ids: Right padded token ids
+        :type input_ids: np.array(np.array(int))
+        :param attention_mask: Attention mask of input_ids
+        :type attention_mask: np.array(np.array(int))
+        :param split: Name of the data split, such as train or test, used in the feature file name
+        :type split: str
+
+        :return: The memory-mapped features, one row per text
+        :rtype: np.memmap
+        """
+
+        input_ids = np.asarray(input_ids, dtype='int32')
+        attention_mask = np.asarray(attention_mask, dtype='int32')
+
+        fingerprint = hashlib.sha1(self.parameters.encoder_features.encode('utf-8'))
+        fingerprint.update(str(input_ids.shape).encode('utf-8'))
+        fingerprint.update(input_ids.tobytes())
+        fingerprint.update(attention_mask.tobytes())
+
+        feature_dir = self.parameters.encoder_feature_dir
+        feature_file = os.path.join(feature_dir,
+                                    f'{split}_{self.parameters.encoder_features}_{fingerprint.hexdigest()[:16]}.npy')
+
+        if os.path.exists(feature_file):
+            return np.load(feature_file, mmap_mode='r')
+
+        if not os.path.exists(feature_dir):
+            os.makedirs(feature_dir)
+
+        return self.nsc.extract_encoder_features(encoder, input_ids, attention_mask, feature_file,
+                                                 batch_size=self.parameters.batch_size)
+
+    @abstractmethod
+    def assemble_x_val(self, x_val: pd.DataFrame, val_text_input, val_embedding_mask):
         pass
 
+    def sanitize_texts(self, texts) -> List[str]:
+
+        """
+        Sanitizes texts in order. Identical texts are collapsed so each one is only processed once, with counts
+        recorded in self.dedup_stats. Unique texts are first looked up in bulk in the persistent sanitized text cache,
+        and only the misses are sanitized and added to the cache. Collections of at least
+        parameters.parallel_sanitize_threshold misses are spread over parameters.sanitize_workers processes (0 uses
+        up to TextSanitizer.default_max_workers cores).
+
+        :param texts: Texts to sanitize.
+        :type texts: list(str)
+
+        :return: List of sanitized texts
+        :rtype: List[str]
+        """
+
+        # Retweets and copy-pasted texts are sanitized once, then scattered back to every row
+        all_texts = list(texts)
+        texts, inverse = Utils.collapse_duplicates(all_texts)
+        self.dedup_stats = {'Rows': len(all_texts), 'Unique Rows': len(texts),
+                            'Deduplicated Rows': len(all_texts) - len(texts)}
+
+        if self.sanitize_cache is None:
+            clean_texts = self.text_sanitizer.sanitize_many(
+                texts, workers=self.parameters.sanitize_workers,
+                min_parallel_size=self.parameters.parallel_sanitize_threshold)
+
+            return [clean_texts[i] for i in inverse]
+
+        clean_texts = self.sanitize_cache.get_many(texts)
+
+        miss_indices = [i for i, clean in enumerate(clean_texts) if clean is None]
+        miss_texts = [texts[i] for i in miss_indices]
+
+        if miss_texts:
+
+            miss_clean = self.text_sanitizer.sanitize_many(
+                miss_texts, workers=self.parameters.sanitize_workers,
+                min_parallel_size=self.parameters.parallel_sanitize_threshold)
+            self.sanitize_cache.put_many(miss_texts, miss_clean)
+
+            for i, clean in zip(miss_indices, miss_clean):
+                clean_texts[i] = clean
+
+        return [clean_texts[i] for i in inverse]
+
     def get_vectorized_text_tokens_from_val_dataframe(self, x_val: pd.DataFrame) -> Tuple[List[str], List[str]]:
 
         """
@@ -120,7 +364,7 @@ class ModelData(ABC):
             x_val_text_data = pd.DataFrame()
 
         # Sanitizes textual data
-        x_val_text_clean = [nSC.sanitize_text_string(s) for s in list(x_val_text_data)]
+        x_val_text_clean = self.sanitize_texts(x_val_text_data)
 
         # Vectorizes textual data
         if self.parameters.use_transformers:
@@ -155,8 +399,8 @@ class ModelData(ABC):
         """
 
         # Clean the textual data
-        x_train_text_clean = [nSC.sanitize_text_string(s) for s in list(x_train_text_data)]
-        x_test_text_clean = [nSC.sanitize_text_string(s) for s in list(x_test_text_data)]
+        x_train_text_clean = self.sanitize_texts(x_train_text_data)
+        x_test_text_clean = self.sanitize_texts(x_test_text_data)
 
         # Initialize tokenizer on training data
         if self.parameters.use_transformers:
@@ -187,7 +431,8 @@ class ModelData(ABC):
 
             _, test_text_input_ids = self.nsc.keras_word_embeddings(x_test_text_clean, self.text_input_length)
 
-            train_embedding_mask = self.nsc.create_glove_word_vectors()
+            train_embedding_mask = self.nsc.create_glove_word_vectors(
+                store_dtype=self.parameters.glove_store_dtype, cache_dir=self.parameters.embedding_cache_dir)
             test_embedding_mask = train_embedding_mask
 
         return train_text_input_ids, test_text_input_ids, train_embedding_mask, test_embedding_mask
@@ -214,13 +459,147 @@ class ModelData(ABC):
 
         return twitter_df
 
+    @staticmethod
+    def get_file_fingerprint(filepath: str):
+        """
+        Fingerprints a file by its size, modification time, and a hash of its contents.
+
+        :param filepath: Path to the file
+        :type filepath: str
+
+        :return: Dictionary of size, mtime, and sha1 of the file, None if there is no such file
+        :rtype: dict(str-> obj)
+        """
+
+        if not filepath or not os.path.isfile(filepath):
+            return None
+
+        digest = hashlib.sha1()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(2 ** 20), b''):
+                digest.update(block)
+
+        stat = os.stat(filepath)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': digest.hexdigest()}
+
+    def get_cache_key(self) -> str:
+        """
+        Derives the key of the preprocessed data from everything preprocessing depends on: the contents of the train
+        and augmentation csvs, the features, test size, tokenizer (with the vocabulary of a pre-fitted one), GloVe store
+        dtype, and sanitizer version.
+
+        :return: Hex digest of the preprocessing configuration
+        :rtype: str
+        """
+
+        tokenizer = self.parameters.custom_tokenizer
+        if self.parameters.use_transformers:
+            tokenizer_type = 'roberta'
+        elif tokenizer is None:
+            tokenizer_type = 'keras'
+        else:
+            # Arrays tokenized with another vocabulary must not be reused
+            vocabulary = tokenizer.get_config() if hasattr(tokenizer, 'get_config') \
+                else getattr(tokenizer, 'word_index', None)
+            vocabulary_hash = hashlib.sha1(json.dumps(vocabulary, sort_keys=True, default=str).encode('utf-8'))
+            tokenizer_type = f'{type(tokenizer).__name__}:{vocabulary_hash.hexdigest()}'
+
+        config = {'model_data': type(self).__name__,
+                  'train_data_csv': ModelData.get_file_fingerprint(self.parameters.train_data_csv),
+                  'aug_data_csv': ModelData.get_file_fingerprint(self.parameters.aug_data_csv),
+                  'features_to_train': self.parameters.features_to_train,
+                  'textless_features_to_train': self.parameters.textless_features_to_train,
+                  'test_size': self.parameters.test_size,
+                  'tokenizer': tokenizer_type,
+                  'glove_store_dtype': self.parameters.glove_store_dtype,
+                  'sanitizer_version': self.text_sanitizer.version}
+
+        return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def load_data_from_cache_or_csv(self):
+        """
+        Loads preprocessed data from parameters.preprocessed_cache_dir if it was preprocessed with the same
+        configuration before, see get_cache_key. Otherwise loads and preprocesses the csvs and adds the result to the
+        cache, which is then pruned to parameters.preprocessed_cache_max_mb.
+        """
+
+        cache_dir = self.parameters.preprocessed_cache_dir
+        if not cache_dir:
+            self.load_data_from_csv()
+            return
+
+        key = self.get_cache_key()
+        entry = os.path.join(cache_dir, key)
+
+        if os.path.exists(os.path.join(entry, 'state.pkl')):
+            print(f'Loading preprocessed data from {entry}')
+            os.utime(entry)  # Mark as recently used
+            self.load_data_from_arrays(entry)
+            return
+
+        self.load_data_from_csv()
+
+        # Written next to the cache and renamed into place, so a crash never leaves a partial entry behind
+        tmp_entry = f'{entry}.tmp'
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.save_data_to_arrays(tmp_entry)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp_entry, entry)
+
+        self.prune_cache(keep=key)
+
+    def prune_cache(self, keep: str = ''):
+        """
+        Removes the least recently used entries of parameters.preprocessed_cache_dir until it is within
+        parameters.preprocessed_cache_max_mb.
+
+        :param keep: Key of an entry to never remove, such as the one just written
+        :type keep: str
+        """
+
+        cache_dir = self.parameters.preprocessed_cache_dir
+
+        entries = []
+        for name in os.listdir(cache_dir):
+            entry = os.path.join(cache_dir, name)
+            if not os.path.isdir(entry) or name.endswith('.tmp'):
+                continue
+
+            size = sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(entry) for file in files)
+            entries.append((os.path.getmtime(entry), name, size))
+
+        total = sum(size for _, _, size in entries)
+        max_size = self.parameters.preprocessed_cache_max_mb * 2 ** 20
+
+        for _, name, size in sorted(entries):
+            if total <= max_size:
+                break
+            if name == keep:
+                continue
+
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+            total -= size
+            print(f'Removed preprocessed data {name} from the cache')
+
     def load_data_from_dill(self):
         """
-        Loads model data from a binary file
+        Loads model data from a binary file. If the binary was saved with a different preprocessing configuration than
+        the current one (see get_cache_key), it is stale and the data is preprocessed again instead.
         """
 
         if os.path.exists(self.parameters.preload_train_data_dill):
 
+            key_file = f'{self.parameters.preload_train_data_dill}.key'
+            if os.path.exists(key_file):
+                with open(key_file, 'r') as f:
+                    saved_key = f.read().strip()
+
+                if saved_key != self.get_cache_key():
+                    print(f'{self.parameters.preload_train_data_dill} was preprocessed with a different configuration, '
+                          f'preprocessing again')
+                    self.load_data_from_cache_or_csv()
+                    return
+
             with open(self.parameters.preload_train_data_dill, "rb") as fpb:
                 data = pickle.load(fpb)
 
@@ -230,7 +609,8 @@ class ModelData(ABC):
 
     def save_data_to_dill(self):
         """
-        Saves data to a preload binary (so it can then be loaded using _load_data_from_binary)
+        Saves data to a preload binary (so it can then be loaded using _load_data_from_binary), with the key of its
+        preprocessing configuration next to it.
         """
         with open(self.parameters.save_train_data_dill, 'wb') as f:
             data = (self.train_text_input_ids, self.test_text_input_ids, self.x_train_meta, self.x_test_meta,
@@ -238,6 +618,140 @@ class ModelData(ABC):
                     self.text_input_length)
             pickle.dump(data, f)
 
+        with open(f'{self.parameters.save_train_data_dill}.key', 'w') as f:
+            f.write(self.get_cache_key())
+
+    def save_data_to_arrays(self, directory: str):
+        """
+        Saves data to a directory of .npy arrays, so it can be memory-mapped by load_data_from_arrays and shared
+        between processes without copying. The tokenizer and text input length are pickled next to the arrays.
+
+        :param directory: Directory to save the arrays in
+        :type directory: str
+        """
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        for name in ModelData.array_names:
+            np.save(os.path.join(directory, f'{name}.npy'), np.asarray(getattr(self, name)))
+
+        meta_columns = {}
+        for name in ('x_train_meta', 'x_test_meta'):
+            meta = getattr(self, name)
+            if meta is not None:
+                np.save(os.path.join(directory, f'{name}.npy'), meta.to_numpy(dtype='float32'))
+                meta_columns[name] = list(meta.columns)
+
+        with open(os.path.join(directory, 'state.pkl'), 'wb') as f:
+            pickle.dump((self.nsc.tokenizer, self.text_input_length, meta_columns), f)
+
+    def load_data_from_arrays(self, directory: str = ''):
+        """
+        Loads data saved by save_data_to_arrays, memory-mapping the arrays read only.
+
+        :param directory: Directory the arrays were saved in, defaults to parameters.preload_train_data_arrays
+        :type directory: str
+        """
+
+        directory = directory or self.parameters.preload_train_data_arrays
+
+        for name in ModelData.array_names:
+            setattr(self, name, np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r'))
+
+        with open(os.path.join(directory, 'state.pkl'), 'rb') as f:
+            self.nsc.tokenizer, self.text_input_length, meta_columns = pickle.load(f)
+
+        for name, columns in meta_columns.items():
+            setattr(self, name, pd.DataFrame(np.load(os.path.join(directory, f'{name}.npy')), columns=columns))
+
+    def load_data_from_shards(self):
+        """
+        Sets up streaming training from parameters.train_data_shards instead of loading a csv into memory, see
+        StreamingTweetData. For GloVe models the tokenizer is fitted and the embedding matrix built in one streaming
+        pass over the train split. Inputs are padded to parameters.custom_text_input_length. y_train and y_test hold no
+        rows and only give the number of labels to build the model with.
+        """
+
+        self.streaming = StreamingTweetData(self, self.parameters.train_data_shards, self.label_column,
+                                            aug_shards=self.parameters.aug_data_shards,
+                                            chunksize=self.parameters.stream_chunk_size)
+
+        if self.parameters.use_transformers:
+            self.nsc.create_roberta_tokenizer()
+        else:
+            self.streaming.fit_tokenizer()
+            self.train_embedding_mask = self.nsc.create_glove_word_vectors(
+                store_dtype=self.parameters.glove_store_dtype, cache_dir=self.parameters.embedding_cache_dir)
+            self.test_embedding_mask = self.train_embedding_mask
+
+        self.x_train_meta = pd.DataFrame(columns=self.streaming.meta_features)
+        self.x_test_meta = pd.DataFrame(columns=self.streaming.meta_features)
+        self.y_train = np.zeros((0, len(self.streaming.label_classes)), dtype='float32')
+        self.y_test = np.zeros((0, len(self.streaming.label_classes)), dtype='float32')
+
+    def load_data_for_update(self):
+        """
+        Loads newly labeled tweets from parameters.update_data_csv for fine tuning a saved model, together with a
+        replay sample of parameters.replay_size tweets from the data it was trained on (parameters.replay_data_csv) so
+        it does not forget the old labels. Only these rows are sanitized and vectorized, with the frozen tokenizer and
+        text input length of the saved model.
+
+        Labels are one-hot encoded like nSC.keras_preprocessing does in training, in sorted order of the label values.
+        The classes are those of the replay data when there is some, so they match the outputs of the saved model even
+        if the new labels do not cover every class. They are kept in self.label_classes.
+        """
+
+        features = self.parameters.features_to_train
+
+        # Unlabeled (-2) and unsure (-1) tweets are left out
+        unused_labels = [-2, -1]
+
+        update_df = Utils.parse_json_tweet_data_from_csv(self.parameters.update_data_csv, features)
+        update_df = update_df[~update_df[self.label_column].isin(unused_labels)]
+        self.label_classes = sorted(update_df[self.label_column].astype(int).unique())
+
+        if self.parameters.replay_data_csv and self.parameters.replay_size > 0:
+            replay_df = Utils.parse_json_tweet_data_from_csv(self.parameters.replay_data_csv, features)
+            replay_df = replay_df[~replay_df[self.label_column].isin(unused_labels)]
+
+            # The replay data is the training data, so its classes are the ones the saved model was trained on
+            self.label_classes = sorted(set(self.label_classes) | set(replay_df[self.label_column].astype(int)))
+
+            # New labels take precedence over old labels of the same tweets
+            if 'Tweet id' in replay_df.columns and 'Tweet id' in update_df.columns:
+                replay_df = replay_df[~replay_df['Tweet id'].isin(update_df['Tweet id'])]
+
+            replay_df = replay_df.sample(n=min(self.parameters.replay_size, len(replay_df)))
+            update_df = pd.concat([update_df, replay_df], ignore_index=True)
+
+        update_df = update_df.reset_index(drop=True)
+
+        if 'augmented' not in update_df.columns:
+            update_df['augmented'] = 0
+        update_df['augmented'] = update_df['augmented'].fillna(0)
+
+        label_indices = np.searchsorted(self.label_classes, update_df[self.label_column].astype(int))
+        labels = list(np.eye(len(self.label_classes), dtype='float32')[label_indices])
+        x_train, x_test, y_train, y_test = nSC.split_data_to_train_test(update_df[features], labels,
+                                                                        test_size=self.parameters.test_size,
+                                                                        augmented_states=update_df['augmented'])
+
+        self.train_text_input_ids, self.train_embedding_mask = \
+            self.get_vectorized_text_tokens_from_val_dataframe(x_train)
+        self.test_text_input_ids, self.test_embedding_mask = self.get_vectorized_text_tokens_from_val_dataframe(x_test)
+
+        meta_features = self.parameters.textless_features_to_train or []
+        if meta_features:
+            self.x_train_meta = x_train[meta_features]
+            self.x_test_meta = x_test[meta_features]
+
+        self.y_train = np.asarray(y_train)
+        self.y_test = np.asarray(y_test)
+
+        print(f'Loaded {len(update_df)} tweets to fine tune on, including up to {self.parameters.replay_size} '
+              f'replayed tweets')
+
     @abstractmethod
     def get_dataset_from_tweet_type(self, dataframe: pd.DataFrame):
         pass
@@ -253,14 +767,29 @@ class ModelLearning:
     data is to be used with different hyperparamaters, and to add model testing / operation functionality.
     """
 
+    # Parameters that change what training produces, hashed to match a saved training state to its configuration.
+    # Paths, caches, profiling, and inference only settings are left out, so changing them keeps the saved state.
+    hashed_parameters = ['learning_rate', 'early_stopping', 'checkpoint_model', 'early_stopping_patience',
+                         'early_stopping_monitor', 'restore_best_weights', 'validation_data', 'validation_split',
+                         'batch_size', 'use_tpu', 'distribution', 'distribution_replicas', 'scale_with_replicas',
+                         'use_transformers', 'dropout_rate', 'use_cnn', 'train_data_csv', 'aug_data_csv', 'test_size',
+                         'train_data_shards', 'aug_data_shards', 'stream_chunk_size', 'update_data_csv', 'replay_size',
+                         'features_to_train', 'textless_features_to_train', 'custom_text_input_length',
+                         'glove_store_dtype', 'sanitizer_version', 'train_bucket_boundaries', 'use_tf_data',
+                         'shuffle_buffer_size', 'encoder_features', 'distill_student_cnn']
+
     def __init__(self, model_params: ModelParameters, model_data: ModelData):
 
         self.parameters = model_params
         self.data = model_data
-        self.metrics = Metrics
+        self.metrics = None
         self.model = tf.keras.models.Model
         self.tpu_strategy = None
+        self.strategy = None
+        self.training_checkpoint = None
+        self.training_report = {}
         self.score = (-1, -1)
+        self.dedup_stats = {}
 
     def compile_model(self):
 
@@ -268,7 +797,14 @@ class ModelLearning:
         Compiles a model with given hyperparameters
         """
 
-        optimizer = tf.keras.optimizers.Adam(learning_rate=self.parameters.learning_rate, clipnorm=1.)
+        if self.metrics is None:
+            self.metrics = get_metrics()
+
+        learning_rate = self.parameters.learning_rate
+        if self.parameters.scale_with_replicas:
+            learning_rate *= self.get_replica_count()  # Linear scaling rule for the larger global batch
+
+        optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate, clipnorm=1.)
         self.model.compile(loss='binary_crossentropy',
                            optimizer=optimizer,
                            metrics=self.metrics)
@@ -321,12 +857,14 @@ class ModelLearning:
         :return: Softmax probabilities for each label (-1, 0, and 1) of each tweet
         :rtype: [[x, y, z]] where x, y, z are floats in range (0, 1) and x + y + z = 1.00
         """
-        x_val = self.data.get_x_val_from_csv(csv)
-        return self.model.predict(x_val).tolist()
+        tweet_df = Utils.parse_json_tweet_data_from_csv(csv, self.parameters.features_to_train)
+        return self.raw_predict_tweets(tweet_df).tolist()
 
     def raw_predict_tweets(self, tweet_df: pd.DataFrame):
         """
-        Predict on model from a dataframe of tweets.
+        Predict on model from a dataframe of tweets. Rows with identical feature values are collapsed so each unique
+        row is sanitized, tokenized, and run through the model once, then the predictions are scattered back to the
+        original row order. Counts are recorded in self.dedup_stats.
 
         :param tweet_df: Dataframe of tweets.
         :type tweet_df: pd.Dataframe
@@ -334,8 +872,44 @@ class ModelLearning:
         :return: Softmax probabilities for each label (-1, 0, and 1) of each tweet
         :rtype: [[x, y, z]] where x, y, z are floats in range (0, 1) and x + y + z = 1.00
         """
-        x_val = self.data.get_x_val_from_dataframe(tweet_df)
-        return self.model.predict(x_val)
+
+        features = self.parameters.features_to_train
+        if not all(feat in tweet_df.columns for feat in features):
+            tweet_df = Utils.parse_json_tweet_data(tweet_df.copy(), features)
+
+        unique_df, inverse = Utils.collapse_duplicate_rows(tweet_df, [f for f in features if f in tweet_df.columns])
+        self.dedup_stats = {'Rows': len(tweet_df), 'Unique Rows': len(unique_df),
+                            'Deduplicated Rows': len(tweet_df) - len(unique_df)}
+
+        if self.parameters.use_transformers and self.parameters.inference_bucket_boundaries and len(unique_df) > 0 \
+                and 'full_text' in features:
+            return self.predict_bucketed(unique_df)[inverse]
+
+        x_val = self.data.get_x_val_from_dataframe(unique_df)
+        return self.model.predict(x_val)[inverse]
+
+    def predict_bucketed(self, x_val_df: pd.DataFrame) -> np.ndarray:
+        """
+        Predicts on a dataframe of tweets one length bucket at a time, see ModelData.get_bucketed_x_val_from_dataframe,
+        so short tweets do not pay for attention over padding. Predictions are returned in the original row order.
+
+        :param x_val_df: Dataframe of tweets with self.features_to_train columns present
+        :type x_val_df: pd.DataFrame
+
+        :return: Softmax probabilities for each label of each tweet
+        :rtype: np.array(np.array(float))
+        """
+
+        predictions = None
+        for rows, x_val in self.data.get_bucketed_x_val_from_dataframe(x_val_df):
+
+            bucket_predictions = self.model.predict(x_val)
+            if predictions is None:
+                predictions = np.zeros((len(x_val_df),) + bucket_predictions.shape[1:], dtype=bucket_predictions.dtype)
+
+            predictions[rows] = bucket_predictions
+
+        return predictions
 
     def predict(self, csv: str = '', tweet_df: pd.DataFrame = None):
         """
@@ -356,10 +930,24 @@ class ModelLearning:
         if csv:
             y = self.raw_predict_csv(csv)
         elif not tweet_df.empty:
-            y = self.raw_predict_tweets(tweet_df)
+            y = self.raw_predict_tweets(tweet_df).tolist()
         else:
             return []
 
+        return ModelLearning.get_labels_from_raw(y)
+
+    @staticmethod
+    def get_labels_from_raw(y: list):
+        """
+        Converts raw model prediction scores to labels, see predict.
+
+        :param y: Softmax probabilities of each label of each tweet
+        :type y: list(list(float))
+
+        :return: Prediction for each tweet, softmax and raw
+        :rtype: [[int], [float]] where int is -1, 0, or 1
+        """
+
         # Use the highest softmax probability as the label (-1, 0, or 1)
         #return [max(range(len(y1)), key=y1.__getitem__) for y1 in y], [max(y1) for y1 in y]
 
@@ -442,33 +1030,595 @@ class ModelLearning:
 
         return
 
-    def get_callbacks(self):
+    def get_dataset(self, text_input_ids, embedding_mask, labels, meta=None, shuffle=True):
         """
-        Creates callbacks if requested. Supports early stopping and checkpoint callbacks.
+        Creates a tf.data input pipeline of text ids, attention masks, and meta features. Examples are converted to
+        model dtypes in a parallel map and cached, so the conversion happens once instead of every epoch, then
+        shuffled with a buffer of parameters.shuffle_buffer_size, batched, and prefetched so input preparation overlaps
+        with training.
+
+        If parameters.train_bucket_boundaries is set, examples of similar token length are batched together instead.
+        Each example is trimmed to its own length and each batch is only padded to its longest example, so one long
+        outlier does not make every batch pay for it. This requires a model built with maxlen=None. Lengths come from
+        the attention mask for transformers, and from the nonzero (post padded) token ids otherwise.
+
+        :param text_input_ids: Padded token ids of each example
+        :type text_input_ids: np.array(np.array(int))
+        :param embedding_mask: Transformer attention mask, or the GloVe embedding matrix
+        :type embedding_mask: np.array(np.array(int))
+        :param labels: Categorical labels of each example
+        :type labels: np.array(np.array(float))
+        :param meta: Meta features of each example, None if only training on text
+        :type meta: pd.DataFrame
+        :param shuffle: Whether to reshuffle the examples every epoch
+        :type shuffle: bool
+
+        :return: Dataset of (inputs, labels) batches ready to pass into model.fit or model.evaluate
+        :rtype: tf.data.Dataset
         """
 
+        text_data = np.asarray(text_input_ids)
+        if self.parameters.use_transformers:
+            text_data = {'input_ids': text_data, 'attention_mask': np.asarray(embedding_mask)}
+
+        input_data = text_data if meta is None else (text_data, np.asarray(meta, dtype='float32'))
+        example_count = len(labels)
+
+        def to_model_dtypes(x, y):
+
+            text = x if meta is None else x[0]
+            text = tf.nest.map_structure(lambda t: tf.cast(t, 'int32'), text)
+
+            if self.parameters.use_transformers:
+                length = tf.reduce_sum(text['attention_mask'])
+            else:
+                length = tf.math.count_nonzero(text, dtype='int32')
+
+            x = text if meta is None else (text, x[1])
+            return x, tf.cast(y, 'float32'), tf.maximum(length, 1)
+
+        dataset = tf.data.Dataset.from_tensor_slices((input_data, np.asarray(labels)))
+        dataset = dataset.map(to_model_dtypes, num_parallel_calls=tf.data.experimental.AUTOTUNE).cache()
+
+        if shuffle:
+            dataset = dataset.shuffle(min(example_count, self.parameters.shuffle_buffer_size),
+                                      reshuffle_each_iteration=True)
+
+        if self.parameters.train_bucket_boundaries:
+
+            def trim(x, y, length):
+                text = x if meta is None else x[0]
+                text = tf.nest.map_structure(lambda t: t[:length], text)
+                return (text if meta is None else (text, x[1])), y, length
+
+            boundaries = sorted(self.parameters.train_bucket_boundaries)
+
+            # Token ids are padded with the pad token of the tokenizer (1 for RoBERTa, 0 for Keras), masks with 0
+            pad_id = tf.constant(self.data.nsc.tokenizer.pad_token_id if self.parameters.use_transformers else 0,
+                                 dtype='int32')
+            text_padding = {'input_ids': pad_id, 'attention_mask': tf.constant(0, dtype='int32')} \
+                if self.parameters.use_transformers else pad_id
+            x_padding = text_padding if meta is None else (text_padding, tf.constant(0, dtype='float32'))
+
+            dataset = dataset.map(trim, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+            dataset = dataset.apply(tf.data.experimental.bucket_by_sequence_length(
+                element_length_func=lambda x, y, length: length, bucket_boundaries=boundaries,
+                bucket_batch_sizes=[self.get_batch_size()] * (len(boundaries) + 1),
+                padding_values=(x_padding, tf.constant(0, dtype='float32'), tf.constant(0, dtype='int32'))))
+
+        else:
+            dataset = dataset.batch(self.get_batch_size())
+
+        return dataset.map(lambda x, y, length: (x, y)).prefetch(tf.data.experimental.AUTOTUNE)
+
+    def get_validation_count(self) -> int:
+        """
+        Gets the number of training examples carved out for validation when parameters.validation_data is split. The
+        train data is already shuffled by the train test split, so the first examples are used.
+
+        :return: Number of validation examples, 0 if not validating on a split of the train data
+        :rtype: int
+        """
+
+        if self.parameters.validation_data != 'split' or self.data.y_train is None:
+            return 0
+
+        return int(len(self.data.y_train) * self.parameters.validation_split)
+
+    def get_train_arrays(self, rows: slice):
+        """
+        Gets the text ids, attention mask or embedding matrix, labels, and meta features of a slice of the train data.
+
+        :param rows: Rows of the train data to take
+        :type rows: slice
+
+        :return: Tuple of text ids, embedding mask, labels, and meta features (None if only training on text)
+        :rtype: tuple
+        """
+
+        embedding_mask = self.data.train_embedding_mask
+        if self.parameters.use_transformers:
+            embedding_mask = embedding_mask[rows]  # The GloVe embedding matrix is shared by every example
+
+        meta = None
+        if self.data.x_train_meta is not None and len(self.data.x_train_meta.columns) > 0:
+            meta = self.data.x_train_meta.iloc[rows]
+
+        return self.data.train_text_input_ids[rows], embedding_mask, self.data.y_train[rows], meta
+
+    def get_input_layer(self, text_input_ids, embedding_mask, meta=None):
+        """
+        Assembles in-memory arrays and dataframes into a model input layer, for when tf.data is not used.
+
+        :param text_input_ids: Padded token ids of each example
+        :type text_input_ids: np.array(np.array(int))
+        :param embedding_mask: Transformer attention mask, unused for GloVe models
+        :type embedding_mask: np.array(np.array(int))
+        :param meta: Meta features of each example, None if only training on text
+        :type meta: pd.DataFrame
+
+        :return: Model input layer being [text_data, meta] or text_data
+        :rtype: obj
+        """
+
+        text_data = text_input_ids
+        if self.parameters.use_transformers:
+            text_data = {'input_ids': text_input_ids, 'attention_mask': embedding_mask}
+
+        return text_data if meta is None else [text_data, meta]
+
+    def get_fit_inputs(self, use_tf_data=None):
+        """
+        Assembles the train and test inputs of self.data for model.fit and model.evaluate, either as tf.data pipelines
+        (see get_dataset) or as in-memory arrays and dataframes that Keras converts every epoch. Meta features are
+        included when self.data has any. Examples carved out for validation (see get_validation_count) are left out of
+        the train inputs.
+
+        :param use_tf_data: Whether to build tf.data pipelines, defaults to parameters.use_tf_data. Always true when
+        training in length buckets or streaming from shards.
+        :type use_tf_data: bool
+
+        :return: Tuple of train inputs, train labels, test inputs, test labels, and batch size. Labels and batch size
+        are None for tf.data pipelines since the datasets carry them.
+        :rtype: tuple
+        """
+
+        if self.data.streaming is not None:
+            return self.data.streaming.get_dataset('train', self.get_batch_size()), None, \
+                self.data.streaming.get_dataset('test', self.get_batch_size(), shuffle=False), None, None
+
+        if use_tf_data is None:
+            use_tf_data = self.parameters.use_tf_data
+        use_tf_data = use_tf_data or bool(self.parameters.train_bucket_boundaries)
+
+        train_ids, train_mask, train_labels, train_meta = self.get_train_arrays(slice(self.get_validation_count(),
+                                                                                      None))
+        test_meta = self.data.x_test_meta if train_meta is not None else None
+
+        if use_tf_data:
+            train_dataset = self.get_dataset(train_ids, train_mask, train_labels, train_meta)
+            test_dataset = self.get_dataset(self.data.test_text_input_ids, self.data.test_embedding_mask,
+                                            self.data.y_test, test_meta, shuffle=False)
+
+            return train_dataset, None, test_dataset, None, None
+
+        return self.get_input_layer(train_ids, train_mask, train_meta), train_labels, \
+            self.get_input_layer(self.data.test_text_input_ids, self.data.test_embedding_mask, test_meta), \
+            self.data.y_test, self.get_batch_size()
+
+    def get_validation_inputs(self, test_inputs, test_labels, use_tf_data=None):
+        """
+        Gets the validation data for model.fit from parameters.validation_data. With test, the test inputs are
+        validated on. With split, the examples carved out of the train data are. Streamed data always validates on
+        its test split.
+
+        :param test_inputs: Test inputs from get_fit_inputs
+        :type test_inputs: obj
+        :param test_labels: Test labels from get_fit_inputs, None for tf.data pipelines
+        :type test_labels: np.array(np.array(float))
+        :param use_tf_data: Whether to build a tf.data pipeline, defaults to parameters.use_tf_data
+        :type use_tf_data: bool
+
+        :return: Validation data for model.fit, None if not validating
+        :rtype: obj
+        """
+
+        if not self.parameters.validation_data:
+            return None
+
+        if self.parameters.validation_data == 'test' or self.data.streaming is not None:
+            return test_inputs if test_labels is None else (test_inputs, test_labels)
+
+        if self.parameters.validation_data != 'split':
+            raise ValueError(f'Unknown validation data {self.parameters.validation_data}, expected test or split')
+
+        if use_tf_data is None:
+            use_tf_data = self.parameters.use_tf_data
+        use_tf_data = use_tf_data or bool(self.parameters.train_bucket_boundaries)
+
+        val_ids, val_mask, val_labels, val_meta = self.get_train_arrays(slice(None, self.get_validation_count()))
+
+        if use_tf_data:
+            return self.get_dataset(val_ids, val_mask, val_labels, val_meta, shuffle=False)
+
+        return self.get_input_layer(val_ids, val_mask, val_meta), val_labels
+
+    def fit_model(self, train_inputs, train_labels, batch_size, cbs, validation_inputs=None):
+        """
+        Fits self.model for up to parameters.epochs epochs, resuming from a training checkpoint if there is one, and
+        reports the epochs and wall time that early stopping saved compared to the epoch budget. Saved wall time is
+        estimated from the mean time of the epochs that ran. The report is kept in self.training_report.
+
+        :param train_inputs: Train inputs from get_fit_inputs
+        :type train_inputs: obj
+        :param train_labels: Train labels from get_fit_inputs, None for tf.data pipelines
+        :type train_labels: np.array(np.array(float))
+        :param batch_size: Batch size from get_fit_inputs, None for tf.data pipelines
+        :type batch_size: int
+        :param cbs: List of callbacks from get_callbacks
+        :type cbs: list(func)
+        :param validation_inputs: Validation data from get_validation_inputs
+        :type validation_inputs: obj
+
+        :return: Training history
+        :rtype: tf.keras.callbacks.History
+        """
+
+        initial_epoch = self.get_initial_epoch()
+
+        start = time.perf_counter()
+        history = self.model.fit(x=train_inputs, y=train_labels, batch_size=batch_size,
+                                 epochs=self.parameters.epochs, verbose=1, callbacks=cbs,
+                                 validation_data=validation_inputs, initial_epoch=initial_epoch)
+        wall_time = time.perf_counter() - start
+
+        budget = max(self.parameters.epochs - initial_epoch, 0)
+        epochs_run = len(history.epoch)
+        epochs_saved = max(budget - epochs_run, 0)
+
+        self.training_report = {'Epoch Budget': budget,
+                                'Epochs Run': epochs_run,
+                                'Epochs Saved': epochs_saved,
+                                'Wall Time': wall_time,
+                                'Est. Wall Time Saved': epochs_saved * wall_time / max(epochs_run, 1)}
+
+        print(pd.DataFrame(self.training_report, index=[0]).to_string(index=False))
+
+        return history
+
+    def build_frozen_encoder_model(self, cbs):
+        """
+        Trains a small head over precomputed frozen RoBERTa features instead of fine-tuning the whole transformer. The
+        encoder runs once over the train and test sets (see ModelData.get_encoder_features), the head is trained on
+        the cached features with the meta features concatenated, and self.model is then set to the encoder chained
+        with the head so prediction works like with a fine-tuned model. The chained model is what gets saved to
+        parameters.model_h5, so callbacks should be created with get_callbacks(checkpoint_h5=False).
+
+        :param cbs: List of callbacks
+        :type cbs: list(func)
+        """
+
+        # Under the distribution strategy, so the encoder variables are mirrored like the head
+        with self.get_distribution_scope():
+            encoder = nSC.create_roberta_feature_extractor(self.parameters.encoder_features)
+
+        train_features = self.data.get_encoder_features(encoder, self.data.train_text_input_ids,
+                                                        self.data.train_embedding_mask, 'train')
+        test_features = self.data.get_encoder_features(encoder, self.data.test_text_input_ids,
+                                                       self.data.test_embedding_mask, 'test')
+
+        validation_count = self.get_validation_count()
+        train_labels = self.data.y_train[validation_count:]
+        validation_inputs = None
+
+        meta_feature_size = 0
+        train_input_layer = train_features[validation_count:]
+        test_input_layer = test_features
+        val_input_layer = train_features[:validation_count]
+
+        if self.data.x_train_meta is not None and len(self.data.x_train_meta.columns) > 0:
+            meta_feature_size = len(self.data.x_train_meta.columns)
+            train_input_layer = [train_input_layer, self.data.x_train_meta.iloc[validation_count:]]
+            test_input_layer = [test_features, self.data.x_test_meta]
+            val_input_layer = [val_input_layer, self.data.x_train_meta.iloc[:validation_count]]
+
+        if self.parameters.validation_data == 'test':
+            validation_inputs = (test_input_layer, self.data.y_test)
+        elif self.parameters.validation_data == 'split':
+            validation_inputs = (val_input_layer, self.data.y_train[:validation_count])
+
+        with self.get_distribution_scope():
+            head = nSC.create_frozen_encoder_head_model(train_features.shape[1], meta_feature_size,
+                                                        self.data.y_train.shape,
+                                                        dropout_rate=self.parameters.dropout_rate)
+            self.model = head
+            self.compile_model()
+
+        history = self.fit_model(train_input_layer, train_labels, self.get_batch_size(), cbs, validation_inputs)
+
+        nSC.plot_model_history(history)
+
+        if self.parameters.evaluate_model:
+            self.score = self.evaluate_model(test_input_layer, self.data.y_test, [])
+
+        with self.get_distribution_scope():
+            self.model = nSC.create_frozen_encoder_model(encoder, head, meta_feature_size)
+            self.compile_model()
+
+        # The head takes encoder features, so only the chained model can predict on token ids when loaded
+        if self.parameters.checkpoint_model:
+            self.model.save(self.parameters.model_h5)
+
+    def get_monitor(self) -> Tuple[str, str]:
+        """
+        Gets the metric that early stopping and model checkpoints monitor, on the validation data when there is some,
+        and its direction of improvement. Only losses improve by decreasing.
+
+        :return: Tuple of the metric name and monitor mode
+        :rtype: (str, str)
+        """
+
+        monitor = self.parameters.early_stopping_monitor
+        if self.parameters.validation_data:
+            monitor = f'val_{monitor}'
+
+        return monitor, 'min' if monitor.endswith('loss') else 'max'
+
+    def get_callbacks(self, checkpoint_h5=True):
+        """
+        Creates callbacks if requested. Supports early stopping, checkpoint, profiling, and training state callbacks.
+
+        :param checkpoint_h5: Whether the model checkpoint may save the trained model to parameters.model_h5. Models
+                              that are not the model to predict with, such as the head of a frozen encoder, save it
+                              themselves.
+        :type checkpoint_h5: bool
+        """
+
+        monitor, mode = self.get_monitor()
+
         cbs = []
         if self.parameters.early_stopping:
             # Set up early stopping callback
-            cbs.append(nSC.create_early_stopping_callback('mcor', patience=self.parameters.early_stopping_patience))
+            cbs.append(nSC.create_early_stopping_callback(monitor, monitor_mode=mode,
+                                                          patience=self.parameters.early_stopping_patience,
+                                                          restore_best_weights=self.parameters.restore_best_weights))
 
-        if self.parameters.checkpoint_model:
+        if self.parameters.checkpoint_model and checkpoint_h5:
             # Set up checkpointing model
-            cbs.append(nSC.create_model_checkpoint_callback(self.parameters.model_h5, monitor_stat='mcor',
-                                                            mode='max'))
+            cbs.append(nSC.create_model_checkpoint_callback(self.parameters.model_h5, monitor_stat=monitor,
+                                                            mode=mode))
+
+        if self.parameters.profile_training_file:
+            # Set up training throughput profiling
+            from TrainingProfiler import TrainingProfiler
+            cbs.append(TrainingProfiler(self.parameters.profile_training_file, self.get_batch_size(),
+                                        trace_dir=self.parameters.profile_trace_dir,
+                                        trace_steps=self.parameters.profile_trace_steps))
+
+        if self.parameters.training_checkpoint_dir:
+            # Set up resumable training state, tracking the counters of the callbacks above
+            from TrainingStateCheckpoint import TrainingStateCheckpoint
+            self.training_checkpoint = TrainingStateCheckpoint(self.parameters.training_checkpoint_dir,
+                                                               self.get_config_hash(),
+                                                               interval=self.parameters.training_checkpoint_interval,
+                                                               tracked_callbacks=list(cbs))
+            cbs.append(self.training_checkpoint)
 
         return cbs
 
+    def get_config_hash(self) -> str:
+        """
+        Hashes the parameters that affect training (hashed_parameters), together with the shape of the training data,
+        to tell whether a saved training state belongs to this configuration. The epoch budget is left out so a run can
+        be resumed with more epochs.
+
+        :return: Hex digest of the training configuration
+        :rtype: str
+        """
+
+        config = {name: getattr(self.parameters, name) for name in ModelLearning.hashed_parameters}
+        config['data_shape'] = [list(np.shape(self.data.y_train)), self.data.text_input_length]
+
+        return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get_initial_epoch(self) -> int:
+        """
+        Restores the saved training state into the compiled model if there is one for this configuration. Call after
+        get_callbacks.
+
+        :return: Epoch to pass to model.fit as initial_epoch
+        :rtype: int
+        """
+
+        if self.training_checkpoint is None:
+            return 0
+
+        return self.training_checkpoint.restore(self.model)
+
     def update_to_save_as_trained(self, nsc, text_input_length):
         # TODO ask Fedya why we have this
         self.parameters.custom_tokenizer = nsc.tokenizer
         self.parameters.custom_text_input_length = text_input_length
+        self.parameters.sanitize_cache_db = ''
+        self.parameters.embedding_cache_dir = ''
+        self.parameters.sanitizer_version = self.data.text_sanitizer.version
+        self.parameters.replay_data_csv = self.parameters.replay_data_csv or self.parameters.train_data_csv
+        self.parameters.update_data_csv = ''
         self.parameters.train_data_csv = ''
         self.parameters.aug_data_csv = ''
         self.parameters.preload_train_data_dill = ''
+        self.parameters.preload_train_data_arrays = ''
+        self.parameters.train_data_shards = None
+        self.parameters.aug_data_shards = None
         self.parameters.save_train_data_dill = ''
         self.parameters.load_to_predict = True
 
+    def update_model(self, new_labels_csv: str) -> str:
+        """
+        Fine-tunes the saved model on newly labeled tweets instead of retraining it from scratch. Parameters must be
+        those of a saved model (see update_to_save_as_trained), so its tokenizer and h5 are reused. Only the new rows
+        and a replay sample of the old data are preprocessed, see ModelData.load_data_for_update. Trains for
+        parameters.epochs epochs, typically a few, at parameters.learning_rate, then saves the model as the next
+        version of parameters.model_h5, leaving the previous version untouched.
+
+        :param new_labels_csv: Path to a csv of newly labeled tweets, such as one from ManualTweetLabelingScript
+        :type new_labels_csv: str
+
+        :return: Path of the new model version
+        :rtype: str
+        """
+
+        if self.parameters.update_data_csv != new_labels_csv:
+            self.parameters.update_data_csv = new_labels_csv
+            self.data = type(self.data)(self.parameters)
+
+        with self.get_distribution_scope():
+            self.model = nSC.load_saved_model(self.parameters.model_h5)
+            self.compile_model()
+
+        if len(self.data.label_classes) != self.model.output_shape[-1]:
+            raise ValueError(f'The update data has labels {self.data.label_classes}, but the saved model predicts '
+                             f'{self.model.output_shape[-1]} classes. Set replay_data_csv to the data the model was '
+                             f'trained on, or label tweets of every class.')
+
+        # Checkpoints during fine tuning go to the new version as well
+        self.parameters.model_h5 = Utils.get_next_version_path(self.parameters.model_h5)
+
+        cbs = self.get_callbacks()
+
+        train_input_layer, train_labels, test_input_layer, test_labels, batch_size = self.get_fit_inputs()
+
+        self.fit_model(train_input_layer, train_labels, batch_size, cbs,
+                       self.get_validation_inputs(test_input_layer, test_labels))
+
+        if self.parameters.evaluate_model:
+            self.score = self.evaluate_model(test_input_layer, test_labels, [])
+
+        self.model.save(self.parameters.model_h5)
+        print(f'Saved updated model to {self.parameters.model_h5}')
+
+        return self.parameters.model_h5
+
+    def get_distribution_strategy(self):
+        """
+        Creates the tf.distribute strategy selected by parameters.distribution on first use. Supports tpu, mirrored
+        (every GPU, or parameters.distribution_replicas logical devices split from the CPU when there are no GPUs),
+        and multi_worker (MultiWorkerMirroredStrategy over the processes or nodes described by the TF_CONFIG
+        environment variable). parameters.use_tpu is kept as an alias of tpu.
+
+        :return: The distribution strategy, None to train on the default device
+        :rtype: tf.distribute.Strategy
+        """
+
+        if self.strategy is not None:
+            return self.strategy
+
+        distribution = 'tpu' if self.parameters.use_tpu else self.parameters.distribution
+
+        if distribution == 'tpu':
+            self.init_tpu()
+            self.strategy = self.tpu_strategy
+        elif distribution == 'mirrored':
+            self.strategy = tf.distribute.MirroredStrategy(devices=self.get_mirrored_devices())
+        elif distribution == 'multi_worker':
+            self.strategy = tf.distribute.MultiWorkerMirroredStrategy()
+        elif distribution:
+            raise ValueError(f'Unknown distribution {distribution}, expected tpu, mirrored, or multi_worker')
+
+        if self.strategy is not None:
+            print(f'Training with {distribution} on {self.strategy.num_replicas_in_sync} replicas')
+
+        return self.strategy
+
+    def get_mirrored_devices(self):
+        """
+        Gets the devices to mirror over. With no GPUs, the CPU is split into parameters.distribution_replicas logical
+        devices with the cores divided between them, see set_logical_cpu_devices.
+
+        :return: Device names, None to mirror over every GPU
+        :rtype: list(str)
+        """
+
+        if tf.config.list_physical_devices('GPU'):
+            return None
+
+        replicas = max(self.parameters.distribution_replicas, 1)
+        ModelLearning.set_logical_cpu_devices(replicas)
+
+        return [device.name for device in tf.config.list_logical_devices('CPU')][:replicas]
+
+    @staticmethod
+    def init_distribution_devices(parameters: ModelParameters):
+        """
+        Splits the CPU into logical devices for parameters.distribution_replicas mirrored replicas when there are no
+        GPUs. Call before creating ModelData, whose preprocessing starts TensorFlow.
+
+        :param parameters: Parameters of the model to train
+        :type parameters: ModelParameters
+        """
+
+        if parameters.distribution == 'mirrored' and not parameters.use_tpu \
+                and not tf.config.list_physical_devices('GPU'):
+            ModelLearning.set_logical_cpu_devices(max(parameters.distribution_replicas, 1))
+
+    @staticmethod
+    def set_logical_cpu_devices(replicas: int):
+        """
+        Splits the CPU into logical devices with the cores divided between them. This only works before TensorFlow
+        initializes its devices, so it has to happen before any other TensorFlow work in the process, such as loading
+        ModelData (see init_distribution_devices). Devices that are already split into enough logical CPUs are left as
+        they are.
+
+        :param replicas: Number of logical CPU devices
+        :type replicas: int
+        """
+
+        try:
+            tf.config.set_logical_device_configuration(tf.config.list_physical_devices('CPU')[0],
+                                                       [tf.config.LogicalDeviceConfiguration()] * replicas)
+            tf.config.threading.set_intra_op_parallelism_threads(max((os.cpu_count() or 1) // replicas, 1))
+        except RuntimeError as e:
+            logical_cpus = len(tf.config.list_logical_devices('CPU'))
+            if logical_cpus < replicas:
+                raise RuntimeError(f'TensorFlow devices were initialized with {logical_cpus} logical CPUs before '
+                                   f'they could be split into {replicas}, set up the distribution strategy before any '
+                                   f'other TensorFlow work') from e
+
+    def get_distribution_scope(self):
+        """
+        Gets the context to build and compile models in, so their variables are placed by the distribution strategy.
+
+        :return: The strategy scope, or a no-op context without a strategy
+        :rtype: contextlib.AbstractContextManager
+        """
+
+        strategy = self.get_distribution_strategy()
+        return strategy.scope() if strategy is not None else contextlib.nullcontext()
+
+    def get_replica_count(self) -> int:
+        """
+        Gets the number of replicas trained in sync.
+
+        :return: Replicas of the distribution strategy, 1 without one
+        :rtype: int
+        """
+
+        strategy = self.get_distribution_strategy()
+        return strategy.num_replicas_in_sync if strategy is not None else 1
+
+    def get_batch_size(self) -> int:
+        """
+        Gets the global batch size. parameters.batch_size is per replica when parameters.scale_with_replicas is set.
+
+        :return: Number of examples per training step across all replicas
+        :rtype: int
+        """
+
+        if self.parameters.scale_with_replicas:
+            return self.parameters.batch_size * self.get_replica_count()
+
+        return self.parameters.batch_size
+
     def init_tpu(self):
 
         """ Initializes Google's Tensor Processing Unit.
@@ -1,4 +1,5 @@
-import matplotlib.pyplot as plt
+import os
+import sys
 from os import listdir
 from os.path import isfile, join
 import datetime
@@ -8,20 +9,28 @@ from nltk import classify
 from nltk import NaiveBayesClassifier
 from nltk.tokenize import ToktokTokenizer
 import numpy as np
-from nltk.tag import pos_tag
 from nltk import FreqDist
 from nltk.corpus import stopwords
-from nltk.corpus import wordnet
-from sklearn.model_selection import train_test_split
-from sklearn import preprocessing
-import tensorflow as tf
-from tensorflow.python.keras import backend as kb
-import transformers
+from nltk.corpus.reader import wordnet as wordnet_reader
 import string
 import re
+import functools
+import hashlib
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import math
 import warnings
-from utilities import Utils
+from utilities import Utils, LazyModule
+
+
+# The ML stack is only imported when a model building, training, or predicting function is called
+plt = LazyModule('matplotlib.pyplot')
+model_selection = LazyModule('sklearn.model_selection')
+preprocessing = LazyModule('sklearn.preprocessing')
+tf = LazyModule('tensorflow')
+kb = LazyModule('tensorflow.python.keras.backend')
+transformers = LazyModule('transformers')
 
 
 """NLPSentimentCalculations
@@ -36,30 +45,719 @@ Date: April 22, 2021
 """
 
 
+class NltkResources:
+    """Process-wide NLTK resources. Resources are only checked on the local NLTK data path, never downloaded, and are
+    loaded on first use and then shared by everything in the process. Provision a machine once with prefetch, or run
+    this module with the prefetch command.
+    """
+
+    # Resource name to the local paths it can be found under, newer NLTK releases renamed the tagger
+    resource_paths = {'wordnet': ['corpora/wordnet'],
+                      'omw-1.4': ['corpora/omw-1.4'],
+                      'stopwords': ['corpora/stopwords'],
+                      'punkt': ['tokenizers/punkt'],
+                      'averaged_perceptron_tagger': ['taggers/averaged_perceptron_tagger_eng',
+                                                     'taggers/averaged_perceptron_tagger']}
+
+    # Resources needed for sanitization and tagging, see prefetch
+    common_resources = ['wordnet', 'omw-1.4', 'stopwords', 'punkt', 'averaged_perceptron_tagger',
+                        'averaged_perceptron_tagger_eng']
+
+    found_resources = set()
+    stop_words = None
+    lemmatizer = None
+
+    @staticmethod
+    def is_installed(name):
+
+        """Checks whether an NLTK resource is installed on the local NLTK data path.
+
+        :param name: Name of the NLTK resource
+        :type name: str
+
+        :return: Whether the resource can be loaded without a download
+        :rtype: bool
+        """
+
+        for resource_path in NltkResources.resource_paths.get(name, [name]):
+            try:
+                nltk.data.find(resource_path)
+                return True
+            except LookupError:
+                continue
+
+        return False
+
+    @staticmethod
+    def require(name):
+
+        """Makes sure an NLTK resource is installed locally. Only checks the data path the first time it is called for a
+        resource.
+
+        :param name: Name of the NLTK resource
+        :type name: str
+
+        :raises LookupError: If the resource is not installed
+        """
+
+        if name in NltkResources.found_resources:
+            return
+
+        if not NltkResources.is_installed(name):
+            raise LookupError(f'NLTK resource {name} is not installed. Provision it with '
+                              f'"python NLPSentimentCalculations.py prefetch".')
+
+        NltkResources.found_resources.add(name)
+
+    @staticmethod
+    def get_stop_words():
+
+        """Gets the shared set of English stop words, loading them on first use.
+
+        :return: Set of English stop words
+        :rtype: frozenset(str)
+        """
+
+        if NltkResources.stop_words is None:
+            NltkResources.require('stopwords')
+            NltkResources.stop_words = frozenset(stopwords.words('english'))
+
+        return NltkResources.stop_words
+
+    @staticmethod
+    def get_lemmatizer():
+
+        """Gets the shared WordNet lemmatizer, checking for WordNet on first use.
+
+        :return: WordNet lemmatizer
+        :rtype: nltk.WordNetLemmatizer
+        """
+
+        if NltkResources.lemmatizer is None:
+            NltkResources.require('wordnet')
+            NltkResources.require('omw-1.4')
+            NltkResources.lemmatizer = nltk.WordNetLemmatizer()
+
+        return NltkResources.lemmatizer
+
+    @staticmethod
+    def require_tagger():
+
+        """Makes sure the perceptron POS tagger is installed locally before tagging.
+        """
+
+        NltkResources.require('averaged_perceptron_tagger')
+
+    @staticmethod
+    def prefetch(download_dir=None):
+
+        """Downloads every NLTK resource used for sanitization and tagging. Needs network, meant to be run once when
+        provisioning a machine rather than at runtime.
+
+        :param download_dir: Directory to download to; defaults to the NLTK default data directory
+        :type download_dir: str
+
+        :return: Whether every resource is installed afterwards
+        :rtype: bool
+        """
+
+        # Older NLTK releases do not know the renamed tagger, so failed downloads are not fatal on their own
+        for name in NltkResources.common_resources:
+            nltk.download(name, download_dir=download_dir)
+
+        if download_dir and download_dir not in nltk.data.path:
+            nltk.data.path.append(download_dir)
+
+        return all(NltkResources.is_installed(name) for name in NltkResources.resource_paths)
+
+
+class TextSanitizer:
+    """Reusable text sanitization pipeline. Holds precompiled patterns, the stop word set, and the tokenizer and
+    lemmatizer instances so that they are built once instead of on every sanitized string or token.
+    """
+
+    url_string_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_.&+#]|[!*\(\),]|'
+                                    r'(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+    url_token_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+#]|[!*\(\),]|'
+                                   r'(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+    mention_pattern = re.compile(r'(@[A-Za-z0-9_]+)')
+    non_alpha_pattern = re.compile(r'[^a-zA-Z]')
+    whitespace_pattern = re.compile(r'\s+')
+
+    wordnet_tags = {'J': wordnet_reader.ADJ,
+                    'N': wordnet_reader.NOUN,
+                    'V': wordnet_reader.VERB,
+                    'R': wordnet_reader.ADV}
+
+    # Identifies the sanitized output for persistent caches and saved models, bump whenever the output of the pipeline
+    # changes. Version 0 is per word POS tagging, which models saved before versions were recorded were trained on.
+    version = '1'
+    per_word_version = '0'
+
+    # Minimum number of texts before sanitize_many spreads work over a process pool
+    default_parallel_threshold = 10000
+
+    # Worker processes sanitize_many starts when no count is given
+    default_max_workers = 4
+
+    # Sanitizer owned by a process pool worker, see init_worker
+    worker_sanitizer = None
+
+    def __init__(self, lemma_cache_size=65536, per_word=False):
+
+        """Constructor method, creates the shared tokenizer and the lemmatization caches. NLTK resources are not loaded
+        until the first text is sanitized, see NltkResources.
+
+        :param lemma_cache_size: Maximum number of (word, POS) lemmatizations and word POS tags to memoize. 0 disables
+                                 the caches.
+        :type lemma_cache_size: int
+        :param per_word: Whether batches are POS tagged word by word like sanitize_text_string, which reproduces the
+                         tokens of models trained before sentence tagging (per_word_version)
+        :type per_word: bool
+        """
+
+        self.lemma_cache_size = lemma_cache_size
+        self.per_word = per_word
+        self.version = TextSanitizer.per_word_version if per_word else TextSanitizer.version
+        self.tokenizer = ToktokTokenizer()
+
+        # Bounded memoization, tweet vocabulary is very repetitive so most lookups hit
+        self.lemmatize = functools.lru_cache(maxsize=lemma_cache_size)(TextSanitizer.lemmatize_word)
+        self.get_word_pos = functools.lru_cache(maxsize=lemma_cache_size)(TextSanitizer.get_wordnet_pos)
+
+    @property
+    def stop_words(self):
+
+        """Shared set of English stop words, see NltkResources::get_stop_words.
+        """
+
+        return NltkResources.get_stop_words()
+
+    @property
+    def lemmatizer(self):
+
+        """Shared WordNet lemmatizer, see NltkResources::get_lemmatizer.
+        """
+
+        return NltkResources.get_lemmatizer()
+
+    @staticmethod
+    def lemmatize_word(word, pos=wordnet_reader.NOUN):
+
+        """Lemmatizes a word with the shared WordNet lemmatizer.
+
+        :param word: Word to lemmatize
+        :type word: str
+        :param pos: WordNet POS of the word; defaults to noun
+        :type pos: str
+
+        :return: Lemma of the word
+        :rtype: str
+        """
+
+        return NltkResources.get_lemmatizer().lemmatize(word, pos)
+
+    @staticmethod
+    def get_wordnet_pos(word):
+
+        """Map POS tag to first character lemmatize() accepts"""
+
+        NltkResources.require_tagger()
+        tag = nltk.pos_tag([word])[0][1]
+
+        return TextSanitizer.get_wordnet_tag(tag)
+
+    @staticmethod
+    def get_wordnet_tag(treebank_tag):
+
+        """Maps a Penn Treebank POS tag to the WordNet POS that lemmatize() accepts. Defaults to noun.
+
+        :param treebank_tag: POS tag from the NLTK tagger
+        :type treebank_tag: str
+
+        :return: WordNet POS character
+        :rtype: str
+        """
+
+        return TextSanitizer.wordnet_tags.get(treebank_tag[0].upper(), wordnet_reader.NOUN)
+
+    def get_lemma_cache_info(self):
+
+        """Gets the hit and miss statistics of the lemmatization and POS caches.
+
+        :return: Dictionary of cache names to their statistics
+        :rtype: dict(str-> functools._CacheInfo)
+        """
+
+        return {'lemmatize': self.lemmatize.cache_info(), 'word_pos': self.get_word_pos.cache_info()}
+
+    def pre_clean_text(self, sen):
+
+        """Removes URLs, mentions, and non-alphabetic characters from a string, collapses whitespace, and lowercases it.
+
+        :param sen: Text to be cleaned
+        :type sen: str
+
+        :return: Pre-cleaned text, empty if the input is not a string
+        :rtype: str
+        """
+
+        if type(sen) != str:
+            return ''
+
+        sentence = self.url_string_pattern.sub('', sen)
+        sentence = self.mention_pattern.sub('', sentence)
+        sentence = self.non_alpha_pattern.sub(' ', sentence)
+        sentence = self.whitespace_pattern.sub(' ', sentence)
+
+        return sentence.lower()
+
+    def pre_clean_series(self, texts):
+
+        """Column oriented version of pre_clean_text. Applies every regex stage with vectorized pandas string
+        operations over the whole column instead of per string.
+
+        :param texts: Column of texts to be cleaned
+        :type texts: pandas.Series
+
+        :return: Column of pre-cleaned texts with the same index, empty where the input is not a string
+        :rtype: pandas.Series
+        """
+
+        is_text = texts.map(lambda t: type(t) == str).astype(bool)
+
+        cleaned = texts.where(is_text, '').astype(object)
+        cleaned = cleaned.str.replace(self.url_string_pattern, '', regex=True)
+        cleaned = cleaned.str.replace(self.mention_pattern, '', regex=True)
+        cleaned = cleaned.str.replace(self.non_alpha_pattern, ' ', regex=True)
+        cleaned = cleaned.str.replace(self.whitespace_pattern, ' ', regex=True)
+
+        return cleaned.str.lower()
+
+    def pre_clean_dataframe(self, df, text_column='full_text', clean_column='pre_clean_text'):
+
+        """Pre-cleans the text column of a tweet dataframe, such as the output of Utils.parse_json_tweet_data, in one
+        vectorized pass. The result is stored in a new column, ready for sanitize_pre_cleaned_strings.
+
+        :param df: Dataframe of tweets
+        :type df: pandas.DataFrame
+        :param text_column: Column of raw texts; defaults to full_text
+        :type text_column: str
+        :param clean_column: Column to write the pre-cleaned texts to; defaults to pre_clean_text
+        :type clean_column: str
+
+        :return: The dataframe with the pre-cleaned column added
+        :rtype: pandas.DataFrame
+        """
+
+        df[clean_column] = self.pre_clean_series(df[text_column])
+
+        return df
+
+    def get_clean_words(self, sen, pre_cleaned=False):
+
+        """Removes URLs, mentions, non-alphabetic characters, and stop words from a string and splits it into lowercase
+        words. Words are not yet lemmatized.
+
+        :param sen: Text to be cleaned
+        :type sen: str
+        :param pre_cleaned: Flag for text that already went through pre_clean_text or pre_clean_series
+        :type pre_cleaned: bool
+
+        :return: List of clean words, empty if the input is not a string
+        :rtype: list(str)
+        """
+
+        if not pre_cleaned:
+            sen = self.pre_clean_text(sen)
+
+        sentence = self.tokenizer.tokenize(sen)
+        stop_words = self.stop_words
+
+        return [word for word in sentence if word not in stop_words and word not in string.punctuation]
+
+    def sanitize_text_string(self, sen):
+
+        """Cleans a string of text by removing URLs, mentions, non-alphabetic characters, and stop words, then
+        lemmatizes each remaining word.
+
+        :param sen: Text to be sanitized
+        :type sen: str
+
+        :return: Space separated string of clean words, empty if the input is not a string
+        :rtype: str
+        """
+
+        # @TODO Remove AMP
+
+        sentence = self.get_clean_words(sen)
+        sentence = [self.lemmatize(word, self.get_word_pos(word)) for word in sentence]
+
+        return ' '.join(sentence)
+
+    def sanitize_text_strings(self, sentences):
+
+        """Batched version of sanitize_text_string. Every sentence is POS tagged as a whole with a single
+        nltk.pos_tag_sents call, so words are tagged with their sentence context, and lemmatization goes through the
+        (word, POS) cache. The regex stages run over the whole batch at once with pre_clean_series.
+
+        Tagging in context changes some lemmas, so the output differs from sanitize_text_string for some texts. A
+        sanitizer created with per_word tags word by word instead and matches sanitize_text_string.
+
+        :param sentences: Texts to be sanitized
+        :type sentences: list(str)
+
+        :return: List of space separated strings of clean words, in the same order as the input
+        :rtype: list(str)
+        """
+
+        return self.sanitize_pre_cleaned_strings(self.pre_clean_series(pd.Series(list(sentences), dtype=object)))
+
+    def sanitize_pre_cleaned_strings(self, pre_cleaned):
+
+        """Runs the per-row tail of sanitization (tokenizing, stop word removal, and batched POS tagging and
+        lemmatization) on texts that were already pre-cleaned with pre_clean_series or pre_clean_dataframe.
+
+        :param pre_cleaned: Pre-cleaned texts
+        :type pre_cleaned: list(str) or pandas.Series
+
+        :return: List of space separated strings of clean words, in the same order as the input
+        :rtype: list(str)
+        """
+
+        clean_sentences = [self.get_clean_words(sen, pre_cleaned=True) for sen in pre_cleaned]
+
+        if self.per_word:
+            return [' '.join(self.lemmatize(word, self.get_word_pos(word)) for word in sentence)
+                    for sentence in clean_sentences]
+
+        NltkResources.require_tagger()
+
+        return [' '.join(self.lemmatize(word, self.get_wordnet_tag(tag)) for word, tag in tagged)
+                for tagged in nltk.pos_tag_sents(clean_sentences)]
+
+    def sanitize_many(self, texts, workers=None, chunksize=None, min_parallel_size=None):
+
+        """Sanitizes a large collection of texts by splitting it into chunks and spreading the chunks over a process
+        pool. Each worker loads the NLTK resources once and sanitizes its chunks with sanitize_text_strings. Results are
+        returned in input order. Collections smaller than min_parallel_size, or a single worker, are sanitized in this
+        process instead. Workers are spawned rather than forked, so it is safe to call from processes running
+        TensorFlow or threads, but spawned workers import the calling script, which needs an if __name__ == '__main__'
+        guard. Workers search the NLTK data directories of this process, including ones added by
+        NltkResources.prefetch.
+
+        :param texts: Texts to be sanitized
+        :type texts: list(str)
+        :param workers: Number of worker processes; defaults to the number of cores, at most
+                        TextSanitizer.default_max_workers
+        :type workers: int
+        :param chunksize: Number of texts sent to a worker at a time; defaults to splitting the texts into 4 chunks per
+                          worker
+        :type chunksize: int
+        :param min_parallel_size: Minimum number of texts to use the process pool; defaults to
+                                  TextSanitizer.default_parallel_threshold
+        :type min_parallel_size: int
+
+        :return: List of space separated strings of clean words, in the same order as the input
+        :rtype: list(str)
+        """
+
+        texts = list(texts)
+
+        if not workers:
+            workers = min(os.cpu_count() or 1, TextSanitizer.default_max_workers)
+        if min_parallel_size is None:
+            min_parallel_size = TextSanitizer.default_parallel_threshold
+
+        if workers < 2 or len(texts) < max(min_parallel_size, 2):
+            return self.sanitize_text_strings(texts)
+
+        if not chunksize:
+            chunksize = math.ceil(len(texts) / (workers * 4))
+
+        chunks = Utils.segment_list(texts, chunksize)
+        workers = min(workers, len(chunks))
+
+        # Spawn, since forking a process with TensorFlow or server threads running can deadlock the workers
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=TextSanitizer.init_worker,
+                                 initargs=(self.lemma_cache_size, self.per_word, list(nltk.data.path))) as executor:
+            return Utils.flatten(executor.map(TextSanitizer.sanitize_chunk, chunks))
+
+    @staticmethod
+    def init_worker(lemma_cache_size, per_word=False, nltk_data_path=None):
+
+        """Process pool initializer, creates the sanitizer a worker uses for all of its chunks.
+
+        :param lemma_cache_size: Lemma cache size of the worker sanitizer
+        :type lemma_cache_size: int
+        :param per_word: Whether the worker sanitizer POS tags word by word
+        :type per_word: bool
+        :param nltk_data_path: NLTK data directories of the parent process, which spawned workers do not inherit
+        :type nltk_data_path: list(str)
+        """
+
+        for directory in nltk_data_path or []:
+            if directory not in nltk.data.path:
+                nltk.data.path.append(directory)
+
+        TextSanitizer.worker_sanitizer = TextSanitizer(lemma_cache_size, per_word=per_word)
+
+        # Load the tagger and WordNet once, before the first chunk arrives
+        TextSanitizer.worker_sanitizer.sanitize_text_strings(['loading resources'])
+
+    @staticmethod
+    def sanitize_chunk(texts):
+
+        """Sanitizes one chunk of texts in a process pool worker.
+
+        :param texts: Texts to be sanitized
+        :type texts: list(str)
+
+        :return: List of space separated strings of clean words
+        :rtype: list(str)
+        """
+
+        return TextSanitizer.worker_sanitizer.sanitize_text_strings(texts)
+
+    def sanitize_text_tokens(self, tweet_tokens):
+
+        """Cleans text data by removing bad punctuation, emojies, and lematizes.
+
+        :param tweet_tokens: A list of tokens
+        :type tweet_tokens: list(str)
+
+        :return: A list of clean tokens
+        :rtype: list(str)
+        """
+
+        cleaned_tokens = []
+        stop_words = self.stop_words
+
+        for token in tweet_tokens:
+
+            token = self.url_token_pattern.sub('', token)
+            token = self.mention_pattern.sub('', token)
+
+            token = self.lemmatize(token)
+
+            if len(token) > 0 and token not in string.punctuation and token.lower() not in stop_words:
+                cleaned_tokens.append(token.lower())
+
+        return cleaned_tokens
+
+
+class GloveVectorStore:
+    """Binary store of a GloVe text embedding file. The text file is converted once to a .npy matrix and a json
+    vocabulary next to it; afterwards the matrix is memory-mapped so only the rows of words in a tokenizer vocabulary
+    are ever read.
+    """
+
+    def __init__(self, text_file='../data/Learning Data/GloVe/glove.6B/glove.6B.100d.txt', dtype='float32'):
+
+        """Constructor method, does not read or convert anything.
+
+        :param text_file: Filepath for the GloVe pre-trained embeddings text file
+        :type text_file: str
+        :param dtype: Data type of the stored matrix, float16 halves the footprint of float32
+        :type dtype: str
+        """
+
+        self.text_file = text_file
+        self.dtype = np.dtype(dtype)
+
+        base = os.path.splitext(text_file)[0]
+        self.matrix_file = f'{base}.{self.dtype.name}.npy'
+        self.vocab_file = f'{base}.vocab.json'
+
+    def is_converted(self):
+
+        """Checks if the binary store exists and is not older than the text file.
+
+        :return: True if the text file does not have to be converted
+        :rtype: bool
+        """
+
+        if not (os.path.exists(self.matrix_file) and os.path.exists(self.vocab_file)):
+            return False
+
+        if not os.path.exists(self.text_file):
+            return True
+
+        text_mtime = os.path.getmtime(self.text_file)
+        return os.path.getmtime(self.matrix_file) >= text_mtime and os.path.getmtime(self.vocab_file) >= text_mtime
+
+    def convert(self):
+
+        """Parses the text file once into the binary store. Vectors are written straight into a memory-mapped .npy
+        file, and both files are renamed into place only when complete.
+        """
+
+        with open(self.text_file, encoding='utf8') as gf:
+            first = gf.readline().rstrip().split(' ')
+            rows = 1 + sum(1 for _ in gf)
+
+        dimensions = len(first) - 1
+        words = []
+
+        matrix_tmp = f'{self.matrix_file}.tmp.npy'
+        matrix = np.lib.format.open_memmap(matrix_tmp, mode='w+', dtype=self.dtype, shape=(rows, dimensions))
+
+        with open(self.text_file, encoding='utf8') as gf:
+
+            for row, line in enumerate(gf):
+                records = line.rstrip().split(' ')
+
+                # A few GloVe releases have tokens containing spaces, the vector is always the last columns
+                words.append(' '.join(records[:-dimensions]))
+                matrix[row] = np.asarray(records[-dimensions:], dtype='float32')
+
+        matrix.flush()
+        del matrix
+
+        vocab_tmp = f'{self.vocab_file}.tmp'
+        with open(vocab_tmp, 'w', encoding='utf8') as f:
+            json.dump(words, f)
+
+        os.replace(matrix_tmp, self.matrix_file)
+        os.replace(vocab_tmp, self.vocab_file)
+
+    def load(self):
+
+        """Opens the binary store, converting the text file first if needed.
+
+        :return: Tuple of the memory-mapped matrix and a dictionary of word to matrix row
+        :rtype: tuple(np.memmap, dict(str-> int))
+        """
+
+        if not self.is_converted():
+            self.convert()
+
+        with open(self.vocab_file, encoding='utf8') as f:
+            words = json.load(f)
+
+        return np.load(self.matrix_file, mmap_mode='r'), {word: row for row, word in enumerate(words)}
+
+    def build_embedding_matrix(self, word_index):
+
+        """Gathers the rows of the words in a tokenizer vocabulary into an embedding matrix. Row 0 and words without a
+        pre-trained vector are zeros.
+
+        :param word_index: Tokenizer dictionary of word to index
+        :type word_index: dict(str-> int)
+
+        :return: A 2D array of pre-trained embedding weights
+        :rtype: np.array(np.array(float))
+        """
+
+        vectors, vocab = self.load()
+
+        indices = []
+        rows = []
+        for word, index in word_index.items():
+            row = vocab.get(word)
+            if row is not None:
+                indices.append(index)
+                rows.append(row)
+
+        embedding_matrix = np.zeros((len(word_index) + 1, vectors.shape[1]), dtype='float32')
+
+        # Read the memory map in file order so the needed pages are touched sequentially
+        order = np.argsort(rows)
+        embedding_matrix[np.asarray(indices, dtype=int)[order]] = vectors[np.asarray(rows, dtype=int)[order]]
+
+        return embedding_matrix
+
+    def get_fingerprint(self, word_index):
+
+        """Hashes a tokenizer vocabulary together with the identity of the GloVe file it would be embedded with.
+
+        :param word_index: Tokenizer dictionary of word to index
+        :type word_index: dict(str-> int)
+
+        :return: Hex digest identifying the embedding matrix built from word_index
+        :rtype: str
+        """
+
+        source = self.text_file if os.path.exists(self.text_file) else self.matrix_file
+        stat = os.stat(source)
+
+        fingerprint = hashlib.sha1()
+        fingerprint.update(json.dumps([os.path.abspath(source), stat.st_size, stat.st_mtime_ns,
+                                       self.dtype.name]).encode('utf-8'))
+        fingerprint.update(json.dumps(sorted(word_index.items(), key=lambda kv: kv[1])).encode('utf-8'))
+
+        return fingerprint.hexdigest()
+
+    def get_cached_embedding_matrix(self, word_index, cache_dir):
+
+        """Loads the embedding matrix for a tokenizer vocabulary from cache_dir, building and saving it there when the
+        vocabulary or GloVe file have not been seen before.
+
+        :param word_index: Tokenizer dictionary of word to index
+        :type word_index: dict(str-> int)
+        :param cache_dir: Directory of cached embedding matrices
+        :type cache_dir: str
+
+        :return: A 2D array of pre-trained embedding weights
+        :rtype: np.array(np.array(float))
+        """
+
+        cache_file = os.path.join(cache_dir, f'embedding_{self.get_fingerprint(word_index)}.npy')
+        if os.path.exists(cache_file):
+            return np.load(cache_file)
+
+        embedding_matrix = self.build_embedding_matrix(word_index)
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        cache_tmp = f'{cache_file}.tmp.npy'
+        np.save(cache_tmp, embedding_matrix)
+        os.replace(cache_tmp, cache_file)
+
+        return embedding_matrix
+
+
 class NLPSentimentCalculations:
     """Handles any function calls related to NLP classifications.
     """
 
+    text_sanitizer = None
+    per_word_text_sanitizer = None
+
     def __init__(self):
 
-        """Constructor method, downloads necessary NLTK data.
+        """Constructor method. NLTK data is loaded lazily from the local data path, see NltkResources.
         """
 
         self.classifier = None
-        NLPSentimentCalculations.download_nltk_common()
 
-        self.tokenizer = tf.keras.preprocessing.text.Tokenizer()
+        # Default Keras tokenizer is created on first use, so constructing this class does not import tensorflow
+        self.text_tokenizer = None
+
+    @property
+    def tokenizer(self):
+
+        """Tokenizer used to vectorize text. Defaults to a Keras tokenizer.
+        """
+
+        if self.text_tokenizer is None:
+            self.text_tokenizer = tf.keras.preprocessing.text.Tokenizer()
+
+        return self.text_tokenizer
+
+    @tokenizer.setter
+    def tokenizer(self, tokenizer):
+        self.text_tokenizer = tokenizer
 
     @staticmethod
     def download_nltk_common():
 
-        """Downloads specific NLTK data for NLP analysis.
+        """Downloads specific NLTK data for NLP analysis. See NltkResources::prefetch.
         """
 
-        nltk.download('wordnet')  # For determining base words
-        nltk.download('punkt')  # Pretrained model to help with tokenizing
-        nltk.download('averaged_perceptron_tagger')  # For determining word context
-        nltk.download('omw-1.4')  # Multilingual wordnet
+        NltkResources.prefetch()
 
     def train_naivebayes_classifier(self, train_data):
 
@@ -137,43 +835,36 @@ class NLPSentimentCalculations:
 
         return word_count, tf.keras.preprocessing.sequence.pad_sequences(x_sequence, padding='post', maxlen=word_count)
 
-    def create_glove_word_vectors(self, trained_vector_file='../data/Learning Data/GloVe/glove.6B/glove.6B.100d.txt'):
+    def create_glove_word_vectors(self, trained_vector_file='../data/Learning Data/GloVe/glove.6B/glove.6B.100d.txt',
+                                  store_dtype='float32', cache_dir=''):
 
-        """Reads a pre-trained GloVe embedding file and puts them into an embedding matrix, using token word_indices
-        to select word weights.
+        """Reads pre-trained GloVe embeddings and puts them into an embedding matrix, using token word_indices to
+        select word weights. The text file is converted to a memory-mapped binary store on first use, see
+        GloveVectorStore.
 
         :param trained_vector_file: Filepath for the GloVe pre-trained embeddings file.
         :type trained_vector_file: str
+        :param store_dtype: Data type of the binary store, float16 or float32
+        :type store_dtype: str
+        :param cache_dir: Directory to reuse embedding matrices of previously seen vocabularies from, empty to disable
+        :type cache_dir: str
 
         :return: A 2D array of pre-trained embedding weights.
-        :rtype: np.array(np.array(double))
+        :rtype: np.array(np.array(float))
         """
 
-        embeddings_dict = dict()
+        glove_store = GloveVectorStore(trained_vector_file, store_dtype)
 
-        with open(trained_vector_file, encoding='utf8') as gf:
+        if cache_dir:
+            return glove_store.get_cached_embedding_matrix(self.tokenizer.word_index, cache_dir)
 
-            for line in gf:
-                records = line.split()
-                word = records[0]
-                vector_dimensions = np.asarray(records[1:], dtype='float32')
-                embeddings_dict[word] = vector_dimensions
-
-        embedding_matrix = np.zeros((len(self.tokenizer.word_index) + 1, len(embeddings_dict[word])))
-        for word, index in self.tokenizer.word_index.items():
-
-            embedding_vector = embeddings_dict.get(word)
-            if embedding_vector is not None:
-                embedding_matrix[index] = embedding_vector
-
-        return embedding_matrix
+        return glove_store.build_embedding_matrix(self.tokenizer.word_index)
 
     def create_roberta_tokenizer(self):
         self.tokenizer = transformers.AutoTokenizer.from_pretrained('siebert/sentiment-roberta-large-english')
 
-    def create_sentiment_text_model(self, inputs, embedding_mask, output_shape, use_transformers, maxlen):
-
-        dropout_rate = 0.5
+    def create_sentiment_text_model(self, inputs, embedding_mask, output_shape, use_transformers, maxlen,
+                                    dropout_rate=0.5, use_cnn=False):
 
         input_text_layer, out_text_layer = self.create_spam_text_submodel(blocks=5,
                                                                           dropout_rate=dropout_rate,
@@ -182,7 +873,7 @@ class NLPSentimentCalculations:
                                                                           pool_size=2,
                                                                           embedding_mask=embedding_mask,
                                                                           maxlen=maxlen,
-                                                                          use_cnn=False,
+                                                                          use_cnn=use_cnn,
                                                                           use_transformers=use_transformers)
 
         if use_transformers:
@@ -207,7 +898,7 @@ class NLPSentimentCalculations:
         return tf.keras.Model(inputs=input_text_layer, outputs=output_layer)
 
     def create_spam_text_meta_model(self, inputs, embedding_mask, meta_feature_size, output_shape, use_transformers,
-                                    maxlen):
+                                    maxlen, dropout_rate=0.5, use_cnn=False):
 
         """Creates a Tensorflow model that combines a text training model and a meta data training model. If the size
         of the meta features count is 0, will skip the meta model and just return a model for text training.
@@ -233,13 +924,15 @@ class NLPSentimentCalculations:
         :type use_transformers: bool
         :param maxlen: Maximum number of sequences in the input layer for text training.
         :type maxlen: int
+        :param dropout_rate: Percentage of input to drop at Dropout layers.
+        :type dropout_rate: double
+        :param use_cnn: Flag to use Separated CNN for the text model. If false, will use MLP.
+        :type use_cnn: bool
 
         :return: A Tensorflow model
         :rtype: Tensorflow.model
         """
 
-        dropout_rate = 0.5
-
         input_text_layer, out_text_layer = self.create_spam_text_submodel(blocks=5,
                                                                           dropout_rate=dropout_rate,
                                                                           filters=64,
@@ -247,7 +940,7 @@ class NLPSentimentCalculations:
                                                                           pool_size=2,
                                                                           embedding_mask=embedding_mask,
                                                                           maxlen=maxlen,
-                                                                          use_cnn=False,
+                                                                          use_cnn=use_cnn,
                                                                           use_transformers=use_transformers)
 
         if use_transformers:
@@ -412,7 +1105,164 @@ class NLPSentimentCalculations:
         return meta_input_layer, tf.keras.layers.Dense(10, activation='relu', name='MetaOutputLayer')(dense_layer_1)
 
     @staticmethod
-    def create_early_stopping_callback(monitor_stat, monitor_mode='auto', patience=0, min_delta=0):
+    def create_roberta_feature_extractor(feature_type='pooled'):
+
+        """Creates a frozen RoBERTa encoder model that maps token ids and attention masks to fixed size features. Pooled
+        features are the final hidden state of the <s> token, which is what the RoBERTa classification head reads.
+        Logit features are the output of the pre-trained sentiment classification head.
+
+        :param feature_type: Either pooled or logits
+        :type feature_type: str
+
+        :return: A Tensorflow model taking {'input_ids', 'attention_mask'} of any sequence length
+        :rtype: Tensorflow.model
+        """
+
+        input_ids = tf.keras.Input(shape=(None,), dtype='int32', name='EncoderInputIds')
+        attention_mask = tf.keras.Input(shape=(None,), dtype='int32', name='EncoderAttentionMask')
+        encoder_inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+
+        if feature_type == 'logits':
+            rmodel = transformers.TFAutoModelForSequenceClassification.from_pretrained(
+                'siebert/sentiment-roberta-large-english', num_labels=2)
+            features = rmodel(encoder_inputs)[0]
+        elif feature_type == 'pooled':
+            rmodel = transformers.TFAutoModel.from_pretrained('siebert/sentiment-roberta-large-english')
+            features = rmodel(encoder_inputs)[0][:, 0, :]
+        else:
+            raise ValueError(f'Unknown encoder feature type {feature_type}, expected pooled or logits')
+
+        rmodel.trainable = False
+
+        return tf.keras.Model(inputs=encoder_inputs, outputs=features, name='FrozenEncoder')
+
+    @staticmethod
+    def extract_encoder_features(encoder, input_ids, attention_mask, feature_file, batch_size=64):
+
+        """Runs a frozen encoder over token ids in batches and writes the features to a memory-mapped .npy file. Each
+        batch is trimmed to its longest attention mask, so short tweets do not pay for attention over padding.
+
+        :param encoder: Model created by create_roberta_feature_extractor
+        :type encoder: Tensorflow.model
+        :param input_ids: Right padded token ids
+        :type input_ids: np.array(np.array(int))
+        :param attention_mask: Attention mask of input_ids
+        :type attention_mask: np.array(np.array(int))
+        :param feature_file: Path of the .npy file to write
+        :type feature_file: str
+        :param batch_size: Number of texts to encode at once
+        :type batch_size: int
+
+        :return: The memory-mapped features, one row per text
+        :rtype: np.memmap
+        """
+
+        input_ids = np.asarray(input_ids, dtype='int32')
+        attention_mask = np.asarray(attention_mask, dtype='int32')
+
+        # Nothing to encode, such as the test set when test_size is 0
+        if len(input_ids) == 0:
+            np.save(feature_file, np.zeros((0, encoder.output_shape[-1]), dtype='float32'))
+            return np.load(feature_file, mmap_mode='r')
+
+        features = None
+        feature_tmp = f'{feature_file}.tmp.npy'
+
+        for start in range(0, len(input_ids), batch_size):
+
+            end = start + batch_size
+            length = max(int(attention_mask[start:end].sum(axis=1).max()), 1)
+
+            batch_features = encoder({'input_ids': input_ids[start:end, :length],
+                                      'attention_mask': attention_mask[start:end, :length]}, training=False).numpy()
+
+            if features is None:
+                features = np.lib.format.open_memmap(feature_tmp, mode='w+', dtype='float32',
+                                                     shape=(len(input_ids), batch_features.shape[1]))
+
+            features[start:end] = batch_features
+
+        features.flush()
+        del features
+        os.replace(feature_tmp, feature_file)
+
+        return np.load(feature_file, mmap_mode='r')
+
+    @staticmethod
+    def create_frozen_encoder_head_model(feature_size, meta_feature_size, output_shape, dropout_rate=0.5):
+
+        """Creates the small model trained over precomputed encoder features. If meta_feature_size is not 0, the meta
+        data MLP is concatenated to the feature layers like in create_spam_text_meta_model.
+
+        :param feature_size: Number of encoder features per text
+        :type feature_size: int
+        :param meta_feature_size: Number of meta features to train. If 0, will skip meta model.
+        :type meta_feature_size: int
+        :param output_shape: Shape of the output layer results.
+        :type output_shape: tuple(int, int)
+        :param dropout_rate: Percentage of input to drop at Dropout layers.
+        :type dropout_rate: double
+
+        :return: A Tensorflow model taking features, or [features, meta features]
+        :rtype: Tensorflow.model
+        """
+
+        feature_input_layer = tf.keras.layers.Input(shape=(feature_size,), name='EncoderFeatureInputLayer')
+        dense_layer = tf.keras.layers.Dense(64, activation='relu', name='EncoderFeatureDenseLayer')(feature_input_layer)
+        out_text_layer = tf.keras.layers.Dropout(rate=dropout_rate, name='EncoderFeatureDropoutLayer')(dense_layer)
+
+        if meta_feature_size < 1:
+
+            output_layer = tf.keras.layers.Dense(output_shape[1], activation='softmax',
+                                                 name='NoMetaOutputLayer')(out_text_layer)
+
+            return tf.keras.Model(inputs=feature_input_layer, outputs=output_layer, name='EncoderHead')
+
+        input_meta_layer, dense_meta_layer = NLPSentimentCalculations.create_spam_meta_submodel(meta_feature_size)
+
+        concat_layer = tf.keras.layers.Concatenate(name='TextMetaConcateLayer')([out_text_layer, dense_meta_layer])
+
+        dense_concat = tf.keras.layers.Dense(10, activation='relu', name='ConcatDenseLayer')(concat_layer)
+
+        drop = tf.keras.layers.Dropout(rate=dropout_rate, name='ConcatDropoutLayer')(dense_concat)
+
+        output_layer = tf.keras.layers.Dense(output_shape[1], activation='softmax', name='ConcatOutputLayer')(drop)
+
+        return tf.keras.Model(inputs=[feature_input_layer, input_meta_layer], outputs=output_layer, name='EncoderHead')
+
+    @staticmethod
+    def create_frozen_encoder_model(encoder, head, meta_feature_size):
+
+        """Chains a frozen encoder and a head trained on its features into one model that takes the same inputs as the
+        fine-tuned transformer models, so it can be used for prediction directly.
+
+        :param encoder: Model created by create_roberta_feature_extractor
+        :type encoder: Tensorflow.model
+        :param head: Model created by create_frozen_encoder_head_model
+        :type head: Tensorflow.model
+        :param meta_feature_size: Number of meta features the head was trained on
+        :type meta_feature_size: int
+
+        :return: A Tensorflow model
+        :rtype: Tensorflow.model
+        """
+
+        input_text_layer = tf.keras.layers.Input(shape=(None,), dtype='int32', name='TransformerInputLayer')
+        attention_mask = tf.keras.Input(shape=(None,), dtype='int32', name='TransformerAttentionMask')
+        input_text_layer = {'input_ids': input_text_layer, 'attention_mask': attention_mask}
+
+        features = encoder(input_text_layer)
+
+        if meta_feature_size < 1:
+            return tf.keras.Model(inputs=input_text_layer, outputs=head(features))
+
+        input_meta_layer = tf.keras.layers.Input(shape=(meta_feature_size,), name='MetaInputLayer')
+
+        return tf.keras.Model(inputs=[input_text_layer, input_meta_layer], outputs=head([features, input_meta_layer]))
+
+    @staticmethod
+    def create_early_stopping_callback(monitor_stat, monitor_mode='auto', patience=0, min_delta=0,
+                                       restore_best_weights=False):
 
         """Creates a callback for a Tensorflow object, that will trigger early stopping of a model based on conditions.
         Can set the metric to monitor, the amount of patience, and the minimum change required.
@@ -430,13 +1280,16 @@ class NLPSentimentCalculations:
         :type patience: int
         :param min_delta: Size difference for the metric to be considered improving.
         :type min_delta: double
+        :param restore_best_weights: Whether to restore the weights of the best epoch when training stops.
+        :type restore_best_weights: bool
 
         :return: A callback for early stopping.
         :rtype: Tensorflow.callback
         """
 
         return tf.keras.callbacks.EarlyStopping(monitor=monitor_stat, mode=monitor_mode, verbose=1,
-                                                patience=patience, min_delta=min_delta)
+                                                patience=patience, min_delta=min_delta,
+                                                restore_best_weights=restore_best_weights)
 
     @staticmethod
     def create_model_checkpoint_callback(filepath, monitor_stat, mode='auto'):
@@ -508,7 +1361,8 @@ class NLPSentimentCalculations:
         """
 
         # @TODO update to use any tokenizer, specifically roberta
-        custom_tokens = NLPSentimentCalculations.sanitize_text_tokens(ToktokTokenizer().tokenize(text))
+        text_sanitizer = NLPSentimentCalculations.get_text_sanitizer()
+        custom_tokens = text_sanitizer.sanitize_text_tokens(text_sanitizer.tokenizer.tokenize(text))
         return self.classifier.classify(dict([token, True] for token in custom_tokens))
 
     @staticmethod
@@ -596,77 +1450,85 @@ class NLPSentimentCalculations:
         return [(class_dict, classifier_tag) for class_dict in token_tags]
 
     @staticmethod
-    def get_wordnet_pos(word):
+    def get_text_sanitizer(version=None):
 
-        """Map POS tag to first character lemmatize() accepts"""
-
-        tag = nltk.pos_tag([word])[0][1][0].upper()
-        tag_dict = {"J": wordnet.ADJ,
-                    "N": wordnet.NOUN,
-                    "V": wordnet.VERB,
-                    "R": wordnet.ADV}
-
-        return tag_dict.get(tag, wordnet.NOUN)
+        """Gets the shared text sanitizer, creating it on first use.
 
-    @staticmethod
-    def sanitize_text_string(sen):
+        :param version: TextSanitizer.per_word_version for the per word sanitizer, otherwise the current one
+        :type version: str
 
-        # @TODO Remove AMP
+        :return: The shared text sanitizer
+        :rtype: TextSanitizer
+        """
 
-        if type(sen) != str:
-            return ''
+        if version == TextSanitizer.per_word_version:
+            if NLPSentimentCalculations.per_word_text_sanitizer is None:
+                NLPSentimentCalculations.per_word_text_sanitizer = TextSanitizer(per_word=True)
 
-        sentence = re.sub('http[s]?://(?:[a-zA-Z]|[0-9]|[$-_.&+#]|[!*\(\),]|' \
-                          '(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', sen)
+            return NLPSentimentCalculations.per_word_text_sanitizer
 
-        sentence = re.sub("(@[A-Za-z0-9_]+)", "", sentence)
+        if NLPSentimentCalculations.text_sanitizer is None:
+            NLPSentimentCalculations.text_sanitizer = TextSanitizer()
 
-        sentence = re.sub('[^a-zA-Z]', ' ', sentence)
+        return NLPSentimentCalculations.text_sanitizer
 
-        sentence = re.sub(r'\s+', ' ', sentence)
+    @staticmethod
+    def get_wordnet_pos(word):
 
-        sentence = ToktokTokenizer().tokenize(sentence.lower())
+        """Map POS tag to first character lemmatize() accepts"""
 
-        stop_words = stopwords.words('english')
-        sentence = [word for word in sentence if word not in stop_words and word not in string.punctuation]
+        return TextSanitizer.get_wordnet_pos(word)
 
-        wn = nltk.WordNetLemmatizer()
-        sentence = [wn.lemmatize(word, NLPSentimentCalculations.get_wordnet_pos(word)) for word in sentence]
+    @staticmethod
+    def sanitize_many(texts, workers=None, chunksize=None, min_parallel_size=None):
+
+        """Sanitizes a large collection of texts over a process pool using the shared text sanitizer. See
+        TextSanitizer::sanitize_many.
+
+        :param texts: Texts to be sanitized
+        :type texts: list(str)
+        :param workers: Number of worker processes; defaults to the number of cores, at most
+                        TextSanitizer.default_max_workers
+        :type workers: int
+        :param chunksize: Number of texts sent to a worker at a time
+        :type chunksize: int
+        :param min_parallel_size: Minimum number of texts to use the process pool
+        :type min_parallel_size: int
+
+        :return: List of space separated strings of clean words, in the same order as the input
+        :rtype: list(str)
+        """
 
-        if len(sentence) > 0:
-            return ' '.join(sentence)
-        else:
-            return ''
+        return NLPSentimentCalculations.get_text_sanitizer().sanitize_many(texts, workers=workers, chunksize=chunksize,
+                                                                           min_parallel_size=min_parallel_size)
 
     @staticmethod
-    def sanitize_text_tokens(tweet_tokens):
+    def sanitize_text_string(sen):
 
-        """Cleans text data by removing bad punctuation, emojies, and lematizes.
+        """Cleans a string of text using the shared text sanitizer. See TextSanitizer::sanitize_text_string.
 
-        :param tweet_tokens: A list of lists of tokens
-        :type tweet_tokens: list(list(str))
+        :param sen: Text to be sanitized
+        :type sen: str
 
-        :return: A list of tuples of dictionaries of feature mappings to classifiers
-        :rtype: list(dict(str-> bool), str)
+        :return: Space separated string of clean words, empty if the input is not a string
+        :rtype: str
         """
 
-        cleaned_tokens = []
-
-        for token, _ in pos_tag(tweet_tokens):
+        return NLPSentimentCalculations.get_text_sanitizer().sanitize_text_string(sen)
 
-            token = re.sub('http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+#]|[!*\(\),]|' \
-                           '(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', token)
-            token = re.sub("(@[A-Za-z0-9_]+)", "", token)
+    @staticmethod
+    def sanitize_text_tokens(tweet_tokens):
 
-            wn = nltk.WordNetLemmatizer()
-            token = wn.lemmatize(token)
+        """Cleans text data by removing bad punctuation, emojies, and lematizes.
 
-            stop_words = stopwords.words('english')
+        :param tweet_tokens: A list of tokens
+        :type tweet_tokens: list(str)
 
-            if len(token) > 0 and token not in string.punctuation and token.lower() not in stop_words:
-                cleaned_tokens.append(token.lower())
+        :return: A list of clean tokens
+        :rtype: list(str)
+        """
 
-        return cleaned_tokens
+        return NLPSentimentCalculations.get_text_sanitizer().sanitize_text_tokens(tweet_tokens)
 
     @staticmethod
     def remove_punctuation(text):
@@ -763,12 +1625,13 @@ class NLPSentimentCalculations:
             y_a = [y[i] for i in aug]
             y = [y[i] for i in non_aug]
             true_ts = test_size * len(augmented_states) / len(non_aug)
-            x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=true_ts, random_state=random_state)
+            x_train, x_test, y_train, y_test = model_selection.train_test_split(x, y, test_size=true_ts,
+                                                                                random_state=random_state)
             x_train = pd.concat([x_train, x_a])
             y_train = y_train + y_a
             return x_train, x_test, y_train, y_test
         else:
-            return train_test_split(x, y, test_size=test_size, random_state=random_state)
+            return model_selection.train_test_split(x, y, test_size=test_size, random_state=random_state)
 
     @staticmethod
     def check_units(y_true, y_pred):
@@ -791,7 +1654,6 @@ class NLPSentimentCalculations:
         return y_true, y_pred
 
     @staticmethod
-    @tf.function
     def precision(y_true, y_pred):
 
         """Computes the precision, a metric for multi-label classification of
@@ -815,7 +1677,6 @@ class NLPSentimentCalculations:
         return precision
 
     @staticmethod
-    @tf.function
     def recall(y_true, y_pred):
 
         """Computes the recall, a metric for multi-label classification of
@@ -839,7 +1700,6 @@ class NLPSentimentCalculations:
         return recall
 
     @staticmethod
-    @tf.function
     def mcor(y_true, y_pred):
 
         """Computes the Matthew Correlation Coefficient, the measure of quality of binary classifications.
@@ -1204,6 +2064,19 @@ class NLPSentimentCalculations:
 
 if __name__ == '__main__':
 
+    if len(sys.argv) > 1 and sys.argv[1] == 'prefetch':
+
+        # Provision NLTK data, optionally to a given directory
+        sys.exit(0 if NltkResources.prefetch(sys.argv[2] if len(sys.argv) > 2 else None) else 1)
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'convert-glove':
+
+        # One time conversion of a GloVe text file to the memory-mapped binary store
+        glove_store = GloveVectorStore(*sys.argv[2:4])
+        glove_store.convert()
+        print(f'Wrote {glove_store.matrix_file} and {glove_store.vocab_file}')
+        sys.exit(0)
+
     mypath = '../data/TweetData/Historic SP-100_20220901-20221001'
 
     files = [mypath + '/' + f for f in listdir(mypath) if isfile(join(mypath, f)) if 'Labeled' in f]
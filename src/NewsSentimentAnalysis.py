@@ -9,6 +9,7 @@ from utilities import Utils
 from NLPSentimentCalculations import NLPSentimentCalculations as nSC
 from TwitterModelInterface import TwitterSpamModelInterface as tSPMI
 from TwitterModelInterface import TwitterSentimentModelInterface as tSEMI
+from InferenceClient import InferenceClient, RemoteModel
 from typing import List
 from selenium import webdriver
 from webdriver_manager.chrome import ChromeDriverManager
@@ -240,8 +241,8 @@ class TwitterManager:
             x_test_text_data = pd.DataFrame()
 
         # Clean the textual data
-        x_train_text_clean = [nSC.sanitize_text_string(s) for s in list(x_train_text_data)]
-        x_test_text_clean = [nSC.sanitize_text_string(s) for s in list(x_test_text_data)]
+        x_train_text_clean = nSC.sanitize_many(x_train_text_data)
+        x_test_text_clean = nSC.sanitize_many(x_test_text_data)
 
         # Initialize tokenizer on training data
         self.nsc.tokenizer.fit_on_texts(x_train_text_clean)
@@ -503,7 +504,8 @@ def generate_metrics_file(queries):
 
 
 def main(search_past: bool = False, search_stream: bool = False, train_spam: bool = False, train_sent: bool = False,
-         phrase: str = '', filter_in: list = None, filter_out: list = None, history_count: int = 1000, test_file=''):
+         phrase: str = '', filter_in: list = None, filter_out: list = None, history_count: int = 1000, test_file='',
+         inference_url=''):
 
     """
     :param search_past: Flag for choosing to search past Twitter posts with queries; defaults to False
@@ -522,6 +524,11 @@ def main(search_past: bool = False, search_stream: bool = False, train_spam: boo
     :type filter_out: list(str)
     :param history_count: Number of historical tweets to collect; defaults to 1000
     :type history_count: int
+    :param test_file: Path of the csv of tweets to label, without the .csv extension
+    :type test_file: str
+    :param inference_url: Url of a running InferenceServer to label with instead of loading the models on every
+                          call; defaults to empty string
+    :type inference_url: str
     """
 
     if not filter_in:
@@ -537,18 +544,24 @@ def main(search_past: bool = False, search_stream: bool = False, train_spam: boo
     test_csv = test_file + '.csv'
     test_df = pd.read_csv(test_csv)
 
+    if inference_url:
+        client = InferenceClient(inference_url)
+        spam_model_learning = RemoteModel(client, 'spam')
+        sentiment_model_learning = RemoteModel(client, 'sentiment')
+
     if train_spam:
 
-        spam_model_learning = tSPMI.create_spam_model_to_train(epochs=5000,
-                                                               batch_size=128,
-                                                               features_to_train=['full_text'],
-                                                               load_to_predict=True,
-                                                               checkpoint_model=False,
-                                                               model_h5='../data/analysis/Model Results/'
-                                                                        'Saved Models/best_spam_model.h5',
-                                                               train_data_csv='../data/Learning Data/Spam/'
-                                                                              'spam_train_set.csv',
-                                                               test_size=0.01)
+        if not inference_url:
+            spam_model_learning = tSPMI.create_spam_model_to_train(epochs=5000,
+                                                                   batch_size=128,
+                                                                   features_to_train=['full_text'],
+                                                                   load_to_predict=True,
+                                                                   checkpoint_model=False,
+                                                                   model_h5='../data/analysis/Model Results/'
+                                                                            'Saved Models/best_spam_model.h5',
+                                                                   train_data_csv='../data/Learning Data/Spam/'
+                                                                                  'spam_train_set.csv',
+                                                                   test_size=0.01)
 
         spam_score, spam_score_raw = spam_model_learning.predict(test_csv)
 
@@ -557,19 +570,20 @@ def main(search_past: bool = False, search_stream: bool = False, train_spam: boo
 
     if train_sent:
 
-        sentiment_model_learning = tSEMI.create_sentiment_model_to_train(epochs=5000,
-                                                                         batch_size=128,
-                                                                         features_to_train=['full_text'],
-                                                                         load_to_predict=True,
-                                                                         checkpoint_model=False,
-                                                                         model_h5='../data/analysis/'
-                                                                                  'Model Results/'
-                                                                                  'Saved Models/'
-                                                                                  'best_sentiment_model.h5',
-                                                                         train_data_csv='../data/Learning Data/'
-                                                                                        'Sentiment/'
-                                                                                        'sentiment_train_set.csv',
-                                                                         test_size=0.1)
+        if not inference_url:
+            sentiment_model_learning = tSEMI.create_sentiment_model_to_train(epochs=5000,
+                                                                             batch_size=128,
+                                                                             features_to_train=['full_text'],
+                                                                             load_to_predict=True,
+                                                                             checkpoint_model=False,
+                                                                             model_h5='../data/analysis/'
+                                                                                      'Model Results/'
+                                                                                      'Saved Models/'
+                                                                                      'best_sentiment_model.h5',
+                                                                             train_data_csv='../data/Learning Data/'
+                                                                                            'Sentiment/'
+                                                                                            'sentiment_train_set.csv',
+                                                                             test_size=0.1)
 
         sent_score, sent_score_raw = sentiment_model_learning.predict(test_csv)
 
@@ -627,9 +641,12 @@ if __name__ == '__main__':
         if q in beta_queries:
             queries.append(filename)
 
+    # Url of a running InferenceServer, so the models are loaded once instead of once per file
+    inference_url = ''
+
     for f in queries:
         f = f.replace('.csv', '')
-        main(train_spam=True, train_sent=True, test_file=f)
+        main(train_spam=True, train_sent=True, test_file=f, inference_url=inference_url)
 
     #mdf = nSC.generate_metrics_from_files(queries)
 
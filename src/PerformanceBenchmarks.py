@@ -0,0 +1,359 @@
+import time
+import os
+import sys
+import json
+import subprocess
+import pandas as pd
+from NLPSentimentCalculations import TextSanitizer
+from utilities import Utils, LazyModule
+
+
+tf = LazyModule('tensorflow')
+
+
+"""PerformanceBenchmarks
+
+Description:
+Module for measuring the throughput of the data and model pipelines, so changes to them can be compared before and
+after. Each benchmark prints its results and returns them as a dictionary.
+"""
+
+
+def load_benchmark_tweets(csv='../data/Learning Data/spam_train.csv', count=5000):
+
+    """Loads tweet texts to benchmark on from a saved tweet dataframe csv.
+
+    :param csv: Path to a csv of tweets with a json or full_text column
+    :type csv: str
+    :param count: Maximum number of tweets to load
+    :type count: int
+
+    :return: List of raw tweet texts
+    :rtype: list(str)
+    """
+
+    df = Utils.parse_json_tweet_data_from_csv(csv, ['full_text'])
+    return df['full_text'].head(count).tolist()
+
+
+def time_call(func, *args, **kwargs):
+
+    """Times a single call of a function.
+
+    :param func: Function to time
+    :type func: func
+
+    :return: Tuple of the function result and elapsed wall time in seconds
+    :rtype: tuple(obj, float)
+    """
+
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+
+    return result, time.perf_counter() - start
+
+
+def benchmark_sanitization(texts):
+
+    """Compares tweets/sec of sanitizing with per-word POS tagging and no lemma cache (before) against sentence-level
+    batched POS tagging with the (word, POS) lemma cache (after). Both paths are warmed up on a few texts first with
+    throwaway sanitizers, so neither timing includes loading WordNet and the tagger and the lemma cache starts cold.
+
+    :param texts: Raw tweet texts to sanitize
+    :type texts: list(str)
+
+    :return: Dictionary of tweets/sec before and after, speedup, and lemma cache statistics
+    :rtype: dict(str-> obj)
+    """
+
+    warm_up = texts[:10]
+    [TextSanitizer(lemma_cache_size=0).sanitize_text_string(s) for s in warm_up]
+    TextSanitizer().sanitize_text_strings(warm_up)
+
+    per_word_sanitizer = TextSanitizer(lemma_cache_size=0)
+    _, before_time = time_call(lambda: [per_word_sanitizer.sanitize_text_string(s) for s in texts])
+
+    batched_sanitizer = TextSanitizer()
+    _, after_time = time_call(batched_sanitizer.sanitize_text_strings, texts)
+
+    lemma_info = batched_sanitizer.get_lemma_cache_info()['lemmatize']
+    lookups = max(lemma_info.hits + lemma_info.misses, 1)
+
+    results = {'Tweets': len(texts),
+               'Before Tweets/sec': len(texts) / max(before_time, 1e-9),
+               'After Tweets/sec': len(texts) / max(after_time, 1e-9),
+               'Speedup': before_time / max(after_time, 1e-9),
+               'Lemma Cache Hit Rate': lemma_info.hits / lookups}
+
+    print(pd.DataFrame(results, index=[0]).to_string(index=False))
+
+    return results
+
+
+def parse_import_times(importtime_output):
+
+    """Parses the stderr output of python -X importtime.
+
+    :param importtime_output: Text written to stderr by python -X importtime
+    :type importtime_output: str
+
+    :return: Dictionary of imported module name to its self and cumulative import time in microseconds
+    :rtype: dict(str-> tuple(int, int))
+    """
+
+    times = {}
+    for line in importtime_output.splitlines():
+
+        if not line.startswith('import time:'):
+            continue
+
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # Header line
+
+        times[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+
+    return times
+
+
+def benchmark_import_time(modules=('utilities', 'NLPSentimentCalculations', 'ModelBase', 'TwitterModelInterface'),
+                          results_json='../data/analysis/import_times.json', top=5):
+
+    """Measures the cumulative import time of modules, each in a fresh interpreter with python -X importtime, and
+    compares against the results of the previous run saved in results_json to track the gain over time.
+
+    :param modules: Names of the modules to import, relative to this directory
+    :type modules: list(str)
+    :param results_json: File the results are compared to and then saved in; empty to skip tracking
+    :type results_json: str
+    :param top: Number of slowest nested imports to show per module
+    :type top: int
+
+    :return: Dictionary of module name to cumulative import time in milliseconds, None if the import failed
+    :rtype: dict(str-> float)
+    """
+
+    previous = {}
+    if results_json and os.path.exists(results_json):
+        with open(results_json, 'r') as f:
+            previous = json.load(f)
+
+    results = {}
+    for module in modules:
+
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+
+        times = parse_import_times(proc.stderr)
+        if proc.returncode != 0 or module not in times:
+            print(f'Could not import {module}: {proc.stderr.strip().splitlines()[-1:]}')
+            results[module] = None
+            continue
+
+        results[module] = times[module][1] / 1000
+        change = ''
+        if previous.get(module):
+            change = f' ({results[module] - previous[module]:+.1f} ms from previous run)'
+        print(f'{module}: {results[module]:.1f} ms{change}')
+
+        slowest = sorted(times.items(), key=lambda kv: kv[1][0], reverse=True)[:top]
+        for name, (self_us, _) in slowest:
+            print(f'    {name}: {self_us / 1000:.1f} ms self')
+
+    if results_json:
+        directory = os.path.dirname(results_json)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(results_json, 'w') as f:
+            json.dump({**previous, **results}, f, indent=4)
+
+    return results
+
+
+def time_epochs(model_learning, epochs, use_tf_data=True):
+
+    """Fits a built model for a number of epochs and times each epoch.
+
+    :param model_learning: Model with its data loaded and its model compiled
+    :type model_learning: ModelLearning
+    :param epochs: Number of epochs to fit
+    :type epochs: int
+    :param use_tf_data: Whether to fit on the tf.data pipeline or on in-memory arrays
+    :type use_tf_data: bool
+
+    :return: Seconds of each epoch
+    :rtype: list(float)
+    """
+
+    epoch_times = []
+    epoch_timer = tf.keras.callbacks.LambdaCallback(
+        on_epoch_begin=lambda epoch, logs: epoch_times.append(time.perf_counter()),
+        on_epoch_end=lambda epoch, logs: epoch_times.append(time.perf_counter() - epoch_times.pop()))
+
+    x, y, _, _, batch_size = model_learning.get_fit_inputs(use_tf_data)
+    model_learning.model.fit(x=x, y=y, batch_size=batch_size, epochs=epochs, verbose=0, callbacks=[epoch_timer])
+
+    return epoch_times
+
+
+def benchmark_epoch_time(model_learning, epochs=3):
+
+    """Compares seconds per epoch of fitting a built model on in-memory arrays and dataframes (before) against the
+    cached and prefetched tf.data pipeline (after). The first epoch of each run includes tracing and filling the
+    dataset cache, so it is reported separately from the mean of the remaining epochs.
+
+    :param model_learning: Model with its data loaded and its model compiled, such as one returned by
+    TwitterSpamModelInterface.create_spam_model_to_train
+    :type model_learning: ModelLearning
+    :param epochs: Number of epochs to time each input path over
+    :type epochs: int
+
+    :return: Dictionary of first epoch and mean later epoch seconds of each input path, and the speedup
+    :rtype: dict(str-> float)
+    """
+
+    results = {}
+    for name, use_tf_data in (('Before', False), ('After', True)):
+
+        epoch_times = time_epochs(model_learning, epochs, use_tf_data)
+
+        results[f'{name} First Epoch Sec'] = epoch_times[0]
+        results[f'{name} Sec/Epoch'] = sum(epoch_times[1:]) / max(len(epoch_times) - 1, 1)
+
+    results['Speedup'] = results['Before Sec/Epoch'] / max(results['After Sec/Epoch'], 1e-9)
+
+    print(pd.DataFrame(results, index=[0]).to_string(index=False))
+
+    return results
+
+
+def benchmark_metric_step_time(batch_size=128, steps=200):
+
+    """Compares the time per step of updating precision, recall, and mcor as per batch functions averaged by Keras
+    (before) against the confusion matrix metrics with one fused update (after), on random predictions. Also reports
+    the epoch mcor of each, which differ because the mean of per batch mcor is not the epoch mcor.
+
+    :param batch_size: Number of examples per step
+    :type batch_size: int
+    :param steps: Number of steps to time
+    :type steps: int
+
+    :return: Dictionary of milliseconds per step before and after, speedup, and epoch mcor of each
+    :rtype: dict(str-> float)
+    """
+
+    from NLPSentimentCalculations import NLPSentimentCalculations as nSC
+    from ConfusionMatrixMetrics import create_confusion_matrix_metrics
+
+    labels = tf.one_hot(tf.random.uniform((steps, batch_size), maxval=2, dtype='int32'), 2)
+    predictions = tf.nn.softmax(tf.random.normal((steps, batch_size, 2)) + labels)
+
+    before_metrics = [tf.keras.metrics.MeanMetricWrapper(func, name=func.__name__)
+                      for func in (nSC.precision, nSC.recall, nSC.mcor)]
+    after_metrics = create_confusion_matrix_metrics()
+
+    results = {}
+    for name, metrics in (('Before', before_metrics), ('After', after_metrics)):
+
+        @tf.function
+        def step(y_true, y_pred):
+            for metric in metrics:
+                metric.update_state(y_true, y_pred)
+
+        step(labels[0], predictions[0])  # Trace
+        for metric in metrics:
+            metric.reset_states()
+
+        start = time.perf_counter()
+        for i in range(steps):
+            step(labels[i], predictions[i])
+        results[f'{name} ms/Step'] = (time.perf_counter() - start) * 1000 / steps
+        results[f'{name} mcor'] = float(metrics[2].result())
+
+    results['Speedup'] = results['Before ms/Step'] / max(results['After ms/Step'], 1e-9)
+
+    print(pd.DataFrame(results, index=[0]).to_string(index=False))
+
+    return results
+
+
+def run_scaling_worker(replicas, epochs=3):
+
+    """Trains the spam model mirrored over a number of logical CPU devices and measures its training throughput.
+    Logical devices can only be configured before TensorFlow starts, so benchmark_scaling_efficiency runs this in a
+    fresh process per replica count.
+
+    :param replicas: Number of logical CPU devices to mirror over
+    :type replicas: int
+    :param epochs: Number of epochs to time, after one warm up epoch
+    :type epochs: int
+
+    :return: Training examples per second
+    :rtype: float
+    """
+
+    from TwitterModelInterface import TwitterSpamModelInterface
+
+    model_learning = TwitterSpamModelInterface.create_spam_model_to_train(epochs=1, evaluate_model=False,
+                                                                          distribution='mirrored',
+                                                                          distribution_replicas=replicas,
+                                                                          scale_with_replicas=True)
+
+    epoch_times = time_epochs(model_learning, epochs)
+
+    return len(model_learning.data.y_train) / (sum(epoch_times) / len(epoch_times))
+
+
+def benchmark_scaling_efficiency(replica_counts=(1, 2, 4, 8), epochs=3):
+
+    """Measures how training throughput scales with the number of mirrored CPU replicas. Scaling efficiency is the
+    throughput of n replicas divided by n times the throughput of 1 replica.
+
+    :param replica_counts: Replica counts to measure, should start with 1
+    :type replica_counts: list(int)
+    :param epochs: Number of epochs to time per replica count
+    :type epochs: int
+
+    :return: Dataframe of examples/sec, speedup, and scaling efficiency per replica count
+    :rtype: pd.DataFrame
+    """
+
+    rows = []
+    for replicas in replica_counts:
+
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), 'scaling-worker', str(replicas),
+                               str(epochs)], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True,
+                              text=True)
+
+        if proc.returncode != 0:
+            print(f'Scaling run with {replicas} replicas failed: {proc.stderr.strip().splitlines()[-1:]}')
+            continue
+
+        rows.append({'Replicas': replicas, 'Examples/sec': json.loads(proc.stdout.strip().splitlines()[-1])})
+
+    results = pd.DataFrame(rows)
+    if not results.empty:
+        base = results['Examples/sec'].iloc[0] / results['Replicas'].iloc[0]
+        results['Speedup'] = results['Examples/sec'] / results['Examples/sec'].iloc[0]
+        results['Scaling Efficiency'] = results['Examples/sec'] / (results['Replicas'] * base)
+
+    print(results.to_string(index=False))
+
+    return results
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'imports':
+        benchmark_import_time()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'scaling':
+        benchmark_scaling_efficiency()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'scaling-worker':
+        print(json.dumps(run_scaling_worker(int(sys.argv[2]), int(sys.argv[3]))))
+    elif len(sys.argv) > 1 and sys.argv[1] == 'metrics':
+        benchmark_metric_step_time()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'epochs':
+        from TwitterModelInterface import TwitterSpamModelInterface
+        benchmark_epoch_time(TwitterSpamModelInterface.create_spam_model_to_train(epochs=1, evaluate_model=False))
+    else:
+        benchmark_sanitization(load_benchmark_tweets())
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+"""SanitizedTextCache
+
+Description:
+Module for persisting sanitized text between runs. Raw texts are content-addressed by a hash of the text and the
+sanitizer version, so rescoring the same tweet files only sanitizes texts that have never been seen before. The cache is
+bounded in size and evicts the least recently used entries so it can run unattended.
+"""
+
+
+class SanitizedTextCache:
+
+    """On-disk Sqlite3 cache of raw text hash to sanitized text.
+    """
+
+    # Sqlite limits the number of bound parameters per statement
+    lookup_batch_size = 500
+
+    def __init__(self, path='../data/sanitized_text_cache.sqlite', version='', max_entries=2000000):
+
+        """Constructor method, opens or creates the cache database.
+
+        :param path: Path to the sqlite cache file; defaults to ../data/sanitized_text_cache.sqlite
+        :type path: str
+        :param version: Sanitizer version, entries of other versions are never returned
+        :type version: str
+        :param max_entries: Maximum number of entries to keep before evicting the least recently used
+        :type max_entries: int
+        """
+
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS sanitized_text ('
+                                'text_hash TEXT NOT NULL, '
+                                'version TEXT NOT NULL, '
+                                'clean_text TEXT NOT NULL, '
+                                'last_used REAL NOT NULL, '
+                                'PRIMARY KEY (text_hash, version))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS sanitized_text_last_used ON sanitized_text (last_used)')
+        self.connection.commit()
+
+    @staticmethod
+    def hash_text(text):
+
+        """Hashes a raw text for use as a cache key.
+
+        :param text: Raw text
+        :type text: str
+
+        :return: Hex digest of the text
+        :rtype: str
+        """
+
+        return hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def get_many(self, texts):
+
+        """Looks up the sanitized version of each text. Texts that are not strings are not cached and count as misses.
+
+        :param texts: Raw texts to look up
+        :type texts: list(str)
+
+        :return: List of sanitized texts in input order, None where the text is not cached
+        :rtype: list(str)
+        """
+
+        hashes = [SanitizedTextCache.hash_text(t) if type(t) == str else None for t in texts]
+        unique_hashes = list({h for h in hashes if h is not None})
+
+        found = {}
+        with self.lock:
+
+            for i in range(0, len(unique_hashes), self.lookup_batch_size):
+
+                batch = unique_hashes[i:i + self.lookup_batch_size]
+                rows = self.connection.execute(f'SELECT text_hash, clean_text FROM sanitized_text WHERE version = ? '
+                                               f'AND text_hash IN ({",".join("?" * len(batch))})',
+                                               [self.version] + batch).fetchall()
+                found.update(rows)
+
+            # Refresh recency so eviction drops what has not been used in the longest time
+            now = time.time()
+            self.connection.executemany('UPDATE sanitized_text SET last_used = ? WHERE text_hash = ? AND version = ?',
+                                        [(now, h, self.version) for h in found])
+            self.connection.commit()
+
+        cleaned = [found.get(h) if h is not None else None for h in hashes]
+
+        hits = sum(c is not None for c in cleaned)
+        self.hits += hits
+        self.misses += len(cleaned) - hits
+
+        return cleaned
+
+    def put_many(self, texts, clean_texts):
+
+        """Stores sanitized texts, then evicts the least recently used entries if the cache is over its size bound.
+
+        :param texts: Raw texts
+        :type texts: list(str)
+        :param clean_texts: Sanitized version of each raw text
+        :type clean_texts: list(str)
+        """
+
+        now = time.time()
+        rows = [(SanitizedTextCache.hash_text(t), self.version, c, now) for t, c in zip(texts, clean_texts)
+                if type(t) == str]
+
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO sanitized_text VALUES (?, ?, ?, ?)', rows)
+            self.connection.commit()
+
+        self.evict()
+
+    def evict(self):
+
+        """Removes the least recently used entries until the cache holds at most 90% of max_entries. Only runs once
+        the cache has grown past max_entries, so eviction is not triggered on every insert.
+        """
+
+        with self.lock:
+
+            count = self.connection.execute('SELECT COUNT(*) FROM sanitized_text').fetchone()[0]
+            if count <= self.max_entries:
+                return
+
+            remove = count - int(self.max_entries * 0.9)
+            self.connection.execute('DELETE FROM sanitized_text WHERE rowid IN (SELECT rowid FROM sanitized_text '
+                                    'ORDER BY last_used LIMIT ?)', (remove,))
+            self.connection.commit()
+
+            self.evictions += remove
+
+    def get_stats(self):
+
+        """Gets the cache counters for this session.
+
+        :return: Dictionary of hits, misses, hit rate, evictions, and number of stored entries
+        :rtype: dict(str-> obj)
+        """
+
+        with self.lock:
+            entries = self.connection.execute('SELECT COUNT(*) FROM sanitized_text').fetchone()[0]
+
+        return {'Hits': self.hits, 'Misses': self.misses,
+                'Hit Rate': self.hits / max(self.hits + self.misses, 1),
+                'Evictions': self.evictions, 'Entries': entries}
+
+    def close(self):
+
+        """Closes the connection to the cache database.
+        """
+
+        self.connection.close()
@@ -1,6 +1,7 @@
 import pandas as pd
 
 import TwitterModelInterface as tMI
+from InferenceClient import InferenceClient, RemoteModel
 
 """
 1. Grabs Tweets from csv
@@ -12,7 +13,14 @@ import TwitterModelInterface as tMI
 
 class ModelHandler:
 
-    def __init__(self, spam_model=None, sentiment_model=None, load_spam_model_path=''):
+    def __init__(self, spam_model=None, sentiment_model=None, load_spam_model_path='', inference_url=''):
+
+        # Use the models of a running InferenceServer instead of loading them
+        if inference_url:
+            client = InferenceClient(inference_url)
+            spam_model = spam_model or RemoteModel(client, 'spam')
+            sentiment_model = sentiment_model or RemoteModel(client, 'sentiment')
+
         if spam_model is not None:
             self.spam_model = spam_model
         else:
@@ -31,12 +39,12 @@ class ModelHandler:
         # Read in dataframe from file once
         df = pd.read_csv(path)
 
-        # Predict spam labels: binary output
-        labels = self.spam_model.predict(df)
+        # Predict spam labels: binary output. Duplicate tweets are collapsed by the model and only predicted once
+        labels, _ = self.spam_model.predict(tweet_df=df)
 
         # Predict sentiment labels: float in (0, 1) where 0 is negative and 1 is positive
         # Format: [[Probability of Negative, P(Positive)], [P(N), P(P)]] where P(N) + P(P) = 1 for each datapoint
-        sentiments = self.sentiment_model.raw_predict(df)
+        sentiments = self.sentiment_model.raw_predict_tweets(df)
 
         # Grab only the Probability of Positive sentiment to have a single float value
         sentiments = [s[1] for s in sentiments]
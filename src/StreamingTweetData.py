@@ -0,0 +1,224 @@
+import glob
+import hashlib
+import numpy as np
+import pandas as pd
+from utilities import Utils, LazyModule
+
+
+tf = LazyModule('tensorflow')
+pq = LazyModule('pyarrow.parquet')
+
+
+"""StreamingTweetData
+
+Description:
+Module for training on labeled tweet corpora larger than memory. Sharded CSV or Parquet files are read in chunks and
+each chunk goes through the same sanitize, tokenize, and batch stages as in-memory training data, so only a chunk and a
+shuffle buffer are held at a time. Tweets are split into train and test sets by a hash of their Tweet id, so the split
+is the same on every pass and every machine without holding the ids in memory.
+"""
+
+
+class StreamingTweetData:
+    """Streams labeled tweets of a ModelData from sharded files into tf.data pipelines. The ModelData provides the
+    sanitizer, tokenizer, text input length, and features.
+    """
+
+    def __init__(self, model_data, shards, label_column, aug_shards=None, label_classes=(0, 1), chunksize=10000):
+
+        """Constructor method, only finds the shard files.
+
+        :param model_data: Model data whose parameters, sanitizer, and tokenizer are used
+        :type model_data: ModelData
+        :param shards: Glob patterns of labeled CSV or Parquet tweet files
+        :type shards: list(str)
+        :param label_column: Column of the label to train on
+        :type label_column: str
+        :param aug_shards: Glob patterns of augmented tweet files, which are only used for training
+        :type aug_shards: list(str)
+        :param label_classes: Labels to train on, in output order. Rows with other labels (like -1) are skipped.
+        :type label_classes: list(int)
+        :param chunksize: Maximum number of rows to read from a shard at once
+        :type chunksize: int
+        """
+
+        self.model_data = model_data
+        self.parameters = model_data.parameters
+
+        self.shards = StreamingTweetData.expand_shards(shards)
+        self.aug_shards = StreamingTweetData.expand_shards(aug_shards or [])
+
+        if not self.shards:
+            raise FileNotFoundError(f'No tweet shards match {shards}')
+
+        self.label_column = label_column
+        self.label_classes = list(label_classes)
+        self.chunksize = chunksize
+        self.meta_features = self.parameters.textless_features_to_train or []
+
+    @staticmethod
+    def expand_shards(patterns):
+
+        """Expands glob patterns to a sorted list of files.
+
+        :param patterns: Glob patterns
+        :type patterns: list(str)
+
+        :return: Matching files
+        :rtype: list(str)
+        """
+
+        shards = []
+        for pattern in patterns:
+            shards.extend(sorted(glob.glob(pattern)))
+
+        return shards
+
+    @staticmethod
+    def is_test_tweet(tweet_id, test_size):
+
+        """Deterministically assigns a tweet to the test set from a hash of its id. The id is normalized first, so it
+        hashes the same whether it was read as text, an integer, or a float.
+
+        :param tweet_id: Tweet id, optionally quoted like in Botometer spreadsheets
+        :type tweet_id: obj
+        :param test_size: Fraction of tweets in the test set
+        :type test_size: float
+
+        :return: Whether the tweet is in the test set
+        :rtype: bool
+        """
+
+        tweet_id = str(tweet_id).strip().strip("'")
+        if tweet_id.endswith('.0'):
+            tweet_id = tweet_id[:-2]
+
+        digest = hashlib.md5(tweet_id.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') / 2 ** 64 < test_size
+
+    def read_shard(self, shard):
+
+        """Reads a shard in chunks of at most self.chunksize rows. Tweet ids are read as text, since the type pandas
+        infers per chunk would change how they hash.
+
+        :param shard: Path to a CSV or Parquet file
+        :type shard: str
+
+        :return: Generator of dataframe chunks
+        :rtype: generator(pd.DataFrame)
+        """
+
+        if shard.endswith('.parquet'):
+            for batch in pq.ParquetFile(shard).iter_batches(batch_size=self.chunksize):
+                chunk = batch.to_pandas()
+                if 'Tweet id' in chunk.columns:
+                    chunk['Tweet id'] = chunk['Tweet id'].astype(str)
+                yield chunk
+        else:
+            yield from pd.read_csv(shard, chunksize=self.chunksize, dtype={'Tweet id': str})
+
+    def iter_chunks(self, split):
+
+        """Reads the labeled chunks of a split. Augmented tweets, from aug_shards or flagged in an augmented column,
+        are always in the train split.
+
+        :param split: Either train or test
+        :type split: str
+
+        :return: Generator of dataframe chunks with the json features parsed
+        :rtype: generator(pd.DataFrame)
+        """
+
+        shards = [(shard, False) for shard in self.shards]
+        if split == 'train':
+            shards += [(shard, True) for shard in self.aug_shards]
+
+        for shard, augmented in shards:
+            for chunk in self.read_shard(shard):
+
+                chunk = chunk[chunk[self.label_column].isin(self.label_classes)]
+
+                in_test = chunk['Tweet id'].map(lambda tweet_id: StreamingTweetData.is_test_tweet(
+                    tweet_id, self.parameters.test_size)).to_numpy(dtype=bool)
+                if augmented:
+                    in_test[:] = False
+                elif 'augmented' in chunk.columns:
+                    in_test &= chunk['augmented'].to_numpy() == 0
+
+                chunk = chunk[in_test == (split == 'test')]
+                if len(chunk) > 0:
+                    yield Utils.parse_json_tweet_data(chunk.copy(), self.parameters.features_to_train)
+
+    def fit_tokenizer(self):
+
+        """Fits the Keras tokenizer of the model data on the train split, one chunk at a time. Sanitized texts land in
+        the sanitized text cache, so streaming them again for training is mostly cache lookups.
+        """
+
+        for chunk in self.iter_chunks('train'):
+            self.model_data.nsc.tokenizer.fit_on_texts(self.model_data.sanitize_texts(chunk['full_text']))
+
+    def vectorize_chunk(self, chunk):
+
+        """Sanitizes, tokenizes, and pads the texts of a chunk to the text input length, and one-hot encodes labels.
+
+        :param chunk: Dataframe chunk from iter_chunks
+        :type chunk: pd.DataFrame
+
+        :return: Tuple of model inputs and labels of every row
+        :rtype: tuple(obj, np.array(np.array(float)))
+        """
+
+        model_data = self.model_data
+        clean_texts = model_data.sanitize_texts(chunk['full_text'])
+
+        if self.parameters.use_transformers:
+            encodings = model_data.nsc.tokenizer(clean_texts, padding='max_length', truncation=True,
+                                                 max_length=model_data.text_input_length, return_tensors='np')
+            text_data = {'input_ids': encodings['input_ids'].astype('int32'),
+                         'attention_mask': encodings['attention_mask'].astype('int32')}
+        else:
+            _, text_data = model_data.nsc.keras_word_embeddings(clean_texts, model_data.text_input_length)
+            text_data = text_data.astype('int32')
+
+        label_indices = chunk[self.label_column].map(self.label_classes.index).to_numpy()
+        labels = np.eye(len(self.label_classes), dtype='float32')[label_indices]
+
+        if not self.meta_features:
+            return text_data, labels
+
+        return (text_data, chunk[self.meta_features].to_numpy(dtype='float32')), labels
+
+    def get_dataset(self, split, batch_size, shuffle=True):
+
+        """Creates a tf.data pipeline that streams a split chunk by chunk.
+
+        :param split: Either train or test
+        :type split: str
+        :param batch_size: Number of examples per batch
+        :type batch_size: int
+        :param shuffle: Whether to shuffle examples within a buffer of parameters.shuffle_buffer_size
+        :type shuffle: bool
+
+        :return: Dataset of (inputs, labels) batches ready to pass into model.fit or model.evaluate
+        :rtype: tf.data.Dataset
+        """
+
+        text_spec = tf.TensorSpec(shape=(None, self.model_data.text_input_length), dtype='int32')
+        if self.parameters.use_transformers:
+            text_spec = {'input_ids': text_spec, 'attention_mask': text_spec}
+
+        input_spec = text_spec
+        if self.meta_features:
+            input_spec = (text_spec, tf.TensorSpec(shape=(None, len(self.meta_features)), dtype='float32'))
+
+        signature = (input_spec, tf.TensorSpec(shape=(None, len(self.label_classes)), dtype='float32'))
+
+        dataset = tf.data.Dataset.from_generator(
+            lambda: (self.vectorize_chunk(chunk) for chunk in self.iter_chunks(split)),
+            output_signature=signature).unbatch()
+
+        if shuffle:
+            dataset = dataset.shuffle(self.parameters.shuffle_buffer_size, reshuffle_each_iteration=True)
+
+        return dataset.batch(batch_size).prefetch(tf.data.experimental.AUTOTUNE)
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+import tensorflow as tf
+
+
+"""TrainingProfiler
+
+Description:
+Module for finding where training time goes. A Keras callback times every training step and writes one json line per
+epoch with examples/sec, step time percentiles, the fraction of the epoch spent inside steps, and host memory. It can
+also capture a TensorBoard profiler trace over a window of steps, which shows whether steps wait on the input pipeline
+or on the model.
+
+This module imports TensorFlow, so it is only imported once training starts.
+"""
+
+
+def get_host_memory_mb():
+
+    """Gets the resident memory of this process. Reads the current value from /proc on Linux and falls back to the peak
+    value from getrusage on other Unix systems.
+
+    :return: Resident memory in MB, None where neither is available
+    :rtype: float
+    """
+
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # Bytes on macOS, KB elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+class TrainingProfiler(tf.keras.callbacks.Callback):
+    """Keras callback that records training throughput per epoch to a json lines file, and optionally a profiler trace.
+    """
+
+    def __init__(self, log_file, batch_size, trace_dir='', trace_steps=None):
+
+        """Constructor method.
+
+        :param log_file: Json lines file to append a line to per epoch
+        :type log_file: str
+        :param batch_size: Global batch size, used to count examples. A smaller last batch of an epoch is counted as a
+        full batch.
+        :type batch_size: int
+        :param trace_dir: TensorBoard log directory to write a profiler trace to, empty to not trace
+        :type trace_dir: str
+        :param trace_steps: First and last training step (counted over all epochs) of the trace, defaults to steps 10
+        through 20 to skip tracing and warm up
+        :type trace_steps: list(int)
+        """
+
+        super().__init__()
+
+        self.log_file = log_file
+        self.batch_size = batch_size
+        self.trace_dir = trace_dir
+        self.trace_start, self.trace_stop = trace_steps or (10, 20)
+
+        self.global_step = 0
+        self.tracing = False
+        self.epoch_start = 0.0
+        self.step_start = 0.0
+        self.step_times = []
+
+        directory = os.path.dirname(log_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def on_epoch_begin(self, epoch, logs=None):
+
+        self.step_times = []
+        self.epoch_start = time.perf_counter()
+
+    def on_train_batch_begin(self, batch, logs=None):
+
+        if self.trace_dir and not self.tracing and self.global_step == self.trace_start:
+            tf.profiler.experimental.start(self.trace_dir)
+            self.tracing = True
+
+        self.step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+
+        self.step_times.append(time.perf_counter() - self.step_start)
+        self.global_step += 1
+
+        if self.tracing and self.global_step > self.trace_stop:
+            self.stop_trace()
+
+    def on_epoch_end(self, epoch, logs=None):
+
+        # Includes validation and other callbacks, so a low step time fraction means time is spent outside of steps
+        epoch_time = time.perf_counter() - self.epoch_start
+        step_times = np.asarray(self.step_times) if self.step_times else np.zeros(1)
+        examples = len(self.step_times) * self.batch_size
+
+        record = {'epoch': epoch + 1,
+                  'steps': len(self.step_times),
+                  'examples': examples,
+                  'epoch_sec': epoch_time,
+                  'examples_per_sec': examples / max(step_times.sum(), 1e-9),
+                  'step_ms_mean': float(step_times.mean() * 1000),
+                  'step_ms_p50': float(np.percentile(step_times, 50) * 1000),
+                  'step_ms_p90': float(np.percentile(step_times, 90) * 1000),
+                  'step_ms_p99': float(np.percentile(step_times, 99) * 1000),
+                  'step_time_fraction': float(step_times.sum() / max(epoch_time, 1e-9)),
+                  'host_memory_mb': get_host_memory_mb(),
+                  'logs': {key: float(value) for key, value in (logs or {}).items()}}
+
+        with open(self.log_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def on_train_end(self, logs=None):
+
+        if self.tracing:
+            self.stop_trace()
+
+    def stop_trace(self):
+
+        """Stops the profiler trace. It can be viewed in the profile tab of TensorBoard on trace_dir.
+        """
+
+        tf.profiler.experimental.stop()
+        self.tracing = False
+        print(f'Saved profiler trace of steps {self.trace_start} to {self.global_step - 1} to {self.trace_dir}')
@@ -0,0 +1,155 @@
+import os
+import json
+import random
+import pickle
+import shutil
+import numpy as np
+import tensorflow as tf
+
+
+"""TrainingStateCheckpoint
+
+Description:
+Module for resuming interrupted training. Unlike the best-weights model checkpoint, the full training state is saved:
+model weights, optimizer slots and step count, the epoch, counters of callbacks such as early stopping, and random
+number generator states. Each save is written to a temporary directory and renamed into place, and the pointer to the
+latest save is replaced atomically, so a crash mid-write never leaves a corrupt checkpoint behind.
+
+This module imports TensorFlow, so it is only imported once training starts.
+"""
+
+
+class TrainingStateCheckpoint(tf.keras.callbacks.Callback):
+    """Keras callback that saves the training state every interval epochs and restores it before training resumes.
+    """
+
+    # Callback counters that are saved and restored, when a tracked callback has them
+    tracked_attributes = ['wait', 'best', 'best_epoch', 'stopped_epoch']
+
+    def __init__(self, directory, config_hash, interval=1, tracked_callbacks=None):
+
+        """Constructor method.
+
+        :param directory: Directory to save the training state in
+        :type directory: str
+        :param config_hash: Hash of the training configuration, a saved state is only restored if it matches
+        :type config_hash: str
+        :param interval: Number of epochs between saves
+        :type interval: int
+        :param tracked_callbacks: Callbacks whose counters are part of the training state, such as early stopping
+        :type tracked_callbacks: list(tf.keras.callbacks.Callback)
+        """
+
+        super().__init__()
+
+        self.directory = directory
+        self.config_hash = config_hash
+        self.interval = max(interval, 1)
+        self.tracked_callbacks = tracked_callbacks or []
+
+        self.state_file = os.path.join(directory, 'latest.json')
+        self.pending_callback_states = None
+
+    @staticmethod
+    def get_checkpoint(model):
+
+        """Creates a checkpoint of the model, its optimizer, and the global TensorFlow random generator.
+
+        :param model: Compiled model
+        :type model: tf.keras.Model
+
+        :return: Checkpoint object
+        :rtype: tf.train.Checkpoint
+        """
+
+        return tf.train.Checkpoint(model=model, optimizer=model.optimizer, rng=tf.random.get_global_generator())
+
+    def on_train_begin(self, logs=None):
+
+        # Callbacks like EarlyStopping reset their counters when training begins, so restored counters are only applied
+        # afterwards. This callback is added after the callbacks it tracks.
+        if self.pending_callback_states is None:
+            return
+
+        for callback, attributes in zip(self.tracked_callbacks, self.pending_callback_states):
+            for attribute, value in attributes.items():
+                setattr(callback, attribute, value)
+
+        self.pending_callback_states = None
+
+    def on_epoch_end(self, epoch, logs=None):
+
+        if (epoch + 1) % self.interval == 0:
+            self.save(epoch + 1)
+
+    def save(self, epoch):
+
+        """Saves the training state after a number of completed epochs, then removes older saves.
+
+        :param epoch: Number of completed epochs
+        :type epoch: int
+        """
+
+        name = f'state-{epoch}'
+        save_dir = os.path.join(self.directory, name)
+        tmp_dir = f'{save_dir}.tmp'
+
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        TrainingStateCheckpoint.get_checkpoint(self.model).write(os.path.join(tmp_dir, 'checkpoint'))
+        with open(os.path.join(tmp_dir, 'rng.pkl'), 'wb') as f:
+            pickle.dump((random.getstate(), np.random.get_state()), f)
+
+        shutil.rmtree(save_dir, ignore_errors=True)
+        os.replace(tmp_dir, save_dir)
+
+        callback_states = [{attribute: getattr(callback, attribute) for attribute in self.tracked_attributes
+                            if hasattr(callback, attribute)} for callback in self.tracked_callbacks]
+
+        state_tmp = f'{self.state_file}.tmp'
+        with open(state_tmp, 'w') as f:
+            json.dump({'config_hash': self.config_hash, 'epoch': epoch, 'checkpoint': name,
+                       'callbacks': callback_states}, f, default=float)
+        os.replace(state_tmp, self.state_file)
+
+        # Older saves are only removed once the pointer has moved to the new one
+        for entry in os.listdir(self.directory):
+            if entry.startswith('state-') and entry != name:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def restore(self, model):
+
+        """Restores the latest saved training state into a compiled model if it was saved with the same configuration.
+        Optimizer slots are restored as soon as the optimizer creates them on the first training step.
+
+        :param model: Compiled model to restore into
+        :type model: tf.keras.Model
+
+        :return: Number of completed epochs to resume from, 0 if there is nothing to resume
+        :rtype: int
+        """
+
+        if not os.path.exists(self.state_file):
+            return 0
+
+        with open(self.state_file, 'r') as f:
+            state = json.load(f)
+
+        if state['config_hash'] != self.config_hash:
+            print(f'Training state in {self.directory} is from a different configuration, starting from epoch 0')
+            return 0
+
+        save_dir = os.path.join(self.directory, state['checkpoint'])
+        TrainingStateCheckpoint.get_checkpoint(model).read(os.path.join(save_dir, 'checkpoint')).expect_partial()
+
+        with open(os.path.join(save_dir, 'rng.pkl'), 'rb') as f:
+            python_state, numpy_state = pickle.load(f)
+        random.setstate(python_state)
+        np.random.set_state(numpy_state)
+
+        self.pending_callback_states = state['callbacks']
+
+        print(f'Resuming training from epoch {state["epoch"]}')
+
+        return state['epoch']
@@ -7,6 +7,7 @@ from TweetDatabaseManager import TweetDatabaseManager
 import ModelBase
 import TwitterSpamModel
 import TwitterSentimentModel
+from InferenceClient import InferenceClient, RemoteModel
 from utilities import Utils
 
 
@@ -26,6 +27,10 @@ Creation date: October 13, 2021
 
 class TwitterModelInterface:
 
+    # Persistent caches enabled when creating a model to train, other ModelData builds leave them off
+    training_cache_settings = {'sanitize_cache_db': '../data/sanitized_text_cache.sqlite',
+                               'embedding_cache_dir': '../data/Learning Data/embedding_cache'}
+
     @staticmethod
     def get_settings_dict(json_settings='../data/Learning Data/spam_settings.json', learning_rate=1e-3,
                           epochs=1000, early_stopping=False, checkpoint_model=False, early_stopping_patience=0,
@@ -33,7 +38,26 @@ class TwitterModelInterface:
                           use_transformers=False, train_data_csv='../data/Learning Data/spam_train.csv',
                           aug_data_csv='',
                           test_size=0.1, preload_train_data_dill='', save_train_data_dill='', features_to_train=None,
-                          load_to_predict=False, model_h5='../data/Learning Data/best_spam_model.h5') -> dict:
+                          load_to_predict=False, model_h5='../data/Learning Data/best_spam_model.h5',
+                          sanitize_workers=0, parallel_sanitize_threshold=10000,
+                          sanitize_cache_db='',
+                          sanitize_cache_max_entries=2000000, glove_store_dtype='float32',
+                          embedding_cache_dir='',
+                          inference_bucket_boundaries=None, train_bucket_boundaries=None, use_tf_data=False,
+                          shuffle_buffer_size=10000, encoder_features='',
+                          encoder_feature_dir='../data/Learning Data/encoder_features', distribution='',
+                          distribution_replicas=0, scale_with_replicas=False, dropout_rate=0.5, use_cnn=False,
+                          preload_train_data_arrays='', train_data_shards=None, aug_data_shards=None,
+                          stream_chunk_size=10000, training_checkpoint_dir='', training_checkpoint_interval=1,
+                          early_stopping_monitor='mcor', restore_best_weights=False, validation_data='',
+                          validation_split=0.1, distill_label_dir='../data/Learning Data/distill_labels',
+                          distill_chunk_size=10000, distill_student_cnn=False,
+                          distill_student_h5='../data/Learning Data/sentiment_student.h5',
+                          predict_with_student=False, update_data_csv='', replay_data_csv='',
+                          replay_size=2000, profile_training_file='', profile_trace_dir='',
+                          profile_trace_steps=None,
+                          preprocessed_cache_dir='',
+                          preprocessed_cache_max_mb=4096, sanitizer_version='') -> dict:
         """
         Function that processes all model args (both passed and from json) and returns one dictionary of args
 
@@ -80,6 +104,101 @@ class TwitterModelInterface:
         :type load_to_predict: bool
         :param model_h5: Path to save trained model in h5 format to after training
         :type model_h5: str
+        :param sanitize_workers: Number of processes to sanitize text with, 0 uses up to 4 cores
+        :type sanitize_workers: int
+        :param parallel_sanitize_threshold: Minimum number of texts before sanitizing is spread over processes
+        :type parallel_sanitize_threshold: int
+        :param sanitize_cache_db: Path to the persistent sanitized text cache, empty to disable caching. Models created
+                                  to train default to training_cache_settings.
+        :type sanitize_cache_db: str
+        :param sanitize_cache_max_entries: Maximum number of cached sanitized texts before evicting
+        :type sanitize_cache_max_entries: int
+        :param glove_store_dtype: Data type of the memory-mapped GloVe store, float16 halves its size
+        :type glove_store_dtype: str
+        :param embedding_cache_dir: Directory of cached GloVe embedding matrices, empty to disable. Models created to
+                                    train default to training_cache_settings.
+        :type embedding_cache_dir: str
+        :param inference_bucket_boundaries: Token lengths to split transformer predictions into padding buckets at, such
+        as [16, 32, 64], None pads every tweet to the model input length
+        :type inference_bucket_boundaries: list(int)
+        :param train_bucket_boundaries: Token lengths to group training batches at, each batch padded to its longest
+        tweet; None pads every tweet to the longest training tweet
+        :type train_bucket_boundaries: list(int)
+        :param use_tf_data: Whether to train through a cached and prefetched tf.data pipeline instead of arrays
+        :type use_tf_data: bool
+        :param shuffle_buffer_size: Number of examples in the tf.data shuffle buffer
+        :type shuffle_buffer_size: int
+        :param encoder_features: Train only a head over frozen transformer features, pooled or logits; empty fine-tunes
+        the whole transformer
+        :type encoder_features: str
+        :param encoder_feature_dir: Directory to store precomputed frozen transformer features in
+        :type encoder_feature_dir: str
+        :param distribution: Distribution strategy to train with: tpu, mirrored, multi_worker, or empty for none
+        :type distribution: str
+        :param distribution_replicas: Number of logical CPU devices to mirror over when there are no GPUs
+        :type distribution_replicas: int
+        :param scale_with_replicas: Whether batch_size is per replica and the learning rate scales with replicas
+        :type scale_with_replicas: bool
+        :param dropout_rate: Percentage of input to drop at the model Dropout layers
+        :type dropout_rate: float
+        :param use_cnn: Whether the text model is a separable CNN instead of an LSTM
+        :type use_cnn: bool
+        :param preload_train_data_arrays: Directory of preprocessed arrays saved by ModelData.save_data_to_arrays
+        :type preload_train_data_arrays: str
+        :param train_data_shards: Glob patterns of labeled CSV or Parquet tweet files to stream, instead of a csv
+        :type train_data_shards: list(str)
+        :param aug_data_shards: Glob patterns of augmented tweet files to stream into the train split
+        :type aug_data_shards: list(str)
+        :param stream_chunk_size: Number of rows read from a shard at once when streaming
+        :type stream_chunk_size: int
+        :param training_checkpoint_dir: Directory to save resumable training state in, empty to disable
+        :type training_checkpoint_dir: str
+        :param training_checkpoint_interval: Number of epochs between training state saves
+        :type training_checkpoint_interval: int
+        :param early_stopping_monitor: Metric for early stopping and checkpoints to monitor, on the validation data if
+                                       there is some
+        :type early_stopping_monitor: str
+        :param restore_best_weights: In the case of early stopping, whether to restore the weights of the best epoch
+        :type restore_best_weights: bool
+        :param validation_data: Data to validate on during training, either test, split to carve validation_split of
+                                the train data out, or empty to not validate
+        :type validation_data: str
+        :param validation_split: Fraction of the train data to validate on when validation_data is split
+        :type validation_split: float
+        :param distill_label_dir: Directory to cache teacher soft labels in when distilling, empty to disable
+        :type distill_label_dir: str
+        :param distill_chunk_size: Number of tweets the teacher labels per cached chunk when distilling
+        :type distill_chunk_size: int
+        :param distill_student_cnn: Whether the distilled student is a CNN instead of an LSTM
+        :type distill_student_cnn: bool
+        :param distill_student_h5: Path to save the distilled student model to
+        :type distill_student_h5: str
+        :param predict_with_student: Whether to predict with the distilled student instead of the model, if it has one
+        :type predict_with_student: bool
+        :param update_data_csv: Path to a csv of newly labeled tweets to fine tune a saved model on
+        :type update_data_csv: str
+        :param replay_data_csv: Path to a csv of the tweets a saved model was trained on, to replay when fine tuning.
+                                Defaults to train_data_csv when the model is saved.
+        :type replay_data_csv: str
+        :param replay_size: Number of old tweets to replay when fine tuning
+        :type replay_size: int
+        :param profile_training_file: Json lines file to record training throughput per epoch to, empty to disable
+        :type profile_training_file: str
+        :param profile_trace_dir: TensorBoard log directory to save a profiler trace of training steps to, empty to
+                                  disable
+        :type profile_trace_dir: str
+        :param profile_trace_steps: First and last training step of the profiler trace, defaults to [10, 20]
+        :type profile_trace_steps: list(int)
+        :param preprocessed_cache_dir: Directory to cache preprocessed data in, keyed by the csv contents and
+                                       preprocessing settings, such as '../data/Learning Data/preprocessed_cache'.
+                                       Empty to always preprocess.
+        :type preprocessed_cache_dir: str
+        :param preprocessed_cache_max_mb: Size the preprocessed data cache is pruned to, least recently used first
+        :type preprocessed_cache_max_mb: int
+        :param sanitizer_version: TextSanitizer version a saved model was trained with, recorded when saving. Empty
+                                  uses the current sanitizer for new models and the per word one for models saved
+                                  before the version was recorded.
+        :type sanitizer_version: str
 
         :return: Dictionary of spam model settings that can be used to initialize SpamModelParameters
         :rtype: dict
@@ -107,7 +226,48 @@ class TwitterModelInterface:
             'features_to_train': features_to_train,
             'custom_text_input_length': 50,
             'load_to_predict': load_to_predict,
-            'model_h5': model_h5
+            'model_h5': model_h5,
+            'sanitize_workers': sanitize_workers,
+            'parallel_sanitize_threshold': parallel_sanitize_threshold,
+            'sanitize_cache_db': sanitize_cache_db,
+            'sanitize_cache_max_entries': sanitize_cache_max_entries,
+            'glove_store_dtype': glove_store_dtype,
+            'embedding_cache_dir': embedding_cache_dir,
+            'inference_bucket_boundaries': inference_bucket_boundaries,
+            'train_bucket_boundaries': train_bucket_boundaries,
+            'use_tf_data': use_tf_data,
+            'shuffle_buffer_size': shuffle_buffer_size,
+            'encoder_features': encoder_features,
+            'encoder_feature_dir': encoder_feature_dir,
+            'distribution': distribution,
+            'distribution_replicas': distribution_replicas,
+            'scale_with_replicas': scale_with_replicas,
+            'dropout_rate': dropout_rate,
+            'use_cnn': use_cnn,
+            'preload_train_data_arrays': preload_train_data_arrays,
+            'train_data_shards': train_data_shards,
+            'aug_data_shards': aug_data_shards,
+            'stream_chunk_size': stream_chunk_size,
+            'training_checkpoint_dir': training_checkpoint_dir,
+            'training_checkpoint_interval': training_checkpoint_interval,
+            'early_stopping_monitor': early_stopping_monitor,
+            'restore_best_weights': restore_best_weights,
+            'validation_data': validation_data,
+            'validation_split': validation_split,
+            'distill_label_dir': distill_label_dir,
+            'distill_chunk_size': distill_chunk_size,
+            'distill_student_cnn': distill_student_cnn,
+            'distill_student_h5': distill_student_h5,
+            'predict_with_student': predict_with_student,
+            'update_data_csv': update_data_csv,
+            'replay_data_csv': replay_data_csv,
+            'replay_size': replay_size,
+            'profile_training_file': profile_training_file,
+            'profile_trace_dir': profile_trace_dir,
+            'profile_trace_steps': profile_trace_steps,
+            'preprocessed_cache_dir': preprocessed_cache_dir,
+            'preprocessed_cache_max_mb': preprocessed_cache_max_mb,
+            'sanitizer_version': sanitizer_version
         }
 
         if os.path.exists(json_settings):
@@ -122,6 +282,58 @@ class TwitterModelInterface:
         return settings_dict
 
 
+    @staticmethod
+    def update_saved_model(dill_parameters_file: str, new_labels_csv: str, data_class, learning_class, epochs=3,
+                           learning_rate=1e-4, replay_size=2000, replay_data_csv=''):
+        """
+        Loads a saved model from its dill and h5 files and fine-tunes it on newly labeled tweets, see
+        ModelLearning.update_model, then saves the parameters of the new model version next to the old ones.
+
+        :param dill_parameters_file: Path to the dill file of the saved model parameters
+        :type dill_parameters_file: str
+        :param new_labels_csv: Path to a csv of newly labeled tweets
+        :type new_labels_csv: str
+        :param data_class: ModelData class of the model type
+        :type data_class: type
+        :param learning_class: ModelLearning class of the model type
+        :type learning_class: type
+        :param epochs: Number of epochs to fine tune for
+        :type epochs: int
+        :param learning_rate: Learning rate to fine tune with, usually lower than the one trained with
+        :type learning_rate: float
+        :param replay_size: Number of old tweets to replay
+        :type replay_size: int
+        :param replay_data_csv: Path to a csv of the tweets the model was trained on, defaults to the saved one
+        :type replay_data_csv: str
+
+        :return: Tuple of the fine-tuned model and the path of the dill file of its parameters
+        :rtype: tuple(ModelLearning, str)
+        """
+
+        with open(dill_parameters_file, 'rb') as dpf:
+            parameters = dill.load(dpf)
+
+        parameters.epochs = epochs
+        parameters.learning_rate = learning_rate
+        parameters.replay_size = replay_size
+        parameters.replay_data_csv = replay_data_csv or parameters.replay_data_csv
+        parameters.update_data_csv = new_labels_csv
+        parameters.load_to_predict = False
+
+        ModelBase.ModelLearning.init_distribution_devices(parameters)
+        model = learning_class(parameters, data_class(parameters))
+        model.update_model(new_labels_csv)
+
+        # Make sure parameters class is updated before saving
+        model.update_to_save_as_trained(model.data.nsc, model.data.text_input_length)
+
+        new_dill_parameters_file = Utils.get_next_version_path(dill_parameters_file)
+        with open(new_dill_parameters_file, 'wb') as dpf:
+            dill.dump(model.parameters, dpf)
+
+        return model, new_dill_parameters_file
+
+
 class TwitterSentimentModelInterface(TwitterModelInterface):
 
     @staticmethod
@@ -141,13 +353,15 @@ class TwitterSentimentModelInterface(TwitterModelInterface):
         :rtype: SentimentModelLearning
         """
 
-        settings_dict = TwitterSentimentModelInterface.process_sentiment_model_args(**kwargs)
+        settings_dict = TwitterSentimentModelInterface.process_sentiment_model_args(
+            **{**TwitterModelInterface.training_cache_settings, **kwargs})
 
         parameters = ModelBase.ModelParameters(**settings_dict)
 
         # Add text to features
         parameters.features_to_train = ['full_text']
 
+        ModelBase.ModelLearning.init_distribution_devices(parameters)
         data = TwitterSentimentModel.SentimentModelData(parameters)
 
         model = TwitterSentimentModel.SentimentModelLearning(parameters, data)
@@ -156,6 +370,111 @@ class TwitterSentimentModelInterface(TwitterModelInterface):
         return model
 
 
+    @staticmethod
+    def load_sentiment_model_to_predict(dill_parameters_file: str) -> TwitterSentimentModel.SentimentModelLearning:
+        """
+        Loads an instance of SentimentModelData, SentimentModelParameters, and SentimentModelLearning from saved model
+        .h5 and saved parameters .dill files in a way that these objects are prepared for using the model to predict.
+
+        :param dill_parameters_file: Path to dill file which stores the model parameters
+        :type dill_parameters_file: str
+
+        :return: A compiled SentimentModelLearning ready to make predictions
+        :rtype: SentimentModelLearning
+        """
+        with open(dill_parameters_file, 'rb') as dpf:
+            parameters = dill.load(dpf)
+
+        ModelBase.ModelLearning.init_distribution_devices(parameters)
+        data = TwitterSentimentModel.SentimentModelData(parameters)
+        model = TwitterSentimentModel.SentimentModelLearning(parameters, data)
+        model.build_model()
+
+        return model
+
+    @staticmethod
+    def update_sentiment_model(dill_parameters_file: str, new_labels_csv: str, **kwargs):
+        """
+        Fine-tunes a saved sentiment model on newly labeled tweets, see TwitterModelInterface.update_saved_model.
+
+        :param dill_parameters_file: Path to the dill file of the saved model parameters
+        :type dill_parameters_file: str
+        :param new_labels_csv: Path to a csv of newly labeled tweets
+        :type new_labels_csv: str
+        :param kwargs: Any keyword arguments which are described in update_saved_model
+        :type kwargs: str: any
+
+        :return: Tuple of the fine-tuned model and the path of the dill file of its parameters
+        :rtype: tuple(SentimentModelLearning, str)
+        """
+
+        return TwitterModelInterface.update_saved_model(dill_parameters_file, new_labels_csv,
+                                                        TwitterSentimentModel.SentimentModelData,
+                                                        TwitterSentimentModel.SentimentModelLearning, **kwargs)
+
+    @staticmethod
+    def distill_sentiment_model(teacher: TwitterSentimentModel.SentimentModelLearning, corpus_csv: str,
+                                dill_parameters_file: str = '') -> TwitterSentimentModel.SentimentModelLearning:
+        """
+        Distills a trained sentiment model into a small student on a csv of tweets, see
+        SentimentModelLearning.distill_student, and optionally saves the student to be loaded with
+        load_student_model.
+
+        :param teacher: Trained sentiment model
+        :type teacher: SentimentModelLearning
+        :param corpus_csv: Path to a saved dataframe of tweets to distill on, labels are not needed
+        :type corpus_csv: str
+        :param dill_parameters_file: Path to save the student parameters to, empty to not save the student
+        :type dill_parameters_file: str
+
+        :return: The trained student, also set as teacher.student
+        :rtype: SentimentModelLearning
+        """
+
+        student = teacher.distill_student(Utils.parse_json_tweet_data_from_csv(corpus_csv, ['full_text']))
+
+        if dill_parameters_file:
+            student.model.save(student.parameters.model_h5)
+
+            student.update_to_save_as_trained(student.data.nsc, student.data.text_input_length)
+            student.parameters.evaluate_model = False
+
+            with open(dill_parameters_file, 'wb') as dpf:
+                dill.dump(student.parameters, dpf)
+
+        return student
+
+    @staticmethod
+    def load_student_model(dill_parameters_file: str,
+                           teacher: TwitterSentimentModel.SentimentModelLearning = None) -> \
+            TwitterSentimentModel.SentimentModelLearning:
+        """
+        Loads a student saved by distill_sentiment_model, ready to predict. If a teacher is given, the student is
+        attached to it and its predictions use the student from then on.
+
+        :param dill_parameters_file: Path to the dill file of the student parameters
+        :type dill_parameters_file: str
+        :param teacher: Sentiment model to predict with the student instead, if any
+        :type teacher: SentimentModelLearning
+
+        :return: A compiled student ready to make predictions
+        :rtype: SentimentModelLearning
+        """
+
+        with open(dill_parameters_file, 'rb') as dpf:
+            parameters = dill.load(dpf)
+
+        student = TwitterSentimentModel.SentimentModelLearning(
+            parameters, TwitterSentimentModel.DistilledSentimentModelData(parameters))
+        student.load_compile_validate_model()
+
+        if teacher is not None:
+            teacher.student = student
+            teacher.parameters.predict_with_student = True
+
+        return student
+
+
 class TwitterSpamModelInterface(TwitterModelInterface):
 
     @staticmethod
@@ -183,7 +502,7 @@ class TwitterSpamModelInterface(TwitterModelInterface):
 
     @staticmethod
     def classify_twitter_query(keywords, num: int, dill_file: str, filename=None,
-                               use_botometer_lite=False) -> pd.DataFrame:
+                               use_botometer_lite=False, inference_url='') -> pd.DataFrame:
         """
         Queries tweets and their botscores, loads spam model from dill and h5, predicts on tweets, and returns tweet
         dataframe with spam model predictions.
@@ -198,6 +517,9 @@ class TwitterSpamModelInterface(TwitterModelInterface):
         :type filename: str
         :param use_botometer_lite: Whether to use botometer lite (when querying Tweets)
         :type use_botometer_lite: bool
+        :param inference_url: Url of a running InferenceServer to predict with instead of loading the model from
+                              dill_file
+        :type inference_url: str
 
         :return: Dataframe of Tweets with Spam Model labels
         :rtype: pd.DataFrame
@@ -211,10 +533,13 @@ class TwitterSpamModelInterface(TwitterModelInterface):
         tdm = TweetDatabaseManager(use_botometer_lite=use_botometer_lite)
         df = tdm.save_multiple_keywords(keywords, num, same_file=True, filename=None, save_to_file=False)
 
-        spam_model_learning = TwitterSpamModelInterface.load_spam_model_to_predict(dill_file)
+        if inference_url:
+            spam_model_learning = RemoteModel(InferenceClient(inference_url), 'spam')
+        else:
+            spam_model_learning = TwitterSpamModelInterface.load_spam_model_to_predict(dill_file)
 
-        # Parse Tweet df to make sure it has needed keys
-        df = Utils.parse_json_tweet_data(df, spam_model_learning.parameters.features_to_train)
+            # Parse Tweet df to make sure it has needed keys
+            df = Utils.parse_json_tweet_data(df, spam_model_learning.parameters.features_to_train)
 
         df['SpamModelLabel'] = spam_model_learning.predict(tweet_df=df)
 
@@ -235,10 +560,12 @@ class TwitterSpamModelInterface(TwitterModelInterface):
         :rtype: SpamModelLearning
         """
 
-        settings_dict = TwitterSpamModelInterface.process_spam_model_args(**kwargs)
+        settings_dict = TwitterSpamModelInterface.process_spam_model_args(
+            **{**TwitterModelInterface.training_cache_settings, **kwargs})
 
         parameters = ModelBase.ModelParameters(**settings_dict)
 
+        ModelBase.ModelLearning.init_distribution_devices(parameters)
         data = TwitterSpamModel.SpamModelData(parameters)
 
         model = TwitterSpamModel.SpamModelLearning(parameters, data)
@@ -319,6 +646,26 @@ class TwitterSpamModelInterface(TwitterModelInterface):
 
         return successful
 
+    @staticmethod
+    def update_spam_model(dill_parameters_file: str, new_labels_csv: str, **kwargs):
+        """
+        Fine-tunes a saved spam model on newly labeled tweets, see TwitterModelInterface.update_saved_model.
+
+        :param dill_parameters_file: Path to the dill file of the saved model parameters
+        :type dill_parameters_file: str
+        :param new_labels_csv: Path to a csv of newly labeled tweets
+        :type new_labels_csv: str
+        :param kwargs: Any keyword arguments which are described in update_saved_model
+        :type kwargs: str: any
+
+        :return: Tuple of the fine-tuned model and the path of the dill file of its parameters
+        :rtype: tuple(SpamModelLearning, str)
+        """
+
+        return TwitterModelInterface.update_saved_model(dill_parameters_file, new_labels_csv,
+                                                        TwitterSpamModel.SpamModelData,
+                                                        TwitterSpamModel.SpamModelLearning, **kwargs)
+
     @staticmethod
     def load_spam_model_to_predict(dill_parameters_file: str) -> TwitterSpamModel.SpamModelLearning:
         """
@@ -334,6 +681,7 @@ class TwitterSpamModelInterface(TwitterModelInterface):
         with open(dill_parameters_file, 'rb') as dpf:
             parameters = dill.load(dpf)
 
+        ModelBase.ModelLearning.init_distribution_devices(parameters)
         data = TwitterSpamModel.SpamModelData(parameters)
         model = TwitterSpamModel.SpamModelLearning(parameters, data)
         model.build_model()
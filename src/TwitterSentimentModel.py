@@ -1,39 +1,60 @@
 import pandas as pd
-import tensorflow as tf
+import numpy as np
 import os
+import time
+import json
+import hashlib
+import dataclasses
 from typing import List
 from NLPSentimentCalculations import NLPSentimentCalculations as nSC
 from ModelBase import ModelParameters, ModelData, ModelLearning
-from contextlib import ExitStack
+from utilities import Utils, LazyModule
+
+
+tf = LazyModule('tensorflow')
 
 
 class SentimentModelData(ModelData):
 
+    label_column = 'SentimentManualLabel'
+
     def __init__(self, parameters: ModelParameters):
 
         super().__init__(parameters)
 
-        if self.parameters.preload_train_data_dill:
+        if self.parameters.preload_train_data_arrays:
+            self.load_data_from_arrays()
+        elif self.parameters.preload_train_data_dill:
             self.load_data_from_dill()
+
+        # Stream train data from sharded files
+        elif self.parameters.train_data_shards:
+            self.load_data_from_shards()
+
+        # Fine tune a saved model on newly labeled tweets
+        elif self.parameters.update_data_csv:
+            self.load_data_for_update()
         else:
-            self.load_data_from_csv()
+            self.load_data_from_cache_or_csv()
 
             if self.parameters.save_train_data_dill:
                 self.save_data_to_dill()
 
-    def get_x_val_from_dataframe(self, x_val: pd.DataFrame) -> List[str]:
+    def assemble_x_val(self, x_val: pd.DataFrame, val_text_input, val_embedding_mask) -> List[str]:
         """
-        Create an x_validation dataset from a dataframe, in a format ready to pass into model.predict
+        Puts vectorized text in a format ready to pass into model.predict
 
         :param x_val: Dataframe of tweets with self.features_to_train columns present
         :type x_val: pd.DataFrame
+        :param val_text_input: Vectorized text of each tweet in x_val
+        :type val_text_input: tf.Tensor
+        :param val_embedding_mask: Transformer attention mask, or the GloVe embedding matrix
+        :type val_embedding_mask: tf.Tensor
 
         :return: Data ready to be passed into the model for prediction
         :rtype: x_val_text_embeddings
         """
 
-        val_text_input, val_embedding_mask = self.get_vectorized_text_tokens_from_val_dataframe(x_val)
-
         if self.parameters.use_transformers:
 
             val_text_input = {'input_ids': val_text_input, 'attention_mask': val_embedding_mask}
@@ -83,12 +104,179 @@ class SentimentModelData(ModelData):
             self.y_train, self.y_test = self.get_dataset_from_tweet_type(twitter_df)
 
 
+class DistilledSentimentModelData(SentimentModelData):
+    """Data of a student model trained on the soft labels of a teacher sentiment model, see
+    SentimentModelLearning.distill_student. Without texts, only the saved tokenizer is loaded, for prediction.
+    """
+
+    def __init__(self, parameters: ModelParameters, texts: pd.Series = None, soft_labels: np.ndarray = None):
+
+        ModelData.__init__(self, parameters)
+
+        self.test_rows = np.zeros(0, dtype=int)
+
+        if texts is not None:
+            self.load_data_from_soft_labels(texts, soft_labels)
+
+    def load_data_from_soft_labels(self, texts: pd.Series, soft_labels: np.ndarray):
+        """
+        Splits texts into a train and a held out test set, fits the Keras tokenizer and GloVe embedding matrix on the
+        train texts, and uses the teacher soft labels as targets. Held out rows are kept in self.test_rows.
+
+        :param texts: Raw tweet texts
+        :type texts: pd.Series
+        :param soft_labels: Teacher probabilities of each label for each text
+        :type soft_labels: np.array(np.array(float))
+        """
+
+        order = np.random.RandomState(0).permutation(len(texts))
+        test_count = int(len(texts) * self.parameters.test_size)
+        self.test_rows, train_rows = order[:test_count], order[test_count:]
+
+        self.train_text_input_ids, self.test_text_input_ids, self.train_embedding_mask, self.test_embedding_mask = \
+            self.get_vectorized_text_tokens_from_dataframes(texts.iloc[train_rows], texts.iloc[self.test_rows])
+
+        self.y_train = soft_labels[train_rows]
+        self.y_test = soft_labels[self.test_rows]
+
+
 class SentimentModelLearning(ModelLearning):
 
     def __init__(self, model_params: ModelParameters, model_data: SentimentModelData):
 
         super().__init__(model_params=model_params, model_data=model_data)
 
+        self.student = None
+        self.distillation_report = {}
+
+    def raw_predict_tweets(self, tweet_df: pd.DataFrame):
+        """
+        Predict on model from a dataframe of tweets, see ModelLearning.raw_predict_tweets. Uses the distilled student
+        model instead if there is one and parameters.predict_with_student is set.
+
+        :param tweet_df: Dataframe of tweets.
+        :type tweet_df: pd.Dataframe
+
+        :return: Softmax probabilities for each label of each tweet
+        :rtype: np.array(np.array(float))
+        """
+
+        if self.student is not None and self.parameters.predict_with_student:
+            return self.student.raw_predict_tweets(tweet_df)
+
+        return super().raw_predict_tweets(tweet_df)
+
+    def get_teacher_soft_labels(self, tweet_df: pd.DataFrame) -> np.ndarray:
+        """
+        Labels tweets with the probabilities predicted by this model, in chunks of parameters.distill_chunk_size.
+        Each chunk is cached in parameters.distill_label_dir under a hash of the model file's size, mtime, and contents
+        and of the chunk's texts, so interrupted or extended labeling runs only predict on new chunks and a teacher
+        retrained to the same path labels again.
+
+        :param tweet_df: Dataframe of tweets with a full_text column
+        :type tweet_df: pd.DataFrame
+
+        :return: Probabilities of each label for each tweet
+        :rtype: np.array(np.array(float))
+        """
+
+        label_dir = self.parameters.distill_label_dir
+        if label_dir and not os.path.exists(label_dir):
+            os.makedirs(label_dir)
+
+        # Falls back to the path for a teacher that was not saved
+        teacher_key = json.dumps(ModelData.get_file_fingerprint(self.parameters.model_h5) or self.parameters.model_h5,
+                                 sort_keys=True)
+
+        chunk_size = max(self.parameters.distill_chunk_size, 1)
+        chunks = []
+        for start in range(0, len(tweet_df), chunk_size):
+
+            chunk = tweet_df.iloc[start:start + chunk_size]
+
+            key = hashlib.sha1(teacher_key.encode('utf-8'))
+            key.update('\n'.join(chunk['full_text'].astype(str)).encode('utf-8'))
+            label_file = os.path.join(label_dir, f'{key.hexdigest()}.npy') if label_dir else ''
+
+            if label_file and os.path.exists(label_file):
+                chunks.append(np.load(label_file))
+                continue
+
+            soft_labels = np.asarray(ModelLearning.raw_predict_tweets(self, chunk), dtype='float32')
+            if label_file:
+                with open(f'{label_file}.tmp', 'wb') as f:
+                    np.save(f, soft_labels)
+                os.replace(f'{label_file}.tmp', label_file)
+
+            chunks.append(soft_labels)
+            print(f'Labeled {start + len(chunk)} of {len(tweet_df)} tweets with the teacher model')
+
+        return np.concatenate(chunks)
+
+    def distill_student(self, tweet_df: pd.DataFrame, benchmark_size=1000):
+        """
+        Distills this model (the teacher, usually RoBERTa) into a GloVe LSTM or CNN student that is cheap to run on
+        CPU. The teacher labels a large, possibly unlabeled, corpus with its soft probabilities, see
+        get_teacher_soft_labels, and the student from create_sentiment_text_model is trained to match them. The
+        student is set as self.student, so predictions can use it with parameters.predict_with_student.
+
+        Agreement with the teacher and the throughput of both models on held out tweets are kept in
+        self.distillation_report.
+
+        :param tweet_df: Dataframe of tweets to distill on, labels are not needed
+        :type tweet_df: pd.DataFrame
+        :param benchmark_size: Maximum number of held out tweets to compare throughput on
+        :type benchmark_size: int
+
+        :return: The trained student
+        :rtype: SentimentModelLearning
+        """
+
+        if 'full_text' not in tweet_df.columns:
+            tweet_df = Utils.parse_json_tweet_data(tweet_df.copy(), ['full_text'])
+        tweet_df = tweet_df.reset_index(drop=True)
+
+        soft_labels = self.get_teacher_soft_labels(tweet_df)
+
+        student_parameters = dataclasses.replace(self.parameters, use_transformers=False,
+                                                 use_cnn=self.parameters.distill_student_cnn, encoder_features='',
+                                                 inference_bucket_boundaries=None, train_bucket_boundaries=None,
+                                                 custom_tokenizer=None, load_to_predict=False, evaluate_model=True,
+                                                 model_h5=self.parameters.distill_student_h5,
+                                                 training_checkpoint_dir='', predict_with_student=False,
+                                                 sanitizer_version='')
+
+        student_data = DistilledSentimentModelData(student_parameters, tweet_df['full_text'], soft_labels)
+        self.student = SentimentModelLearning(student_parameters, student_data)
+        self.student.build_model()
+
+        # Agreement on held out tweets, which the student was not trained on
+        teacher_labels = student_data.y_test
+        student_labels = self.student.model.predict(student_data.test_text_input_ids)
+
+        # Throughput includes sanitizing and tokenizing, like predicting in production
+        benchmark_df = tweet_df.iloc[student_data.test_rows[:benchmark_size]]
+
+        start = time.perf_counter()
+        ModelLearning.raw_predict_tweets(self, benchmark_df)
+        teacher_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.student.raw_predict_tweets(benchmark_df)
+        student_time = time.perf_counter() - start
+
+        self.distillation_report = {
+            'Held Out Tweets': len(teacher_labels),
+            'Label Agreement': float(np.mean(np.argmax(student_labels, axis=1) == np.argmax(teacher_labels, axis=1))),
+            'Mean Probability Difference': float(np.mean(np.abs(student_labels[:, -1] - teacher_labels[:, -1]))),
+            'Teacher Tweets/sec': len(benchmark_df) / max(teacher_time, 1e-9),
+            'Student Tweets/sec': len(benchmark_df) / max(student_time, 1e-9),
+            'Speedup': teacher_time / max(student_time, 1e-9)}
+
+        print(pd.DataFrame(self.distillation_report, index=[0]).to_string(index=False))
+
+        return self.student
+
     def build_model(self):
         """
         Builds (trains) the model
@@ -104,38 +292,35 @@ class SentimentModelLearning(ModelLearning):
             self.load_compile_validate_model()
             return
 
-        # Conditional context management for TPU
-        with ExitStack() as stack:
+        # Only train a head over precomputed features of the frozen transformer
+        if self.parameters.use_transformers and self.parameters.encoder_features:
+            self.build_frozen_encoder_model(self.get_callbacks(checkpoint_h5=False))
+            return
 
-            if self.parameters.use_tpu:
-                stack.enter_context(self.tpu_strategy.scope())
+        # Build under the distribution strategy, if any, so variables are placed on every replica
+        with self.get_distribution_scope():
 
             self.model = self.data.nsc.create_sentiment_text_model(self.data.train_text_input_ids,
                                                                    self.data.train_embedding_mask,
                                                                    self.data.y_train.shape,
                                                                    self.parameters.use_transformers,
-                                                                   len(self.data.train_text_input_ids[0]))
+                                                                   None if self.parameters.train_bucket_boundaries
+                                                                   else self.data.text_input_length,
+                                                                   dropout_rate=self.parameters.dropout_rate,
+                                                                   use_cnn=self.parameters.use_cnn)
 
             self.compile_model()
 
         cbs = self.get_callbacks()
 
-        if self.parameters.use_transformers:
-            train_text_data = {'input_ids': self.data.train_text_input_ids,
-                               'attention_mask': self.data.train_embedding_mask}
-            test_text_data = {'input_ids': self.data.test_text_input_ids,
-                              'attention_mask': self.data.test_embedding_mask}
-        else:
-            train_text_data = self.data.train_text_input_ids
-            test_text_data = self.data.test_text_input_ids
+        train_text_data, train_labels, test_text_data, test_labels, batch_size = self.get_fit_inputs()
 
-        history = self.model.fit(x=train_text_data, y=self.data.y_train,
-                                 batch_size=self.parameters.batch_size,
-                                 epochs=self.parameters.epochs, verbose=1, callbacks=cbs)
+        history = self.fit_model(train_text_data, train_labels, batch_size, cbs,
+                                 self.get_validation_inputs(test_text_data, test_labels))
 
         nSC.plot_model_history(history)
 
         if self.parameters.evaluate_model:
-            self.score = self.evaluate_model(test_text_data, self.data.y_test, [])
+            self.score = self.evaluate_model(test_text_data, test_labels, [])
 
         return
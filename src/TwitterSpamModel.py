@@ -1,13 +1,17 @@
 import pandas as pd
-import tensorflow as tf
 import os
 from NLPSentimentCalculations import NLPSentimentCalculations as nSC
 from ModelBase import ModelParameters, ModelData, ModelLearning
-from contextlib import ExitStack
+from utilities import LazyModule
+
+
+tf = LazyModule('tensorflow')
 
 
 class SpamModelData(ModelData):
 
+    label_column = 'Label'
+
     def __init__(self, parameters: ModelParameters):
 
         super().__init__(parameters)
@@ -17,31 +21,43 @@ class SpamModelData(ModelData):
 
         self.parameters.textless_features_to_train = [x for x in self.parameters.features_to_train if x != 'full_text']
 
-        # Preload train data from a dill
-        if self.parameters.preload_train_data_dill:
+        # Preload train data from memory-mapped arrays or a dill
+        if self.parameters.preload_train_data_arrays:
+            self.load_data_from_arrays()
+        elif self.parameters.preload_train_data_dill:
             self.load_data_from_dill()
 
-        # Load data normally (from CSVs)
+        # Stream train data from sharded files
+        elif self.parameters.train_data_shards:
+            self.load_data_from_shards()
+
+        # Fine tune a saved model on newly labeled tweets
+        elif self.parameters.update_data_csv:
+            self.load_data_for_update()
+
+        # Load data normally (from CSVs, or the cache of their preprocessed data)
         else:
-            self.load_data_from_csv()
+            self.load_data_from_cache_or_csv()
 
             # Save train data to a dill for preloading next time
             if self.parameters.save_train_data_dill:
                 self.save_data_to_dill()
 
-    def get_x_val_from_dataframe(self, x_val: pd.DataFrame):
+    def assemble_x_val(self, x_val: pd.DataFrame, val_text_input, val_embedding_mask):
         """
-        Create an x_validation dataset from a dataframe, in a format ready to pass into model.predict
+        Combines vectorized text and the meta features of x_val in a format ready to pass into model.predict
 
         :param x_val: Dataframe of tweets with self.features_to_train columns present
         :type x_val: pd.DataFrame
+        :param val_text_input: Vectorized text of each tweet in x_val
+        :type val_text_input: tf.Tensor
+        :param val_embedding_mask: Transformer attention mask, or the GloVe embedding matrix
+        :type val_embedding_mask: tf.Tensor
 
         :return: Data ready to be passed into the model for prediction
         :rtype: [x_val_text_embeddings, x_val_meta] or [x_val_text_embeddings]
         """
 
-        val_text_input, val_embedding_mask = self.get_vectorized_text_tokens_from_val_dataframe(x_val)
-
         if self.parameters.use_transformers:
             val_text_input = {'input_ids': val_text_input, 'attention_mask': val_embedding_mask}
 
@@ -125,51 +141,36 @@ class SpamModelLearning(ModelLearning):
             self.load_compile_validate_model()
             return
 
-        # Conditional context management for TPU
-        with ExitStack() as stack:
+        # Only train a head over precomputed features of the frozen transformer
+        if self.parameters.use_transformers and self.parameters.encoder_features:
+            self.build_frozen_encoder_model(self.get_callbacks(checkpoint_h5=False))
+            return
 
-            if self.parameters.use_tpu:
-                self.init_tpu()
-                stack.enter_context(self.tpu_strategy.scope())
+        # Build under the distribution strategy, if any, so variables are placed on every replica
+        with self.get_distribution_scope():
 
             self.model = self.data.nsc.create_spam_text_meta_model(self.data.train_text_input_ids,
                                                                    self.data.train_embedding_mask,
                                                                    len(self.data.x_train_meta.columns),
                                                                    self.data.y_train.shape,
                                                                    self.parameters.use_transformers,
-                                                                   len(self.data.train_text_input_ids[0]))
+                                                                   None if self.parameters.train_bucket_boundaries
+                                                                   else self.data.text_input_length,
+                                                                   dropout_rate=self.parameters.dropout_rate,
+                                                                   use_cnn=self.parameters.use_cnn)
 
             self.compile_model()
 
         cbs = self.get_callbacks()
 
-        if self.parameters.use_transformers:
-            train_text_data = {'input_ids': self.data.train_text_input_ids,
-                               'attention_mask': self.data.train_embedding_mask}
-            test_text_data = {'input_ids': self.data.test_text_input_ids,
-                              'attention_mask': self.data.test_embedding_mask}
-        else:
-            train_text_data = self.data.train_text_input_ids
-            test_text_data = self.data.test_text_input_ids
-
-        # Change input layer based on what style of features we are using
-        if len(self.data.x_train_meta.columns) < 1:
-
-            # Using only text features
-            train_input_layer = train_text_data
-            test_input_layer = test_text_data
-        else:
-
-            # Using text and meta features
-            train_input_layer = [train_text_data, self.data.x_train_meta]
-            test_input_layer = [test_text_data, self.data.x_test_meta]
+        train_input_layer, train_labels, test_input_layer, test_labels, batch_size = self.get_fit_inputs()
 
-        history = self.model.fit(x=train_input_layer, y=self.data.y_train, batch_size=self.parameters.batch_size,
-                                 epochs=self.parameters.epochs, verbose=1, callbacks=cbs)
+        history = self.fit_model(train_input_layer, train_labels, batch_size, cbs,
+                                 self.get_validation_inputs(test_input_layer, test_labels))
 
         nSC.plot_model_history(history)
 
         if self.parameters.evaluate_model:
-            self.parameters.score = self.evaluate_model(test_input_layer, self.data.y_test, [])
+            self.score = self.evaluate_model(test_input_layer, test_labels, [])
 
         return
@@ -1,4 +1,5 @@
 import datetime
+import numpy as np
 import pandas as pd
 from pandas.tseries.holiday import USFederalHolidayCalendar
 from pandas.tseries.holiday import GoodFriday
@@ -7,15 +8,13 @@ import random
 import requests
 from os import path, walk, makedirs
 import fnmatch
-from pydrive.drive import GoogleDrive
-from pydrive.auth import GoogleAuth
 from io import StringIO
 import csv
 import re
 import itertools
 import ast
-import matplotlib.pyplot as plt
 import math
+import importlib
 
 
 """utilities
@@ -28,6 +27,36 @@ Date: April 22, 2021
 """
 
 
+class LazyModule:
+
+    """Stand-in for a module that is only imported the first time one of its attributes is used. Keeps heavy
+    libraries such as tensorflow and matplotlib out of the import time of modules that only need them for a few calls.
+    """
+
+    def __init__(self, name):
+
+        """Constructor method, records the module to import later.
+
+        :param name: Full name of the module, such as matplotlib.pyplot
+        :type name: str
+        """
+
+        self.lazy_module_name = name
+        self.lazy_module = None
+
+    def __getattr__(self, attr):
+
+        if self.lazy_module is None:
+            self.lazy_module = importlib.import_module(self.lazy_module_name)
+
+        return getattr(self.lazy_module, attr)
+
+
+plt = LazyModule('matplotlib.pyplot')
+pydrive_drive = LazyModule('pydrive.drive')
+pydrive_auth = LazyModule('pydrive.auth')
+
+
 class Utils:
 
     # Define business day
@@ -42,8 +71,8 @@ class Utils:
         if not filepaths:
             return
 
-        GoogleAuth.DEFAULT_SETTINGS['client_config_file'] = '../doc/client_secrets.json'
-        gauth = GoogleAuth()
+        pydrive_auth.GoogleAuth.DEFAULT_SETTINGS['client_config_file'] = '../doc/client_secrets.json'
+        gauth = pydrive_auth.GoogleAuth()
 
         # Try to load saved client credentials
         gauth.LoadCredentialsFile('../doc/gdrive_creds.txt')
@@ -60,7 +89,7 @@ class Utils:
         # Save the current credentials to a file
         gauth.SaveCredentialsFile('../doc/gdrive_creds.txt')
 
-        drive = GoogleDrive(gauth)
+        drive = pydrive_drive.GoogleDrive(gauth)
 
         # WARNING: This assumes that the file list does not change during the for loop!
         # Only an issue for first level directories
@@ -427,6 +456,50 @@ class Utils:
         """
         return list(itertools.chain.from_iterable(lst))
 
+    @staticmethod
+    def collapse_duplicates(values):
+        """
+        Collapses a list into its unique values, in order of first appearance. Values must be hashable.
+
+        :param values: list of values to collapse
+        :type values: list
+
+        :return: unique values, and for each original value the index of its unique value
+        :rtype: tuple(list, list(int))
+        """
+        unique_indices = {}
+        inverse = [unique_indices.setdefault(v, len(unique_indices)) for v in values]
+        return list(unique_indices), inverse
+
+    @staticmethod
+    def collapse_duplicate_rows(df, columns):
+        """
+        Collapses a dataframe to the rows that are unique over the given columns, in order of first appearance.
+        Missing values compare equal to each other.
+
+        :param df: dataframe to collapse
+        :type df: pandas.DataFrame
+
+        :param columns: list of column names that identify duplicate rows
+        :type columns: list(str)
+
+        :return: dataframe of unique rows, and for each original row the position of its unique row
+        :rtype: tuple(pandas.DataFrame, array-like(int))
+        """
+        if not columns or df.empty:
+            return df, list(range(len(df)))
+
+        # Group numbering is not relied on to follow row order, older pandas numbers missing value groups last
+        group_ids = df.groupby(columns, sort=False, dropna=False).ngroup().to_numpy()
+        _, first, inverse = np.unique(group_ids, return_index=True, return_inverse=True)
+
+        # Renumber the unique rows in order of first appearance
+        order = np.argsort(first)
+        rank = np.empty(len(order), dtype=int)
+        rank[order] = np.arange(len(order))
+
+        return df.iloc[first[order]], rank[inverse.reshape(-1)]
+
     @staticmethod
     def strings_to_dicts(strings):
         """
@@ -601,6 +674,31 @@ class Utils:
 
         return full_path
 
+    @staticmethod
+    def get_next_version_path(filepath):
+
+        """Gets the path of the next version of a file, with .v2, .v3, ... inserted before the extension. The version of
+        an already versioned path is incremented. Versions that already exist are skipped.
+
+        :param filepath: Path of the current version of the file
+        :type filepath: str
+
+        :return: Path of the first version after filepath that does not exist
+        :rtype: str
+        """
+
+        base, ext = path.splitext(filepath)
+
+        version = 2
+        match = re.match(r'^(.*)\.v(\d+)$', base)
+        if match:
+            base, version = match.group(1), int(match.group(2)) + 1
+
+        while path.exists(f'{base}.v{version}{ext}'):
+            version += 1
+
+        return f'{base}.v{version}{ext}'
+
     @staticmethod
     def get_tickers_from_csv(filename):
 
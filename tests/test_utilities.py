@@ -0,0 +1,41 @@
+import os
+import sys
+import unittest
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from utilities import Utils
+
+
+class CollapseDuplicateRowsTest(unittest.TestCase):
+
+    def test_predictions_scatter_back_in_row_order(self):
+
+        df = pd.DataFrame({'full_text': ['a', np.nan, 'b', 'a', np.nan, 'c', 'b'],
+                           'followers_count': [1, 2, np.nan, 1, 2, 3, np.nan]})
+
+        unique_df, inverse = Utils.collapse_duplicate_rows(df, ['full_text', 'followers_count'])
+
+        self.assertEqual(list(unique_df.index), [0, 1, 2, 5])
+
+        # Predict something that identifies each unique row, then scatter it back like raw_predict_tweets
+        predictions = np.asarray([f'{text}|{count}' for text, count in zip(unique_df['full_text'],
+                                                                            unique_df['followers_count'])])
+        expected = [f'{text}|{count}' for text, count in zip(df['full_text'], df['followers_count'])]
+
+        self.assertEqual(list(predictions[inverse]), expected)
+
+    def test_no_columns_keeps_every_row(self):
+
+        df = pd.DataFrame({'full_text': ['a', 'a']})
+
+        unique_df, inverse = Utils.collapse_duplicate_rows(df, [])
+
+        self.assertEqual(len(unique_df), 2)
+        self.assertEqual(list(inverse), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()